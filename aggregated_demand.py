@@ -0,0 +1,136 @@
+import math
+
+import numpy as np
+
+
+class AggregatedDemand():
+    '''
+    passengers kept as counts rather than one Passenger per rider, so demand can be scaled up
+    without creating millions of objects. riders are identified only by (route, origin stop,
+    destination stop), as every rider in the same group behaves the same way.
+
+    trips only run between a route's required stops, so each route indexes just the stops its
+    riders start or end at. waiting[route][origin, destination] is the number of riders still
+    at their origin, by those route indices. each bus has an array of riders on board by
+    destination and, for the bus's walk, the stop riders for each destination get off at: the
+    destination if the walk visits it, otherwise the closest stop it does visit (the
+    non-preffered stop). boarding takes riders in the order Network.init_passengers would have
+    queued Passengers at the stop, so the stats are the same as for Passenger objects
+    '''
+
+    def __init__(self, network, passenger_numbers, demand_multiplier=1.0):
+        self.stops = list(network.stops_by_id.values())
+        self.stop_index = {stop.id: i for i, stop in enumerate(self.stops)}
+        self.route_index = {route_num: i for i, route_num in enumerate(network.routes_by_num.keys())}
+        #for each route, its riders' stops, the route index of each stop by id and the
+        #index into self.stops of each route index
+        self.route_stops = []
+        self.route_stop_index = []
+        self.route_stop_indices = []
+        for route_num in network.routes_by_num.keys():
+            stop_ids = set(stop.id for stop in network.routes_by_num[route_num].required_stops)
+            for origin_stop_id in passenger_numbers.get(route_num, dict()).keys():
+                stop_ids.add(origin_stop_id)
+                stop_ids.update(passenger_numbers[route_num][origin_stop_id].keys())
+            stop_ids = sorted(stop_ids)
+            self.route_stops.append([network.stops_by_id[stop_id] for stop_id in stop_ids])
+            self.route_stop_index.append({stop_id: i for i, stop_id in enumerate(stop_ids)})
+            self.route_stop_indices.append(np.array([self.stop_index[stop_id] for stop_id in stop_ids], dtype=np.int64))
+        self.waiting = [np.zeros((len(stops), len(stops)), dtype=np.int64) for stops in self.route_stops]
+        #destinations of the riders waiting for each (route, origin) in the order they board
+        self.boarding_order = dict()
+        for route_num in passenger_numbers.keys():
+            route_i = self.route_index[route_num]
+            route_stop_index = self.route_stop_index[route_i]
+            for origin_stop_id in passenger_numbers[route_num].keys():
+                origin_i = route_stop_index[origin_stop_id]
+                order = self.boarding_order.setdefault((route_i, origin_i), [])
+                for dest_stop_id in passenger_numbers[route_num][origin_stop_id].keys():
+                    dest_i = route_stop_index[dest_stop_id]
+                    self.waiting[route_i][origin_i, dest_i] += math.ceil(passenger_numbers[route_num][origin_stop_id][dest_stop_id] * demand_multiplier)
+                    if (not (dest_i in order)):
+                        order.append(dest_i)
+        self.boarding_order = {key: np.array(order, dtype=np.int64) for key, order in self.boarding_order.items()}
+
+        self.total = int(sum(waiting.sum() for waiting in self.waiting))
+        self.arrived = 0
+        self.arrived_non_preffered = 0
+        #sum of the seconds drive from each non-preffered stop to the preffered one
+        self.non_preffered_distance = 0
+        #bus -> [riders on board by destination's route index, index into self.stops of the
+        #stop they get off at (-1 until worked out), seconds drive to the destination from
+        #there, number on board]
+        self.buses = dict()
+
+    def get_bus_state(self, bus):
+        if (not (bus in self.buses)):
+            num_stops = len(self.route_stops[self.route_index[bus.route.route_num]])
+            self.buses[bus] = [np.zeros(num_stops, dtype=np.int64), np.full(num_stops, -1, dtype=np.int64),
+                np.zeros(num_stops, dtype=np.int64), 0]
+        return self.buses[bus]
+
+    def visit_stop(self, controller, bus, stop):
+        '''
+        riders on the bus for this stop get off, then riders waiting for the bus's route get on
+        until it is full
+        '''
+        state = self.get_bus_state(bus)
+        onboard, alight_index, detours = state[0], state[1], state[2]
+        route_i = self.route_index[bus.route.route_num]
+        stop_i = self.stop_index[stop.id]
+
+        #get off
+        if (state[3] > 0):
+            alighting = np.nonzero((alight_index == stop_i) & (onboard > 0))[0]
+            if (len(alighting) > 0):
+                alighting_counts = onboard[alighting]
+                num_alighting = int(alighting_counts.sum())
+                self.arrived += num_alighting
+                non_preffered = self.route_stop_indices[route_i][alighting] != stop_i
+                self.arrived_non_preffered += int(alighting_counts[non_preffered].sum())
+                self.non_preffered_distance += int((alighting_counts * detours[alighting]).sum())
+                onboard[alighting] = 0
+                state[3] -= num_alighting
+
+        #get on
+        origin_i = self.route_stop_index[route_i].get(stop.id)
+        key = (route_i, origin_i)
+        if (not (key in self.boarding_order)):
+            return
+        space = bus.capacity - state[3]
+        if (space <= 0):
+            return
+        order = self.boarding_order[key]
+        waiting = self.waiting[route_i]
+        waiting_counts = waiting[origin_i, order]
+        #riders ahead of each group in the queue use up the space first
+        ahead = np.cumsum(waiting_counts) - waiting_counts
+        boarding_counts = np.clip(space - ahead, 0, waiting_counts)
+        if (boarding_counts.sum() == 0):
+            return
+        waiting[origin_i, order] -= boarding_counts
+        onboard[order] += boarding_counts
+        state[3] += int(boarding_counts.sum())
+        for dest_i in order[boarding_counts > 0]:
+            if (alight_index[dest_i] == -1):
+                self.set_alight_stop(controller, bus, state, route_i, dest_i)
+
+    def set_alight_stop(self, controller, bus, state, route_i, dest_i):
+        '''
+        work out where riders for the given destination (by route index) get off the bus
+        '''
+        dest_stop = self.route_stops[route_i][dest_i]
+        if (dest_stop in bus.stops_visited_on_walk):
+            state[1][dest_i] = self.stop_index[dest_stop.id]
+            return
+        best_stop = bus.get_fallback_stop(controller, dest_stop)
+        state[1][dest_i] = self.stop_index[best_stop.id]
+        state[2][dest_i] = controller.shortest_paths[best_stop][dest_stop]
+
+    def get_stats(self):
+        '''
+        return (total, stranded, non-preffered, total non-preffered distance) as in
+        NetworkController.get_stats
+        '''
+        stranded = self.total - self.arrived
+        return self.total, stranded, self.arrived_non_preffered, self.non_preffered_distance
@@ -0,0 +1,518 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import statistics
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from time import perf_counter
+
+#networks are named st_lucia for the data in data/, or generated_<stops>_<routes>_<stops per route>
+#for one written by generate_network.py
+ST_LUCIA = 'st_lucia'
+MODES = ['plain', 'disaster_resistant']
+#engines checked against the tick engine, see run_engine
+ENGINES = ['event_driven', 'fleet', 'aggregate_demand']
+#the tick engine with the original shortest paths and walk search (see tests/reference_controller.py),
+#which every network is checked against in a process of its own, see check_reference
+REFERENCE = 'reference'
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+#generated networks benchmarked if none are given. every optimised search finishes on the first,
+#and the original search on the second as well
+DEFAULT_GENERATED = ['300:4:6', '40:2:4']
+#walk search heuristics whose nodes expanded are compared, the default then the one it replaced,
+#and the limit on the search they are both run with
+HEURISTICS = ['furthest_stop', 'interchange']
+HEURISTIC_MAX_STATE_NODES = 8
+#limit on the search when checking the reroute schedule against the controller
+SCHEDULE_MAX_STATE_NODES = 8
+#network written by write_search_limit_network, checked by check_search_limit rather than timed
+SEARCH_LIMIT = 'search_limit'
+
+
+def time_call(function, repeats):
+    '''
+    call function repeats times, returning the min and median seconds it took and its last result
+    '''
+    seconds = []
+    for i in range(repeats):
+        start = perf_counter()
+        result = function()
+        seconds.append(perf_counter() - start)
+    return {'min': min(seconds), 'median': statistics.median(seconds), 'repeats': repeats}, result
+
+
+def get_walk_ids(walk):
+    '''
+    return a walk as a list of [stop_1 id, stop_2 id], or None
+    '''
+    if (walk is None):
+        return None
+    return [[connection.stop_1.id, connection.stop_2.id] for connection in walk]
+
+
+def run_engine(network, disaster_resistant, seconds_per_tick, engine='tick', flood_model=None):
+    '''
+    build a controller for the network and simulate it to completion with the given engine,
+    returning the passenger stats and each route's final walk. engine is 'tick' (updating every
+    bus each tick), one of ENGINES or REFERENCE. the flood is the controller's default unless
+    flood_model is given
+    '''
+    from controller import NetworkController
+    from event_engine import EventEngine
+    from fleet_engine import FleetEngine
+
+    network.aggregate_demand = (engine == 'aggregate_demand')
+    network.reset_simulation()
+    if (engine == REFERENCE):
+        #kept with the tests rather than the code it checks
+        if (not (REFERENCE_DIR in sys.path)):
+            sys.path.append(REFERENCE_DIR)
+        from reference_controller import ReferenceController
+        controller = ReferenceController(network, disaster_resistant=disaster_resistant, seconds_per_tick=seconds_per_tick,
+            flood_model=flood_model)
+    else:
+        controller = NetworkController(network, disaster_resistant=disaster_resistant, seconds_per_tick=seconds_per_tick,
+            flood_model=flood_model)
+    if (engine == 'event_driven'):
+        EventEngine(controller).run()
+    elif (engine == 'fleet'):
+        FleetEngine(controller).run()
+    else:
+        while (not controller.is_complete(print_stats=False)):
+            controller.update()
+    results = controller.get_stats()
+    results['walks'] = {str(route.route_num): get_walk_ids(walk) for route, walk in controller.prev_optimal_walks.items()}
+    return results
+
+
+def benchmark_network(directory, disaster_resistant, options, result_queue, phases=None):
+    '''
+    time each phase for the network whose data/ is in directory, and check the other engines
+    give the same walks and stats as the tick engine. run in a process of its own, as the data
+    files are found relative to the working directory and elevations are loaded once per process.
+    phases is the function running them, run_phases if not given.
+
+    each result is put on result_queue as (section, key, value) as soon as it is known, so the
+    results so far are kept if a later phase never finishes. the searches at each water level
+    can take far longer than the rest on large networks, so they are run last
+    '''
+    try:
+        os.chdir(directory)
+        devnull = open(os.devnull, 'w')
+        if (phases is None):
+            phases = run_phases
+        with redirect_stdout(devnull):
+            phases(disaster_resistant, options, lambda section, key, value: result_queue.put((section, key, value)))
+        devnull.close()
+    except Exception:
+        import traceback
+        result_queue.put(('error', None, traceback.format_exc()))
+    result_queue.put(('done', None, None))
+
+
+def run_phases(disaster_resistant, options, report):
+    '''
+    run each phase of benchmark_network, passing its results to report
+    '''
+    from transport_graph import Network
+    from controller import NetworkController
+    from shortest_paths import INF
+    from walk_cache import WalkCache
+    from reroute_schedule import build_reroute_schedule
+
+    repeats = options['repeats']
+    seconds, network = time_call(lambda: Network(disaster_resistant=disaster_resistant), repeats)
+    report('timings', 'network', seconds)
+    controller = NetworkController(network, disaster_resistant=disaster_resistant,
+        seconds_per_tick=options['seconds_per_tick'])
+    seconds, shortest_paths = time_call(lambda: controller.init_shortest_paths(False), repeats)
+    report('timings', 'shortest_paths', seconds)
+    if (options['all_pairs']):
+        seconds, all_pairs_shortest_paths = time_call(lambda: controller.init_shortest_paths(True), repeats)
+        report('timings', 'all_pairs_shortest_paths', seconds)
+
+    def init_walks():
+        #from cold, without the walks or heuristics found last time
+        controller.init_search_indices()
+        controller.cached_optimal_walks = WalkCache(network)
+        controller.init_walks()
+        return {str(route.route_num): get_walk_ids(walk) for route, walk in controller.prev_optimal_walks.items()}
+    seconds, initial_walks = time_call(init_walks, repeats)
+    report('timings', 'init_walks', seconds)
+    report('initial_walks', None, initial_walks)
+    if (options['all_pairs']):
+        #walks are searched with every shortest path worked out up front rather than lazily
+        controller.shortest_paths = all_pairs_shortest_paths
+        report('checks', 'all_pairs_shortest_paths', init_walks() == initial_walks)
+        controller.shortest_paths = shortest_paths
+
+    seconds, results = time_call(lambda: run_engine(network, disaster_resistant, options['seconds_per_tick']), repeats)
+    report('timings', 'end_to_end', seconds)
+    report('results', None, results)
+    for engine in ENGINES:
+        seconds, engine_results = time_call(lambda: run_engine(network, disaster_resistant,
+            options['seconds_per_tick'], engine), repeats)
+        report('timings', f'end_to_end_{engine}', seconds)
+        report('checks', engine, engine_results == results)
+
+    if (disaster_resistant):
+        #every timetabled departure gets the walk from the schedule that the controller finds for it
+        #live. searching every flood epoch can take too long without a limit on the search, so both
+        #have the same one
+        controller.max_state_nodes = SCHEDULE_MAX_STATE_NODES
+        seconds, schedule = time_call(lambda: build_reroute_schedule(controller), 1)
+        controller.max_state_nodes = None
+        report('timings', 'reroute_schedule', seconds)
+        live_controller = NetworkController(network, disaster_resistant=disaster_resistant, shortest_paths=shortest_paths,
+            max_state_nodes=SCHEDULE_MAX_STATE_NODES)
+        matches = True
+        for departure_time, route_num in sorted((bus.departure_time, bus.route.route_num) for bus in network.buses):
+            route = network.get_route(route_num)
+            found, walk = schedule.get_walk(route, departure_time)
+            matches = matches and found and (walk == live_controller.get_optimal_walk(route, departure_time))
+        report('checks', 'reroute_schedule', matches)
+
+    #a search for each route from the time the water reaches each level
+    for water_level in options['water_levels']:
+        time = controller.flood_model.get_flood_time(water_level)
+        if (time >= INF):
+            continue
+        for route in network.routes:
+            def search():
+                controller.init_search_indices()
+                return controller.optimal_walk_search(route, time, True)
+            seconds, walk = time_call(search, repeats)
+            nodes_expanded = controller.nodes_expanded
+            #the nodes each heuristic expands. the time to indooroopilly alone doesn't finish on
+            #generated networks without a limit on the search, so both are given the same one
+            heuristic_nodes_expanded = dict()
+            controller.max_state_nodes = HEURISTIC_MAX_STATE_NODES
+            for heuristic in HEURISTICS:
+                controller.heuristic = heuristic
+                search()
+                heuristic_nodes_expanded[heuristic] = controller.nodes_expanded
+            controller.heuristic = HEURISTICS[0]
+            controller.max_state_nodes = None
+            report('searches', f'{route.route_num}@{water_level:g}m', {'time': time, 'seconds': seconds,
+                'nodes_expanded': nodes_expanded, 'heuristic_nodes_expanded': heuristic_nodes_expanded,
+                'walk': get_walk_ids(walk)})
+
+
+def check_reference(disaster_resistant, options, report):
+    '''
+    check the tick engine gives the same walks and stats with the original shortest paths and
+    walk search as with the optimised ones. the original search is exponential in the size of
+    the network, so this is run apart from run_phases with a timeout of its own
+    '''
+    from transport_graph import Network
+
+    network = Network(disaster_resistant=disaster_resistant)
+    results = run_engine(network, disaster_resistant, options['seconds_per_tick'])
+    seconds, reference_results = time_call(lambda: run_engine(network, disaster_resistant,
+        options['seconds_per_tick'], REFERENCE), 1)
+    report('timings', f'end_to_end_{REFERENCE}', seconds)
+    report('checks', REFERENCE, reference_results == results)
+
+
+def write_search_limit_network(directory):
+    '''
+    write a network where limiting the walk search to one node per state sets aside the only
+    walk there is. route 600 has to visit stop 100000 (X), which is a minute from chancellors
+    place. going straight there uses the only other way back, through 100001 (Y), after Y
+    floods, so the walk has to go via Y first and back along the direct connection. the direct
+    node reaches X first, so the one via Y is set aside
+    '''
+    from generate_network import write_network, CHANCELLORS_PLACE, INDOOROOPILLY_INTERCHANGE
+
+    hub_1 = CHANCELLORS_PLACE[0]
+    hub_2 = INDOOROOPILLY_INTERCHANGE[0]
+    stops = [[100000, -27.4985, 153.0005], [100001, -27.4965, 153.0005]]
+    connections = [[hub_1, 100000, 60], [hub_1, 100001, 300], [100001, 100000, 300], [hub_1, hub_2, 60]]
+    stop_elevations = {hub_1: 100, hub_2: 100, 100000: 100, 100001: 5}
+    connection_elevations = {(stop_1_id, stop_2_id): 100 for stop_1_id, stop_2_id, seconds in connections}
+    write_network(directory, stops, connections, [(600, [100000])], [(0, 600)], [], stop_elevations, connection_elevations)
+    #the water reaches Y's elevation 330 seconds in
+    out_fd = open(os.path.join(directory, 'data', 'hydrograph.csv'), 'w')
+    out_fd.write('seconds,water_level\n0,0\n300,0\n360,10\n')
+    out_fd.close()
+
+
+def check_search_limit(disaster_resistant, options, report):
+    '''
+    check that limiting the walk search finds the same walk as searching every node, for the
+    network written by write_search_limit_network, by going back to the nodes it set aside
+    '''
+    from transport_graph import Network
+    from controller import NetworkController
+    from flood_model import HydrographFlood
+    from instrumentation import Instrumentation
+    from utils import read_hydrograph_file
+
+    network = Network(disaster_resistant=disaster_resistant)
+    route = network.get_route(600)
+    searches = dict()
+    for max_state_nodes in (None, 1):
+        instrumentation = Instrumentation()
+        controller = NetworkController(network, disaster_resistant=disaster_resistant, max_state_nodes=max_state_nodes,
+            flood_model=HydrographFlood(read_hydrograph_file('data/hydrograph.csv')), instrumentation=instrumentation)
+        walk = controller.optimal_walk_search(route, 0, True)
+        searches[str(max_state_nodes)] = {'walk': get_walk_ids(walk), 'nodes_set_aside': instrumentation.searches[-1]['nodes_set_aside']}
+    report('search_limit', None, searches)
+    #the limited search only finds the walk if it goes back to the node it set aside
+    report('checks', 'search_limit', (searches['None']['walk'] is not None) and
+        (searches['1']['walk'] == searches['None']['walk']) and (searches['1']['nodes_set_aside'] > 0))
+
+
+def run_benchmark(directory, disaster_resistant, options, timeout, phases=None):
+    '''
+    run benchmark_network in a new process and return its results. if it takes more than
+    timeout seconds it is stopped, and the results so far are returned with timed_out set
+    '''
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=benchmark_network, args=(directory, disaster_resistant, options, result_queue, phases))
+    process.start()
+    results = {'timings': dict(), 'checks': dict(), 'searches': dict(), 'timed_out': False}
+    deadline = perf_counter() + timeout
+    while (True):
+        try:
+            section, key, value = result_queue.get(timeout=max(deadline - perf_counter(), 0.001))
+        except queue.Empty:
+            results['timed_out'] = True
+            process.terminate()
+            break
+        if (section == 'done'):
+            break
+        if (key is None):
+            results[section] = value
+        else:
+            results[section][key] = value
+    process.join()
+    return results
+
+
+def parse_network_spec(spec):
+    '''
+    return the generate_network arguments for a spec of the form stops:routes:stops_per_route
+    '''
+    num_stops, num_routes, stops_per_route = [int(word) for word in spec.split(':')]
+    return {'num_stops': num_stops, 'num_routes': num_routes, 'stops_per_route': stops_per_route}
+
+
+def get_fingerprint(value):
+    '''
+    return a short hash of a json value, so walks and stats can be compared without keeping them
+    '''
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def get_fingerprints(results):
+    '''
+    return the baseline kept with the code: the options and, for each network and mode, a
+    fingerprint of the initial walks, the results of a full simulation and each search's walk.
+    timings only hold for the machine they were taken on, so are saved apart from it
+    '''
+    fingerprints = {'options': results['options'], 'networks': dict()}
+    for name, network_results in results['networks'].items():
+        modes = dict()
+        for mode, mode_results in network_results['modes'].items():
+            mode_fingerprints = {key: get_fingerprint(mode_results[key]) for key in ('initial_walks', 'results') if (key in mode_results)}
+            mode_fingerprints['searches'] = {search: get_fingerprint(search_results['walk'])
+                for search, search_results in mode_results['searches'].items()}
+            modes[mode] = mode_fingerprints
+        fingerprints['networks'][name] = {'spec': network_results['spec'], 'modes': modes}
+    return fingerprints
+
+
+def compare_to_baseline(results, baseline, timings_baseline, tolerance):
+    '''
+    return (comparison, mismatches). the comparison gives the ratio of each phase's median time
+    to timings_baseline's for every network and mode in both, and is empty if timings_baseline
+    is None. mismatches lists every walk or stat whose fingerprint differs from the baseline's
+    '''
+    comparison = dict()
+    mismatches = []
+    fingerprints = get_fingerprints(results)
+    for name, network_results in results['networks'].items():
+        #generated networks are only comparable if generated with the same arguments
+        if ((name in baseline['networks']) and (baseline['networks'][name]['spec'] == network_results['spec'])):
+            for mode, mode_fingerprints in fingerprints['networks'][name]['modes'].items():
+                baseline_fingerprints = baseline['networks'][name]['modes'].get(mode)
+                if (baseline_fingerprints is None):
+                    continue
+                #phases that timed out in either are left out
+                for key in ('initial_walks', 'results'):
+                    if ((key in mode_fingerprints) and (key in baseline_fingerprints) and
+                        (mode_fingerprints[key] != baseline_fingerprints[key])):
+                        mismatches.append(f'{name}/{mode}: {key} differ from the baseline')
+                for search, fingerprint in mode_fingerprints['searches'].items():
+                    baseline_fingerprint = baseline_fingerprints['searches'].get(search)
+                    if ((baseline_fingerprint is not None) and (fingerprint != baseline_fingerprint)):
+                        mismatches.append(f'{name}/{mode}: walk for {search} differs from the baseline')
+
+        if ((timings_baseline is None) or (not (name in timings_baseline['networks'])) or
+            (timings_baseline['networks'][name]['spec'] != network_results['spec'])):
+            continue
+        for mode, mode_results in network_results['modes'].items():
+            baseline_results = timings_baseline['networks'][name]['modes'].get(mode)
+            if (baseline_results is None):
+                continue
+            mode_comparison = dict()
+            for phase, seconds in mode_results['timings'].items():
+                if (not (phase in baseline_results['timings'])):
+                    continue
+                ratio = seconds['median'] / baseline_results['timings'][phase]['median']
+                verdict = 'same'
+                if (ratio > 1 + tolerance):
+                    verdict = 'slower'
+                elif (ratio < 1 - tolerance):
+                    verdict = 'faster'
+                mode_comparison[phase] = {'ratio': ratio, 'verdict': verdict}
+            comparison[f'{name}/{mode}'] = mode_comparison
+    return comparison, mismatches
+
+
+def print_summary(results, out_fd):
+    '''
+    print each phase's median time, against the baseline where there is one, and the checks
+    '''
+    for name, network_results in results['networks'].items():
+        for mode, mode_results in network_results['modes'].items():
+            comparison = results.get('comparison', dict()).get(f'{name}/{mode}', dict())
+            print(f'{name}/{mode}:', file=out_fd)
+            for phase, seconds in mode_results['timings'].items():
+                line = f'\t{phase:<32}{seconds["median"]:10.4f}s'
+                if (phase in comparison):
+                    line += f'  {comparison[phase]["ratio"]:6.2f}x baseline ({comparison[phase]["verdict"]})'
+                print(line, file=out_fd)
+            searches = mode_results['searches'].values()
+            if (len(searches) > 0):
+                print(f'\t{len(searches)} searches{sum(search["seconds"]["median"] for search in searches):22.4f}s, '
+                    f'up to {max(search["nodes_expanded"] for search in searches)} nodes expanded', file=out_fd)
+                for heuristic in HEURISTICS:
+                    print(f'\t{heuristic} heuristic expanded {sum(search["heuristic_nodes_expanded"][heuristic] for search in searches)} nodes '
+                        f'with max_state_nodes {HEURISTIC_MAX_STATE_NODES}', file=out_fd)
+            for check, passed in mode_results['checks'].items():
+                print(f'\t{check} check passed: {passed}', file=out_fd)
+            if (mode_results['timed_out']):
+                print('\ttimed out, later phases are missing', file=out_fd)
+            if (mode_results.get('reference_timed_out')):
+                print('\tthe original search timed out, so the walks and stats are unchecked against it', file=out_fd)
+            if ('error' in mode_results):
+                print(f'\tfailed:\n{mode_results["error"]}', file=out_fd)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time network building, shortest paths, walk searches and full simulations, headless')
+    parser.add_argument('--generate', help='also benchmark a generated network of stops:routes:stops_per_route, may be repeated (default ' + ' and '.join(DEFAULT_GENERATED) + ')', action='append', default=None)
+    parser.add_argument('--no_st_lucia', help='skip the network in data/', action='store_true')
+    parser.add_argument('--seed', help='seed for generated networks', type=int, default=0)
+    parser.add_argument('--work_dir', help='directory to generate networks into (a temporary one if not given)', default=None)
+    parser.add_argument('--modes', help='comma separated modes to run each network in', default=','.join(MODES))
+    parser.add_argument('--repeats', help='times each phase is run, the min and median are kept', type=int, default=3)
+    parser.add_argument('--water_levels', help='comma separated water levels to search each route at', default='0,5,10,15')
+    parser.add_argument('--seconds_per_tick', help='simulated seconds per tick', type=int, default=5)
+    parser.add_argument('--no_all_pairs', help="don't time all pairs shortest paths, which is slow for large networks", action='store_true')
+    parser.add_argument('--timeout', help='seconds before giving up on a network in one mode', type=float, default=600)
+    parser.add_argument('--reference_timeout', help='seconds before giving up on checking a network in one mode against the original search', type=float, default=120)
+    parser.add_argument('--output', help='results json file', default='benchmark.json')
+    parser.add_argument('--baseline', help='fingerprints of the walks and stats to compare against', default='data/benchmark_baseline.json')
+    parser.add_argument('--timings_baseline', help='timings to compare against, from this machine', default='benchmark_timings.json')
+    parser.add_argument('--save_baseline', help='write the fingerprints to the baseline file and the results to the timings baseline file as well', action='store_true')
+    parser.add_argument('--tolerance', help='fraction a phase can be slower or faster than the baseline and still be the same', type=float, default=0.2)
+    args = parser.parse_args()
+
+    from generate_network import generate_network
+
+    options = {
+        'repeats': args.repeats,
+        'water_levels': [float(level) for level in args.water_levels.split(',')],
+        'seconds_per_tick': args.seconds_per_tick,
+        'all_pairs': not args.no_all_pairs,
+    }
+    #(name, directory holding data/, generate_network arguments)
+    networks = []
+    if (not args.no_st_lucia):
+        networks.append((ST_LUCIA, os.path.dirname(os.path.abspath(__file__)), None))
+    work_dir = args.work_dir
+    if (work_dir is None):
+        work_dir = tempfile.mkdtemp(prefix='benchmark_')
+    for spec in (args.generate or DEFAULT_GENERATED):
+        spec = parse_network_spec(spec)
+        name = f'generated_{spec["num_stops"]}_{spec["num_routes"]}_{spec["stops_per_route"]}'
+        spec['seed'] = args.seed
+        generate_network(os.path.join(work_dir, name), seed=args.seed, num_stops=spec['num_stops'],
+            num_routes=spec['num_routes'], stops_per_route=spec['stops_per_route'])
+        networks.append((name, os.path.abspath(os.path.join(work_dir, name)), spec))
+    write_search_limit_network(os.path.join(work_dir, SEARCH_LIMIT))
+    networks.append((SEARCH_LIMIT, os.path.abspath(os.path.join(work_dir, SEARCH_LIMIT)), None))
+
+    results = {
+        'python': sys.version.split()[0],
+        'options': options,
+        'networks': dict(),
+    }
+    for name, directory, spec in networks:
+        network_results = {'spec': spec, 'modes': dict()}
+        modes = args.modes.split(',')
+        phases = None
+        if (name == SEARCH_LIMIT):
+            #without disaster resistance a lost walk is no walk at all
+            modes = ['plain']
+            phases = check_search_limit
+        for mode in modes:
+            print(f'benchmarking {name}/{mode}', file=sys.stderr)
+            mode_results = run_benchmark(directory, mode == 'disaster_resistant', options, args.timeout, phases)
+            if (phases is None):
+                print(f'checking {name}/{mode} against the original search', file=sys.stderr)
+                reference_results = run_benchmark(directory, mode == 'disaster_resistant', options, args.reference_timeout,
+                    check_reference)
+                mode_results['timings'].update(reference_results['timings'])
+                mode_results['checks'].update(reference_results['checks'])
+                mode_results['reference_timed_out'] = reference_results['timed_out']
+                if ('error' in reference_results):
+                    mode_results['error'] = mode_results.get('error', '') + reference_results['error']
+            network_results['modes'][mode] = mode_results
+        results['networks'][name] = network_results
+
+    failed = []
+    for name, network_results in results['networks'].items():
+        for mode, mode_results in network_results['modes'].items():
+            for check, passed in mode_results.get('checks', dict()).items():
+                if (not passed):
+                    failed.append(f'{name}/{mode}: {check} check failed')
+            if ('error' in mode_results):
+                failed.append(f'{name}/{mode}: raised an exception')
+    if (os.path.exists(args.baseline)):
+        in_fd = open(args.baseline, 'r')
+        baseline = json.load(in_fd)
+        in_fd.close()
+        timings_baseline = None
+        if (os.path.exists(args.timings_baseline)):
+            in_fd = open(args.timings_baseline, 'r')
+            timings_baseline = json.load(in_fd)
+            in_fd.close()
+        results['comparison'], results['mismatches'] = compare_to_baseline(results, baseline, timings_baseline, args.tolerance)
+        failed += results['mismatches']
+
+    if (args.save_baseline):
+        out_fd = open(args.baseline, 'w')
+        json.dump(get_fingerprints(results), out_fd, indent=4)
+        out_fd.close()
+        timings_baseline = {key: value for key, value in results.items() if (not (key in ('comparison', 'mismatches')))}
+        out_fd = open(args.timings_baseline, 'w')
+        json.dump(timings_baseline, out_fd, indent=4)
+        out_fd.close()
+    results['failed'] = failed
+    out_fd = open(args.output, 'w')
+    json.dump(results, out_fd, indent=4)
+    out_fd.close()
+
+    print_summary(results, sys.stdout)
+    for failure in failed:
+        print(f'FAILED {failure}', file=sys.stderr)
+    sys.exit(1 if (len(failed) > 0) else 0)
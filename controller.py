@@ -1,27 +1,107 @@
+import bisect
+import hashlib
+import heapq
+from collections import namedtuple, OrderedDict
+from contextlib import nullcontext
+from time import perf_counter
+
+from flood_model import LinearFlood, merge_intervals
+from shortest_paths import find_shortest_paths, INF
+from walk_cache import WalkCache
+
+#a node in the walk search. rather than copying the walk, each node points to its parent
+#and the connection taken from it, num_edges being the number of connections crossed to get
+#there. visited is a bitmask of the route's required stops and edge_bits a fixed width
+#summary of the connections crossed (see add_edge_use)
+SearchNode = namedtuple('SearchNode', ['stop', 'time', 'visited', 'edge_bits', 'num_edges', 'heuristic', 'parent', 'connection'])
+
+#width of a search node's edge_bits, connections share bits beyond this many
+EDGE_BITS = 256
 
 
 class NetworkController():
 
-    def __init__(self, network, disaster_resistant=False, seconds_per_tick=120):
-        self.start_water_level=0.0
-        self.end_water_level=20.0
-        self.current_water_level = 0.0
+    def __init__(self, network, disaster_resistant=False, seconds_per_tick=120, all_pairs_shortest_paths=False,
+            heuristic='furthest_stop', walk_cache_size=128, walk_cache_filename=None, reroute_schedule=None,
+            start_water_level=0.0, end_water_level=20.0, end_time=4*60*60, shortest_paths=None, flood_model=None,
+            instrumentation=None, max_state_nodes=None):
+        self.start_water_level=start_water_level
+        self.end_water_level=end_water_level
+        #water level over time (see flood_model.py), rising linearly between the given levels by default
+        if (flood_model is None):
+            flood_model = LinearFlood(start_water_level, end_water_level, end_time)
+        self.flood_model = flood_model
+        self.current_water_level = flood_model.get_water_level(0)
         
         self.distaster_resistant = disaster_resistant
         self.network = network
 
         #start and end time in seconds
-        self.end_time = 4*60*60
+        self.end_time = end_time
         self.current_time = 0
         self.seconds_per_tick = seconds_per_tick
 
+        #heuristic for the walk search, 'furthest_stop' or 'interchange' (see get_heuristic)
+        self.heuristic = heuristic
+        #most nodes searched from at once for each search state, None for no limit (see add_state_node)
+        self.max_state_nodes = max_state_nodes
+
+        #wall clock seconds spent in each phase of start up
+        self.timings = dict()
+        #counters, timers and profiles of the run (see instrumentation.py), None records nothing
+        self.instrumentation = instrumentation
+
         #dict mapping routes to the last calculated optimal walk
         self.get_max_time_per_walk()
-        self.shortest_paths = self.init_shortest_paths()
+        start = perf_counter()
+        with self.get_phase('shortest_paths'):
+            #shortest paths don't depend on the flood, so can be shared between controllers for the same network
+            if (shortest_paths is None):
+                shortest_paths = self.init_shortest_paths(all_pairs_shortest_paths)
+            self.shortest_paths = shortest_paths
+            self.init_search_indices()
+        self.timings['shortest_paths'] = perf_counter() - start
+        start = perf_counter()
+        with self.get_phase('closure_times'):
+            self.init_closure_times()
+        self.timings['closure_times'] = perf_counter() - start
         self.prev_optimal_walks = dict()
-        self.init_walks()
-        self.cached_optimal_walks = dict()
+        #latest departure time for which each route's prev_optimal_walk is still valid
+        self.prev_walk_latest_departures = dict()
+        self.cached_optimal_walks = WalkCache(network, walk_cache_size, walk_cache_filename)
+        #(route number, walk as a tuple) -> the walk's non-preffered stops, see get_fallback_stops.
+        #least recently used first, bounded like the walk cache as there is one per distinct walk
+        self.fallback_stops = OrderedDict()
+        self.fallback_stops_size = walk_cache_size
+        #precomputed walks for every flood epoch (see reroute_schedule.py)
+        self.reroute_schedule = None
+        self.set_reroute_schedule(reroute_schedule)
+        start = perf_counter()
+        with self.get_phase('initial_walks'):
+            self.init_walks()
+        self.timings['initial_walks'] = perf_counter() - start
+
+    def get_phase(self, name):
+        '''
+        return a context manager recording the code run in it as the named phase of the run,
+        which does nothing if there is no instrumentation
+        '''
+        if (self.instrumentation is None):
+            return nullcontext()
+        return self.instrumentation.phase(name)
     
+    def set_reroute_schedule(self, reroute_schedule):
+        '''
+        look up walks in the given reroute schedule from now on, if it was built for this
+        network, flood and mode
+        '''
+        if (reroute_schedule is None):
+            return
+        if (reroute_schedule.matches(self)):
+            self.reroute_schedule = reroute_schedule
+        else:
+            print('Reroute schedule was built for a different network or flood, ignoring it')
+
     def get_max_time_per_walk(self):
         '''
         get the maximum time per trip before pruning from search tree
@@ -31,6 +111,10 @@ class NetworkController():
         self.max_time_per_walk[427] = 60*38#28
         self.max_time_per_walk[428] = 60*42#32
         self.max_time_per_walk[432] = 60*37#27
+        #other routes get as long as the timetable gives them plus 20 minutes, as above
+        for route in self.network.routes:
+            if (not (route.route_num in self.max_time_per_walk)):
+                self.max_time_per_walk[route.route_num] = route.scheduled_time + 60*20
 
     def update(self):
         self.current_time += self.seconds_per_tick
@@ -41,20 +125,62 @@ class NetworkController():
         '''
         update current buses for new tick
         '''
+        if (self.instrumentation is not None):
+            self.update_buses_instrumented()
+            return
         for bus in self.network.buses:
             bus.update(self, self.current_time)
+
+    def update_buses_instrumented(self):
+        '''
+        update_buses timing each bus's update and recording the tick with the instrumentation
+        '''
+        bus_seconds = []
+        tick_start = perf_counter()
+        for bus in self.network.buses:
+            start = perf_counter()
+            bus.update(self, self.current_time)
+            bus_seconds.append(perf_counter() - start)
+        self.instrumentation.record_tick(self.current_time, self.current_water_level,
+            perf_counter() - tick_start, bus_seconds)
     
-    def is_complete(self):
+    def is_complete(self, print_stats=True):
         for bus in self.network.buses:
             if (not bus.done):
                 return False
         #its complete
-        self.print_stats()
-        self.cache_optimum_walks
+        if (print_stats):
+            self.print_stats()
+        self.cache_optimum_walks()
         return True
 
-    def print_stats(self):
-        print('\n\n')
+    def get_stats(self):
+        '''
+        return a dict of how many passengers arrived at their destination, were stranded or
+        arrived at a non-preffered stop, and the average minutes drive from the non-preffered
+        stop to the preffered one (None if no passengers arrived at a non-preffered stop)
+        '''
+        if (self.network.demand is not None):
+            total_passengers, stranded_passengers, non_prefferred_passengers, non_prefferred_distance = self.network.demand.get_stats()
+        else:
+            total_passengers, stranded_passengers, non_prefferred_passengers, non_prefferred_distance = self.get_passenger_stats()
+
+        average_detour = None
+        if (non_prefferred_passengers != 0):
+            average_detour = non_prefferred_distance/(non_prefferred_passengers*60)
+        stats = dict()
+        stats['total'] = total_passengers
+        stats['delivered'] = total_passengers - stranded_passengers - non_prefferred_passengers
+        stats['stranded'] = stranded_passengers
+        stats['non_preferred'] = non_prefferred_passengers
+        stats['average_detour_minutes'] = average_detour
+        return stats
+
+    def get_passenger_stats(self):
+        '''
+        return (total, stranded, non-preffered, total non-preffered distance) for the network's
+        Passengers
+        '''
         total_passengers = len(self.network.passengers)
         stranded_passengers = 0
         non_prefferred_passengers = 0
@@ -65,140 +191,279 @@ class NetworkController():
             elif (not (passenger.non_preffered_dest_stop is None)):
                 non_prefferred_passengers += 1
                 non_prefferred_distance += self.shortest_paths[passenger.non_preffered_dest_stop][passenger.dest_stop]
-        print(f'{total_passengers - stranded_passengers - non_prefferred_passengers} passengers arrived at their destination')
-        print(f'{stranded_passengers} passengers were stranded at their initial stop')
-        if (non_prefferred_passengers != 0):
-            print(f'{non_prefferred_passengers} arrived at a non-preffered stop only {non_prefferred_distance/(non_prefferred_passengers*60)} minutes drive from their prefferred stop')
+        return total_passengers, stranded_passengers, non_prefferred_passengers, non_prefferred_distance
+
+    def print_stats(self):
+        print('\n\n')
+        stats = self.get_stats()
+        print(f'{stats["delivered"]} passengers arrived at their destination')
+        print(f'{stats["stranded"]} passengers were stranded at their initial stop')
+        if (stats['non_preferred'] != 0):
+            print(f'{stats["non_preferred"]} arrived at a non-preffered stop only {stats["average_detour_minutes"]} minutes drive from their prefferred stop')
         print('\n\n')
     
-    def init_shortest_paths(self):
-        '''
-        find shortest paths between all stops using djikstras
-        '''
-        STOP = 0
-        TIME = 1
-        INF = 10e8
-        min_dist = dict()
-
-        for main_stop in self.network.stops:
-            #nodes take the form [stop, time]
-            open_nodes = [[main_stop, 0]]
-            visited_stops = set()
-            main_stop_min_dist = dict()
-
-            #initlialize open nodes
-            for stop in self.network.stops:
-                if (stop != main_stop):
-                    open_nodes.append([stop, INF])
-                open_nodes.sort(key=lambda x: x[TIME])
-
-            #main search loop
-            while(len(open_nodes) > 0):
-                current_node = open_nodes.pop(0)
-                
-                for connection in self.network.get_connections_for_stop(current_node[STOP]):
-                    if (current_node[STOP] == connection.stop_1):
-                        next_stop = connection.stop_2
-                    else:
-                        next_stop = connection.stop_1
-                    
-                    if (next_stop in visited_stops):
-                        continue
-                    
-                    next_time = current_node[TIME] + connection.time
-                    for node in open_nodes:
-                        if node[STOP] == next_stop:
-                            node[TIME] = min(next_time, node[TIME])
-                            break
-                main_stop_min_dist[current_node[STOP]] = current_node[TIME]
-                visited_stops.add(current_node[STOP])
-                open_nodes.sort(key=lambda x: x[TIME])
-            min_dist[main_stop] = main_stop_min_dist
-        return min_dist
+    def init_shortest_paths(self, all_pairs=False):
+        '''
+        find shortest paths between stops using djikstras, see find_shortest_paths
+        '''
+        return find_shortest_paths(self.network, all_pairs)
     
 
+    def init_search_indices(self):
+        '''
+        number the connections and required stops so search nodes can track them in bitmasks
+        '''
+        self.connection_index = dict()
+        #bit of each connection in a search node's edge_bits
+        self.edge_bits = dict()
+        for i, connection in enumerate(self.network.connections):
+            self.connection_index[connection] = i
+            self.edge_bits[connection] = 1 << (i % EDGE_BITS)
+        #filled per route by get_required_stop_bits
+        self.required_stop_bits = dict()
+        #filled by get_heuristic
+        self.heuristic_cache = dict()
+        self.nodes_expanded = 0
+
     def init_walks(self):
         '''
         find the initial walks
         '''
         for route in self.network.routes:
-            self.prev_optimal_walks[route] = self.optimal_walk_search(route, 0, True)
+            self.set_optimal_walk(route, self.cached_walk_search(route, 0, True), 0)
+
+    def set_optimal_walk(self, route, walk, time):
+        '''
+        store the walk found at the given time as the route's current optimal walk along with
+        the latest time it can depart, so later departures can be checked without replaying it.
+        when disaster resistant, that is also capped at the last departure it is sure to be
+        optimal for, so a better walk is searched for once the water recedes
+        '''
+        self.prev_optimal_walks[route] = walk
+        if (self.distaster_resistant or (walk is None)):
+            self.prev_walk_latest_departures[route] = self.get_searched_walk_latest_departure(route, walk, time)
+        else:
+            self.prev_walk_latest_departures[route] = self.get_latest_departure_time(walk, route.route_num, time)
     
     def cache_optimum_walks(self):
         '''
-        cache the optimum walks
+        cache the optimum walks to file so later runs can reuse them
+        '''
+        self.cached_optimal_walks.save()
+
+    def cached_walk_search(self, route, time, trail=False):
+        '''
+        return the optimum walk for the given route starting at the given time, only running
+        optimal_walk_search if the reroute schedule doesn't cover it and no walk cached for the
+        same flood epoch is still valid
+        '''
+        if ((self.reroute_schedule is not None) and trail):
+            found, walk = self.reroute_schedule.get_walk(route, time)
+            if (found):
+                if (self.instrumentation is not None):
+                    self.instrumentation.count('reroute_schedule_hits')
+                return walk
+
+        key = self.get_walk_cache_key(route, time, trail)
+        found, walk = self.cached_optimal_walks.get(key, time)
+        if (found):
+            if (self.instrumentation is not None):
+                self.instrumentation.count('walk_cache_hits')
+            return walk
+
+        walk = self.optimal_walk_search(route, time, trail)
+        self.cached_optimal_walks.put(key, time, walk, self.get_searched_walk_latest_departure(route, walk, time))
+        return walk
+
+    def get_searched_walk_latest_departure(self, route, walk, time):
+        '''
+        return the latest departure that the walk searched for at the given time (None if no
+        walk was found) can be reused for: until it floods or is too long, and no later than the
+        reuse limit. no walk now means no walk until the water recedes. this is before the given
+        time if the walk is only good for the departure it was searched for, such as one that is
+        already too long, so the next departure searches again
+        '''
+        latest_departure = self.get_reuse_limit(route, time, walk)
+        if (walk is not None):
+            latest_departure = min(latest_departure, self.get_latest_departure_time(walk, route.route_num, time))
+        return latest_departure
+
+    def get_walk_cache_key(self, route, time, trail):
+        '''
+        return the walk cache key for a search for the given route at the given time
+        '''
+        return (self.flood_fingerprint, route.route_num, trail, self.distaster_resistant,
+            self.max_state_nodes, self.get_open_edges(time))
+
+    def get_open_edges(self, time):
+        '''
+        return a hex fingerprint of the steps that are open at the given time. bit i is the
+        step along connection i towards stop_2 and bit i + num connections the step towards stop_1.
+        the set only changes at closure times so it is worked out once per epoch between them
         '''
-        pass
+        epoch = bisect.bisect_right(self.closure_epochs, time)
+        if (not (epoch in self.open_edges_by_epoch)):
+            num_connections = len(self.network.connections)
+            open_edges = 0
+            for connection, i in self.connection_index.items():
+                if (not self.is_step_flooded(connection, connection.stop_2, time)):
+                    open_edges |= 1 << i
+                if (not self.is_step_flooded(connection, connection.stop_1, time)):
+                    open_edges |= 1 << (i + num_connections)
+            self.open_edges_by_epoch[epoch] = format(open_edges, 'x')
+        return self.open_edges_by_epoch[epoch]
 
     def get_optimal_walk(self, route, time):
         '''
         return the optimum walk for the given route starting at the given timestep
         '''
         prev_optimal_walk = self.prev_optimal_walks[route]
-        if (prev_optimal_walk is None):
-            return prev_optimal_walk
-        elif(self.is_walk_valid(prev_optimal_walk, time, route.route_num)):
+        if (time <= self.prev_walk_latest_departures[route]):
+            if (self.instrumentation is not None):
+                self.instrumentation.count('walk_reuses')
             return prev_optimal_walk
         elif (self.distaster_resistant):
             #if changing routes, search for new route and return it (None if no route exists)
-            new_optimal_walk = self.optimal_walk_search(route, time, trail=True)
-            self.prev_optimal_walks[route] = new_optimal_walk
+            new_optimal_walk = self.cached_walk_search(route, time, trail=True)
+            self.set_optimal_walk(route, new_optimal_walk, time)
             return new_optimal_walk
         else:
             #if not changing routes, then there is no other walk than the default
-            self.prev_optimal_walks[route] = None
+            self.set_optimal_walk(route, None, time)
             return None
 
 
+    def get_fallback_stops(self, route, walk, stops_visited):
+        '''
+        return a dict mapping each of the route's required stops that the walk doesn't visit
+        to the stop it does visit that is the shortest drive away, where passengers for that
+        stop get off instead. worked out once for each distinct walk, and a copy returned so
+        the caller can add to it
+        '''
+        key = (route.route_num, tuple(walk))
+        if (key in self.fallback_stops):
+            self.fallback_stops.move_to_end(key)
+        else:
+            fallback_stops = dict()
+            for dest_stop in route.required_stops:
+                if (not (dest_stop in stops_visited)):
+                    fallback_stops[dest_stop] = self.get_nearest_stop(dest_stop, stops_visited)
+            self.fallback_stops[key] = fallback_stops
+            while (len(self.fallback_stops) > self.fallback_stops_size):
+                self.fallback_stops.popitem(last=False)
+        return dict(self.fallback_stops[key])
+
+    def get_nearest_stop(self, dest_stop, stops):
+        '''
+        return the stop out of the given stops that is the shortest drive from dest_stop.
+        ties go to the lowest stop id, so the result doesn't depend on set order
+        '''
+        best_stop = None
+        best_time = 5e10
+        for stop in sorted(stops, key=lambda stop: stop.id):
+            next_time = self.shortest_paths[dest_stop][stop]
+            if (next_time < best_time):
+                best_stop = stop
+                best_time = next_time
+        return best_stop
+
     def optimal_walk_search(self, route, time, trail=False):
         '''
         search for the optimum walk for the given route starting at the given timestep
-        if trail is true, do not allow repeated edges
-        TODO:
-            FUNCTIONALITY:
-                -add the 'best option' thing
-
-            OPTIMIZING
-                tune max time - initial time for each route + 10 minutes
-                go through and check that everything is running snappy (probs isn't too bad since paths are fine)
-                remove duplicates - same visited required stops and same current stop
-                
-                if this still isn't enough, require that indooroopilly is the final stop
-                    heuristic = time to furthest univisited required stop + time from that stop to
-                                indooroopilly
+        if trail is true, do not allow repeated edges. when disaster resistant and no walk visits
+        every required stop, the walk ending at indooroopilly that visits the most is returned
+
+        the number of nodes expanded is kept in self.nodes_expanded so heuristics can be compared.
+        with instrumentation, the search's counters (nodes generated, largest open list and
+        successors pruned by each check) are recorded along with how long it took
         '''
-        
-        CURRENT_STOP=0
-        TIME=1
-        WALK=2
-        REQUIRED_SET=3
-        HEURISTIC=4
-        #nodes take the form [current_stop, current_time, stops_visited_in_order (first to last)]
-        root_node_set = set()
-        root_node_set.add(self.network.chancellors_place)
-        root_node = [self.network.chancellors_place, time, [], root_node_set, time + self.get_heuristic(route, [], self.network.chancellors_place)]
+        search_start = perf_counter()
+        heuristic_cache_size = len(self.heuristic_cache)
+        #successors generated and pruned by each check, and the largest the open list got
+        nodes_generated = 0
+        pruned_time_budget = 0
+        pruned_edge_reuse = 0
+        pruned_flooded = 0
+        pruned_dominated = 0
+        nodes_set_aside = 0
+        stale_nodes = 0
+        max_frontier = 1
+        heuristic_lookups = 1
+        complete_node = None
+
+        required_stop_bits = self.get_required_stop_bits(route)
+        #required stops no walk can get to count as visited, so when disaster resistant the search
+        #ends at the earliest walk visiting all the others rather than trying every walk
+        unreachable_stop_bits = self.get_unreachable_stop_bits(route, time)
+        origin_stop = self.network.chancellors_place
+        root_node = SearchNode(origin_stop, time, required_stop_bits.get(origin_stop, 0), 0, 0,
+            time + self.get_heuristic(route, unreachable_stop_bits, origin_stop), None, None)
         best_incomplete_node = root_node
-        node_list = [root_node]
+        self.nodes_expanded = 0
+
+        #open list is a heap of (heuristic, insertion count, node), the count keeps
+        #ties in the order they were found
+        node_count = 0
+        node_list = [(root_node.heuristic, node_count, root_node)]
+        if ((unreachable_stop_bits != 0) and (not self.distaster_resistant)):
+            #there is no complete walk
+            node_list = []
+        #the fastest non-dominated nodes for each (current stop, visited required stops) state,
+        #sorted by time
+        state_nodes = dict()
+        state_nodes[(root_node.stop, root_node.visited)] = [root_node]
+        #nodes dominated or set aside after they were added to the open list, by id
+        dominated_nodes = dict()
+        #nodes set aside by max_state_nodes, and those already expanded so they aren't expanded again
+        set_aside_nodes = []
+        expanded_nodes = dict()
 
-        while(len(node_list) > 0):
-            node = node_list.pop(0)
+        while (True):
+            if (len(node_list) == 0):
+                #search from the nodes the limit set aside before settling for no walk. an incomplete
+                #walk is kept, as going back to them can mean trying every walk
+                if ((complete_node is not None) or (len(set_aside_nodes) == 0) or
+                        (self.distaster_resistant and (best_incomplete_node is not root_node))):
+                    break
+                for set_aside_node in set_aside_nodes:
+                    if (id(set_aside_node) in expanded_nodes):
+                        continue
+                    dominated_nodes.pop(id(set_aside_node), None)
+                    node_count += 1
+                    heapq.heappush(node_list, (set_aside_node.heuristic, node_count, set_aside_node))
+                set_aside_nodes = []
+                continue
+            if (len(node_list) > max_frontier):
+                max_frontier = len(node_list)
+            node = heapq.heappop(node_list)[2]
+
+            #skip nodes that were dominated after they were added
+            if (id(node) in dominated_nodes):
+                stale_nodes += 1
+                continue
+            self.nodes_expanded += 1
+            if (self.max_state_nodes is not None):
+                expanded_nodes[id(node)] = node
 
             #check if walk is complete
-            if (self.is_walk_complete(node[CURRENT_STOP], node[REQUIRED_SET], route)):
-                return node[WALK]
+            if (self.is_walk_complete(node.stop, node.visited | unreachable_stop_bits, route)):
+                complete_node = node
+                break
             
-            #check if walk is better than last best_incomplete_walk
-            if ((node[CURRENT_STOP] == self.network.indooroopilly_interchange) and 
-                (len(node[REQUIRED_SET]) > len(best_incomplete_node[REQUIRED_SET]))):
+            #check if walk is better than last best_incomplete_walk, ties go to the earlier arrival
+            if ((node.stop == self.network.indooroopilly_interchange) and
+                (self.is_incomplete_node_better(node, best_incomplete_node))):
                 best_incomplete_node = node
             
             #make new node for each connection
-            prev_stop = node[CURRENT_STOP]
+            prev_stop = node.stop
 
             for connection in self.network.get_connections_for_stop(prev_stop):
 
-                #if looking for trail, abandon this
-                if (trail and (connection in node[WALK])):
+                #abandon repeated edges if looking for a trail, and edges crossed twice already
+                next_edge_bits = self.add_edge_use(node, connection, trail)
+                if (next_edge_bits is None):
+                    pruned_edge_reuse += 1
                     continue
 
                 #get stop
@@ -208,74 +473,293 @@ class NetworkController():
                     next_stop = connection.stop_1
                 
                 #check the step is valid, get next time and check if time is over max
-                valid, next_time = self.is_step_valid(prev_stop, next_stop, connection, node[TIME])
-                if ((not valid) or ((next_time-time) > self.max_time_per_walk[route.route_num])):
+                valid, next_time = self.is_step_valid(prev_stop, next_stop, connection, node.time)
+                if (not valid):
+                    pruned_flooded += 1
                     continue
-                
-                #get new walk
-                next_walk = node[WALK].copy()
-                next_walk.append(connection)
-                #prune those with double crossed edges
-                if (self.is_walk_suboptimal(next_walk, connection)):
+                if ((next_time-time) > self.max_time_per_walk[route.route_num]):
+                    pruned_time_budget += 1
                     continue
 
-                next_heuristic = next_time + self.get_heuristic(route, next_walk, next_stop)
-                
-                #get new required_set
-                new_required_set = node[REQUIRED_SET].copy()
-                if ((not (next_stop in node[REQUIRED_SET])) and (next_stop in route.required_stops)):
-                    new_required_set.add(next_stop)
-
-                #prune new set if too long
-                next_node = [next_stop, next_time, next_walk, new_required_set, next_heuristic]
-                if ((next_node[HEURISTIC] - time) > self.max_time_per_walk[route.route_num]):
+                next_visited = node.visited | required_stop_bits.get(next_stop, 0)
+                next_heuristic = next_time + self.get_heuristic(route, next_visited | unreachable_stop_bits, next_stop)
+                heuristic_lookups += 1
+
+                #prune new set if too long. incomplete walks are kept as a fallback when
+                #disaster resistant, so then only prune those that can't reach indooroopilly
+                if (self.distaster_resistant):
+                    min_end_time = next_time + self.shortest_paths[self.network.indooroopilly_interchange][next_stop]
+                else:
+                    min_end_time = next_heuristic
+                if ((min_end_time - time) > self.max_time_per_walk[route.route_num]):
+                    pruned_time_budget += 1
+                    continue
+                next_node = SearchNode(next_stop, next_time, next_visited, next_edge_bits,
+                    node.num_edges + 1, next_heuristic, node, connection)
+
+                #prune if another node has reached this state as fast without using more edges
+                next_state = (next_stop, next_visited)
+                added = self.add_state_node(state_nodes, next_state, next_node, dominated_nodes, set_aside_nodes)
+                if (added is None):
+                    nodes_set_aside += 1
+                    continue
+                if (not added):
+                    pruned_dominated += 1
                     continue
                 
                 #append new node to open list
-                node_list.append(next_node)
-            node_list.sort(key=lambda x: x[HEURISTIC])
-        if (self.distaster_resistant):
-            return best_incomplete_node[WALK]
+                node_count += 1
+                heapq.heappush(node_list, (next_node.heuristic, node_count, next_node))
+                nodes_generated += 1
+
+        if (complete_node is not None):
+            walk = self.get_walk(complete_node)
+        elif (self.distaster_resistant):
+            walk = self.get_walk(best_incomplete_node)
         else:
+            walk = None
+
+        if (self.instrumentation is not None):
+            self.instrumentation.count('searches')
+            #the interchange heuristic isn't cached, otherwise every lookup not adding to the cache was a hit
+            if (self.heuristic != 'interchange'):
+                heuristic_cache_misses = len(self.heuristic_cache) - heuristic_cache_size
+                self.instrumentation.count('heuristic_cache_hits', heuristic_lookups - heuristic_cache_misses)
+                self.instrumentation.count('heuristic_cache_misses', heuristic_cache_misses)
+            self.instrumentation.record_search({
+                'route': route.route_num,
+                'time': time,
+                'trail': trail,
+                'complete': (complete_node is not None) and (unreachable_stop_bits == 0),
+                'walk_length': None if (walk is None) else len(walk),
+                'seconds': perf_counter() - search_start,
+                'nodes_expanded': self.nodes_expanded,
+                'nodes_generated': nodes_generated,
+                'max_frontier': max_frontier,
+                'pruned_time_budget': pruned_time_budget,
+                'pruned_edge_reuse': pruned_edge_reuse,
+                'pruned_flooded': pruned_flooded,
+                'pruned_dominated': pruned_dominated,
+                'nodes_set_aside': nodes_set_aside,
+                'stale_nodes': stale_nodes,
+            })
+        return walk
+
+    def add_state_node(self, state_nodes, state, node, dominated_nodes, set_aside_nodes):
+        '''
+        returns False if a node kept for the state dominates the given node, otherwise keeps the
+        node for the state, moving those it dominates to dominated_nodes, and returns True.
+        a node that arrived before the state's fastest can't be dominated, so isn't compared.
+
+        walks to a state that use different connections don't dominate each other, and on a
+        large network there can be very many of them. if self.max_state_nodes is set only that
+        many of the fastest are searched from at once. a slower node is added to set_aside_nodes
+        and None returned, and one pushed out by a faster node is set aside and dropped from the
+        open list. the search returns to them if it finds no walk without them, but not if it
+        found one that doesn't visit every required stop
+        '''
+        other_nodes = state_nodes.get(state)
+        if (other_nodes is None):
+            state_nodes[state] = [node]
+            return True
+        if (node.time >= other_nodes[0].time):
+            for other_node in other_nodes:
+                if (other_node.time > node.time):
+                    break
+                if (self.is_node_dominated(node, other_node)):
+                    return False
+
+        kept_nodes = []
+        for other_node in other_nodes:
+            if ((other_node.time >= node.time) and self.is_node_dominated(other_node, node)):
+                dominated_nodes[id(other_node)] = other_node
+            else:
+                kept_nodes.append(other_node)
+        max_state_nodes = self.max_state_nodes
+        if ((max_state_nodes is not None) and (len(kept_nodes) >= max_state_nodes) and
+                (node.time >= kept_nodes[-1].time)):
+            set_aside_nodes.append(node)
             return None
+        kept_nodes.append(node)
+        kept_nodes.sort(key=lambda kept_node: kept_node.time)
+        if ((max_state_nodes is not None) and (len(kept_nodes) > max_state_nodes)):
+            for set_aside_node in kept_nodes[max_state_nodes:]:
+                dominated_nodes[id(set_aside_node)] = set_aside_node
+                set_aside_nodes.append(set_aside_node)
+            kept_nodes = kept_nodes[:max_state_nodes]
+        state_nodes[state] = kept_nodes
+        return True
+
+    def is_incomplete_node_better(self, node, other_node):
+        '''
+        returns True if node has visited more required stops than other_node, or as many
+        and arrived sooner
+        '''
+        num_visited = bin(node.visited).count('1')
+        other_num_visited = bin(other_node.visited).count('1')
+        return ((num_visited > other_num_visited) or
+            ((num_visited == other_num_visited) and (node.time < other_node.time)))
+
+    def get_walk(self, node):
+        '''
+        rebuild the walk ending at the given search node from its parents
+        '''
+        walk = []
+        while (node.parent is not None):
+            walk.append(node.connection)
+            node = node.parent
+        walk.reverse()
+        return walk
+
+    def is_node_dominated(self, node, other_node):
+        '''
+        returns True if other_node, which is in the same state as node, makes node
+        redundant. it must have arrived no later and used no edge that node hasn't,
+        so any walk that completes node can complete other_node just as fast
+        (the water only rises, so leaving earlier is never worse)
+        '''
+        if (self.flood_is_monotone):
+            arrived_in_time = other_node.time <= node.time
+        else:
+            #once the water can fall, arriving later may miss a flood that arriving earlier runs into
+            arrived_in_time = other_node.time == node.time
+        if ((not arrived_in_time) or (other_node.num_edges > node.num_edges) or
+                (other_node.edge_bits & ~node.edge_bits)):
+            return False
+        return self.is_subwalk(other_node, node)
 
-    def get_heuristic(self, route, walk, current_stop):
+    def is_subwalk(self, node, other_node):
         '''
-        return time plus heuristic for A*
-        heuristic is minumum time to the furthest unvisited stop in route.required_stops
+        returns True if the walk to node crosses no connection more often than the walk to
+        other_node does. the walks share the connections up to the last node they have in
+        common, so only the connections after it are compared
         '''
-        return self.shortest_paths[self.network.indooroopilly_interchange][current_stop]
+        connections = []
+        other_connections = []
+        while (node.num_edges > other_node.num_edges):
+            connections.append(node.connection)
+            node = node.parent
+        while (other_node.num_edges > node.num_edges):
+            other_connections.append(other_node.connection)
+            other_node = other_node.parent
+        while (node is not other_node):
+            connections.append(node.connection)
+            other_connections.append(other_node.connection)
+            node = node.parent
+            other_node = other_node.parent
+        for connection in connections:
+            if (connections.count(connection) > other_connections.count(connection)):
+                return False
+        return True
+
+    def get_heuristic(self, route, visited, current_stop):
+        '''
+        return heuristic for A*
+        heuristic is minumum time to the furthest unvisited stop in route.required_stops plus
+        the time from that stop to indooroopilly. the walk has to visit that stop and then end at
+        indooroopilly, and flooding only makes paths longer, so this never overestimates.
+
+        results are cached per (route, stop, visited) as the same pattern is met many times.
+        if self.heuristic is 'interchange' the time to indooroopilly alone is used instead
+        '''
+        interchange = self.network.indooroopilly_interchange
+        if (self.heuristic == 'interchange'):
+            return self.shortest_paths[interchange][current_stop]
+
+        key = (route, current_stop, visited)
+        if (not (key in self.heuristic_cache)):
+            best_time = self.shortest_paths[interchange][current_stop]
+            for stop, bit in self.get_required_stop_bits(route).items():
+                if (visited & bit):
+                    continue
+                #paths are symmetric, look up from the required stop as its row is precomputed
+                next_time = self.shortest_paths[stop][current_stop] + self.shortest_paths[stop][interchange]
+                best_time = max(best_time, next_time)
+            self.heuristic_cache[key] = best_time
+        return self.heuristic_cache[key]
+
+    def get_required_stop_bits(self, route):
+        '''
+        return a dict mapping each of the route's required stops to its bit in the
+        visited bitmask of a search node
+        '''
+        if (not (route in self.required_stop_bits)):
+            stops = sorted(route.required_stops, key=lambda stop: stop.id)
+            self.required_stop_bits[route] = {stop: 1 << i for i, stop in enumerate(stops)}
+        return self.required_stop_bits[route]
     
-    def get_num_required_visited(self, route, walk):
+    def get_unreachable_stop_bits(self, route, time):
         '''
-        returns how many of the required stops are visited in this path
+        return a bitmask of the route's required stops that no walk leaving at the given time can
+        visit, as they flood before the bus could get to them or are too far out of the way to
+        reach indooroopilly in time. only worked out while the water only rises, as otherwise
+        a flooded stop may reopen. the origin is never unreachable, as only the stops walks
+        step to have to be dry
         '''
+        if (not self.flood_is_monotone):
+            return 0
+        origin_stop = self.network.chancellors_place
+        interchange = self.network.indooroopilly_interchange
+        unreachable_stop_bits = 0
+        for stop, bit in self.get_required_stop_bits(route).items():
+            if (stop == origin_stop):
+                #every walk starts by visiting it, flooded or not
+                continue
+            #paths are symmetric, look up from the required stop as its row is precomputed
+            intervals = self.stop_flooded_intervals[stop]
+            flooded = (len(intervals) > 0) and ((time + self.shortest_paths[stop][origin_stop]) >= intervals[0][0])
+            too_far = (self.shortest_paths[stop][origin_stop] + self.shortest_paths[stop][interchange]) > self.max_time_per_walk[route.route_num]
+            if (flooded or too_far):
+                unreachable_stop_bits |= bit
+        return unreachable_stop_bits
 
-    def is_walk_suboptimal(self, walk, connection):
+    def add_edge_use(self, node, connection, trail):
         '''
-        checks to see if the walk is suboptimal given the newly added connection
+        return the edge_bits of a node crossing the given connection from the given node, or
+        None if the connection can't be crossed (any repeat for a trail, otherwise a third
+        crossing as the walk would be suboptimal)
+
+        each connection has a bit, shared with others in large networks, set once it is crossed.
+        a clear bit means the connection hasn't been crossed, otherwise the walk is followed
+        back through the node's parents to count how often it has
         '''
-        num_occurances = walk.count(connection)
-        return num_occurances > 2
+        edge_bits = node.edge_bits
+        edge_bit = self.edge_bits[connection]
+        if (not (edge_bits & edge_bit)):
+            return edge_bits | edge_bit
+        max_uses = 1 if (trail) else 2
+        uses = 0
+        while (node.parent is not None):
+            if (node.connection == connection):
+                uses += 1
+                if (uses == max_uses):
+                    return None
+            node = node.parent
+        return edge_bits
 
-    def is_walk_complete(self, current_stop, required_set, route):
+    def is_walk_complete(self, current_stop, visited, route):
         '''
         return True if the walk contains all stops in the routes required_stops
         '''
         if (current_stop != self.network.indooroopilly_interchange):
             return False
-        for stop in route.required_stops:
-            if (stop in required_set):
-                continue
-            return False
-        return True
+        return visited == (1 << len(route.required_stops)) - 1
 
 
     def is_walk_valid(self, walk, time, route_num):
         '''
         test if a walk is valid starting at the given time
         '''
-        start_time = time
+        return time <= self.get_latest_departure_time(walk, route_num, time)
+
+    def get_latest_departure_time(self, walk, route_num, time=0):
+        '''
+        return the latest time the walk can depart and still be valid for every departure from
+        the given time up to it, INF if it never floods again or -1 if it is too long to ever be
+        valid. this is before the given time if the walk isn't valid then
+        '''
+        walk_time = 0
+        latest_departure = INF
         next_stop = self.network.chancellors_place
         for connection in walk:
             prev_stop = next_stop
@@ -283,11 +767,14 @@ class NetworkController():
                 next_stop = connection.stop_2
             else:
                 next_stop = connection.stop_1
-            valid, time = self.is_step_valid(prev_stop, next_stop, connection, time)
-            if ((not valid) or ((time - start_time) > self.max_time_per_walk[route_num])):
-                return False
-        return True
-            
+            walk_time += connection.time
+            #the step must end before it next floods
+            closure_time = self.get_next_flood_time(connection, next_stop, time + walk_time)
+            if (closure_time < INF):
+                latest_departure = min(latest_departure, closure_time - walk_time - 1)
+        if (walk_time > self.max_time_per_walk[route_num]):
+            return -1
+        return latest_departure
     
     def is_step_valid(self, start_stop, end_stop, connection, time):
         '''
@@ -298,12 +785,135 @@ class NetworkController():
         start_time
         '''
         end_time = time + connection.time
-        end_water_level = self.get_water_level_for_time(end_time)
-        if ((connection.elevation <= end_water_level) or
-            (end_stop.elevation <= end_water_level)):
+        if ((end_time >= self.step_closure_times[(connection, end_stop)]) and
+                self.is_step_flooded(connection, end_stop, end_time)):
             return False, -1
         return True, end_time
 
+    def is_step_flooded(self, connection, end_stop, time):
+        '''
+        returns True if a step along the connection to end_stop can't end at the given time
+        '''
+        return self.get_next_flood_time(connection, end_stop, time) <= time
+
+    def get_next_flood_time(self, connection, end_stop, time):
+        '''
+        return the start of the first flood of the step that hasn't receded by the given time,
+        or INF if there isn't one. this is at or before the given time if the step is flooded then
+        '''
+        closure_time = self.step_closure_times[(connection, end_stop)]
+        if (self.flood_is_monotone or (time < closure_time)):
+            return closure_time
+        for flood_start, flood_end in self.step_flooded_intervals[(connection, end_stop)]:
+            if (flood_end > time):
+                return flood_start
+        return INF
+
+    def get_reuse_limit(self, route, time, walk=None):
+        '''
+        return the latest departure that the walk searched for at the given time (or finding no
+        walk) still holds for. while the water only rises the valid walks only shrink, so this
+        is INF. once it recedes a step may reopen, so it is the last departure whose walk ends
+        before the next recession, or the given time if there is none.
+
+        a walk using a reopened step can't end before the recession, so a complete walk still
+        beats them all for departures it ends before the recession from. otherwise every walk
+        up to the route's time limit has to end before it
+        '''
+        if (self.flood_is_monotone):
+            return INF
+        i = bisect.bisect_right(self.recession_times, time)
+        if (i == len(self.recession_times)):
+            return INF
+        walk_time = self.max_time_per_walk[route.route_num]
+        if ((walk is not None) and self.is_complete_walk(route, walk)):
+            walk_time = sum(connection.time for connection in walk)
+        return max(time, self.recession_times[i] - walk_time - 1)
+
+    def get_next_recession_time(self, time):
+        '''
+        return the first time after the given time that a step reopens, INF if none do
+        '''
+        i = bisect.bisect_right(self.recession_times, time)
+        if (i == len(self.recession_times)):
+            return INF
+        return self.recession_times[i]
+
+    def is_complete_walk(self, route, walk):
+        '''
+        return True if the walk visits all the route's required stops and ends at indooroopilly
+        '''
+        stop = self.network.chancellors_place
+        stops_visited = {stop}
+        for connection in walk:
+            if (connection.stop_1 == stop):
+                stop = connection.stop_2
+            else:
+                stop = connection.stop_1
+            stops_visited.add(stop)
+        return (stop == self.network.indooroopilly_interchange) and route.required_stops.issubset(stops_visited)
+
+    def init_closure_times(self):
+        '''
+        find when each stop and connection is under water. a step along a connection is valid
+        if it ends while neither the connection nor the stop it ends at is flooded, so the union
+        of the two is stored for each direction of each connection, along with the time it first
+        closes. if no step ever reopens the flood is treated as monotone. connections are
+        placed at the midpoint of their stops, as for their elevation
+        '''
+        stops = self.network.stops
+        stop_intervals = self.flood_model.get_local_flooded_intervals([stop.lat for stop in stops],
+            [stop.lon for stop in stops], [stop.elevation for stop in stops])
+        self.stop_flooded_intervals = dict(zip(stops, stop_intervals))
+
+        connections = self.network.connections
+        connection_intervals = self.flood_model.get_local_flooded_intervals(
+            [(connection.stop_1.lat + connection.stop_2.lat)/2 for connection in connections],
+            [(connection.stop_1.lon + connection.stop_2.lon)/2 for connection in connections],
+            [connection.elevation for connection in connections])
+
+        self.step_flooded_intervals = dict()
+        self.step_closure_times = dict()
+        self.flood_is_monotone = True
+        for i, connection in enumerate(connections):
+            for end_stop in (connection.stop_1, connection.stop_2):
+                intervals = merge_intervals(connection_intervals[i] + self.stop_flooded_intervals[end_stop])
+                self.step_flooded_intervals[(connection, end_stop)] = intervals
+                self.step_closure_times[(connection, end_stop)] = intervals[0][0] if (len(intervals) > 0) else INF
+                if ((len(intervals) > 1) or ((len(intervals) == 1) and (intervals[0][1] < INF))):
+                    self.flood_is_monotone = False
+
+        #times at which the set of open steps changes, and those at which a step reopens
+        epochs = set()
+        recession_times = set()
+        for intervals in self.step_flooded_intervals.values():
+            for flood_start, flood_end in intervals:
+                epochs.add(flood_start)
+                if (flood_end < INF):
+                    epochs.add(flood_end)
+                    recession_times.add(flood_end)
+        self.closure_epochs = sorted(epochs)
+        self.recession_times = sorted(recession_times)
+        self.open_edges_by_epoch = dict()
+        self.flood_fingerprint = self.get_flood_fingerprint()
+
+    def get_flood_fingerprint(self):
+        '''
+        return a hash of everything the walk search depends on other than the departure time:
+        the connections in index order with their times and flooded intervals, the routes' required
+        stops and the maximum time per walk. this is stable between runs, so walks cached to
+        file are only reused for the same network and flood
+        '''
+        connections = []
+        for connection in self.network.connections:
+            connections.append((connection.stop_1.id, connection.stop_2.id, connection.time,
+                self.step_flooded_intervals[(connection, connection.stop_1)],
+                self.step_flooded_intervals[(connection, connection.stop_2)]))
+        routes = []
+        for route in self.network.routes:
+            routes.append((route.route_num, sorted(stop.id for stop in route.required_stops)))
+        fingerprint_data = (connections, routes, sorted(self.max_time_per_walk.items()))
+        return hashlib.sha1(repr(fingerprint_data).encode()).hexdigest()
+
     def get_water_level_for_time(self, time):
-        water_level_diff = ((self.end_water_level - self.start_water_level) / (self.end_time)) * time
-        return min(water_level_diff + self.start_water_level, self.end_water_level)
\ No newline at end of file
+        return self.flood_model.get_water_level(time)
\ No newline at end of file
@@ -0,0 +1,184 @@
+import json
+import os
+import time
+
+
+class DemElevationProvider():
+    '''
+    elevations looked up offline from a digital elevation model tile rather than the
+    open-elevation server.
+
+    the tile is a 2d numpy array of elevations in metres, memory mapped from a .npy file so only
+    the cells that are looked up are read. each value is the elevation at the centre of its cell,
+    row 0 is the northern edge and column 0 the western edge. elevations between cell centres are
+    interpolated bilinearly. cells equal to nodata (or nan) are treated as unknown
+    '''
+
+    def __init__(self, dem, west, north, cell_width, cell_height, nodata=None):
+        '''
+        dem is a 2d numpy array or the name of a .npy file holding one
+        '''
+        import numpy as np
+        if (isinstance(dem, str)):
+            dem = np.load(dem, mmap_mode='r')
+        if (dem.ndim != 2):
+            raise ValueError(f'expected a 2d elevation model, found shape {dem.shape}')
+        self.dem = dem
+        self.west = west
+        self.north = north
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.nodata = nodata
+
+    def get_elevation(self, lat, lon):
+        '''
+        return the elevation at a single point, or None if it is off the tile or unknown
+        '''
+        elevation = self.get_elevations([lat], [lon])[0]
+        if (elevation != elevation):
+            return None
+        return float(elevation)
+
+    def get_elevations(self, latitudes, longitudes):
+        '''
+        return a numpy array of the elevation at each of the given points, nan where the point
+        is off the tile or any of the cells around it are unknown
+        '''
+        import numpy as np
+        num_rows, num_cols = self.dem.shape
+        #position in cells relative to the centre of the top left cell
+        rows = (self.north - np.asarray(latitudes, dtype=float)) / self.cell_height - 0.5
+        cols = (np.asarray(longitudes, dtype=float) - self.west) / self.cell_width - 0.5
+        on_tile = (rows >= -0.5) & (rows <= num_rows - 0.5) & (cols >= -0.5) & (cols <= num_cols - 0.5)
+
+        #points within half a cell of the edge use the edge cells
+        rows = np.clip(rows, 0, num_rows - 1)
+        cols = np.clip(cols, 0, num_cols - 1)
+        row_0 = np.minimum(np.floor(rows).astype(int), max(num_rows - 2, 0))
+        col_0 = np.minimum(np.floor(cols).astype(int), max(num_cols - 2, 0))
+        row_1 = np.minimum(row_0 + 1, num_rows - 1)
+        col_1 = np.minimum(col_0 + 1, num_cols - 1)
+        row_fraction = rows - row_0
+        col_fraction = cols - col_0
+
+        corners = []
+        for corner_rows, corner_cols in ((row_0, col_0), (row_0, col_1), (row_1, col_0), (row_1, col_1)):
+            corner = np.asarray(self.dem[corner_rows, corner_cols], dtype=float)
+            if (self.nodata is not None):
+                corner[corner == self.nodata] = np.nan
+            corners.append(corner)
+        top = corners[0] * (1 - col_fraction) + corners[1] * col_fraction
+        bottom = corners[2] * (1 - col_fraction) + corners[3] * col_fraction
+        elevations = top * (1 - row_fraction) + bottom * row_fraction
+        elevations[~on_tile] = np.nan
+        return elevations
+
+
+def load_dem(filename):
+    '''
+    return a DemElevationProvider for either a GeoTIFF, which needs rasterio, or a json file
+    with keys dem (a .npy file, relative to the json file), west, north, cell_width,
+    cell_height and optionally nodata
+    '''
+    if (filename.lower().endswith(('.tif', '.tiff'))):
+        try:
+            import rasterio
+        except ImportError:
+            raise ImportError('reading GeoTIFF elevation models needs rasterio, or convert the tile to .npy')
+        dataset = rasterio.open(filename)
+        transform = dataset.transform
+        #north up tiles only, so the transform is a scale and offset
+        dem = dataset.read(1)
+        provider = DemElevationProvider(dem, transform.c, transform.f, transform.a, -transform.e, dataset.nodata)
+        dataset.close()
+        return provider
+
+    in_fd = open(filename, 'r')
+    data = json.load(in_fd)
+    in_fd.close()
+    dem_filename = os.path.join(os.path.dirname(filename), data['dem'])
+    return DemElevationProvider(dem_filename, data['west'], data['north'], data['cell_width'],
+        data['cell_height'], data.get('nodata'))
+
+
+class RemoteElevationProvider():
+    '''
+    elevations looked up from an open-elevation server. points are sent in batches of up to
+    batch_size locations per request, with up to max_workers requests at once over a pooled
+    session. requests that time out, can't connect, are rate limited or fail on the server are
+    retried up to max_retries times, waiting backoff seconds and twice as long after each retry
+    '''
+
+    def __init__(self, url='https://api.open-elevation.com/api/v1/lookup', batch_size=100, max_workers=4,
+            timeout=(5, 30), max_retries=5, backoff=1.0):
+        self.url = url
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        #(connect, read) timeouts in seconds
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = None
+
+    def get_session(self):
+        '''
+        return the session requests are sent over, creating it the first time
+        '''
+        if (self.session is None):
+            import requests
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        return self.session
+
+    def get_elevation(self, lat, lon):
+        '''
+        return the elevation at a single point, or None if the server has none
+        '''
+        elevation = self.get_elevations([lat], [lon])[0]
+        if (elevation != elevation):
+            return None
+        return elevation
+
+    def get_elevations(self, latitudes, longitudes):
+        '''
+        return a list of the elevation at each of the given points, nan where the server has none
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        #created up front so the workers share it
+        self.get_session()
+        points = list(zip(latitudes, longitudes))
+        batches = [points[i:i+self.batch_size] for i in range(0, len(points), self.batch_size)]
+        if (len(batches) <= 1):
+            results = [self.fetch_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(self.fetch_batch, batches))
+        return [elevation for batch_elevations in results for elevation in batch_elevations]
+
+    def fetch_batch(self, points):
+        '''
+        return the elevations of a batch of (lat, lon) points in one request, retrying with
+        backoff. raises RuntimeError if every attempt fails
+        '''
+        import requests
+        body = {'locations': [{'latitude': lat, 'longitude': lon} for lat, lon in points]}
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if (attempt > 0):
+                time.sleep(self.backoff * 2**(attempt - 1))
+            try:
+                response = self.get_session().post(self.url, json=body, timeout=self.timeout)
+                if ((response.status_code == 429) or (response.status_code >= 500)):
+                    error = f'status {response.status_code}'
+                    continue
+                response.raise_for_status()
+                results = response.json()['results']
+            except (requests.ConnectionError, requests.Timeout, ValueError, KeyError) as e:
+                error = repr(e)
+                continue
+            if (len(results) != len(points)):
+                raise RuntimeError(f'asked {self.url} for {len(points)} elevations, got {len(results)}')
+            return [float('nan') if (result.get('elevation') is None) else result['elevation'] for result in results]
+        raise RuntimeError(f'elevation lookup failed after {self.max_retries + 1} attempts: {error}')
@@ -0,0 +1,107 @@
+import heapq
+import math
+
+#kinds of event
+DEPART = 0
+ARRIVE = 1
+FLOOD = 2
+
+
+class EventEngine():
+    '''
+    discrete event alternative to stepping NetworkController.update every tick. bus departures,
+    stop arrivals and flood closures are kept in a queue of timestamped events and only those
+    events are processed, so nothing is done for ticks where nothing happens.
+
+    the tick engine updates buses in list order each tick, so when two buses reach a stop in the
+    same tick the one earlier in the list boards first. to give the same passenger outcomes, events
+    are ordered by (tick, bus index, time) using the controller's seconds_per_tick. if tick_order
+    is False events are processed in time order instead.
+    '''
+
+    def __init__(self, controller, tick_order=True):
+        self.controller = controller
+        self.network = controller.network
+        self.seconds_per_tick = None
+        if (tick_order):
+            self.seconds_per_tick = controller.seconds_per_tick
+
+        #heap of (order key, insertion count, kind, bus index, time)
+        self.events = []
+        self.event_count = 0
+        self.num_buses_remaining = 0
+        self.events_processed = 0
+
+        for bus_index, bus in enumerate(self.network.buses):
+            if (bus.done):
+                continue
+            self.num_buses_remaining += 1
+            self.schedule(bus.departure_time, DEPART, bus_index)
+        for closure_time in controller.closure_epochs:
+            self.schedule(closure_time, FLOOD, -1)
+
+    def schedule(self, time, kind, bus_index):
+        '''
+        add an event to the queue
+        '''
+        self.event_count += 1
+        heapq.heappush(self.events, (self.get_order_key(time, bus_index), self.event_count, kind, bus_index, time))
+
+    def get_order_key(self, time, bus_index):
+        '''
+        return the key events are processed in, see the class docstring
+        '''
+        if (self.seconds_per_tick is None):
+            return (time, bus_index)
+        #the first tick the tick engine runs is at seconds_per_tick, not 0
+        tick = max(1, math.ceil(time / self.seconds_per_tick))
+        return (tick, bus_index, time)
+
+    def is_complete(self):
+        return self.num_buses_remaining == 0
+
+    def run(self):
+        '''
+        process every event until all buses are done
+        '''
+        while (not self.is_complete()):
+            self.process_next_event()
+
+    def run_until(self, time):
+        '''
+        process every event up to and including the given time
+        '''
+        while ((len(self.events) > 0) and (self.events[0][4] <= time) and (not self.is_complete())):
+            self.process_next_event()
+        self.set_time(max(self.controller.current_time, time))
+
+    def process_next_event(self):
+        '''
+        process the next event in the queue
+        '''
+        order_key, event_count, kind, bus_index, time = heapq.heappop(self.events)
+        self.events_processed += 1
+        if (kind == FLOOD):
+            self.set_time(time)
+            return
+
+        bus = self.network.buses[bus_index]
+        if (kind == DEPART):
+            bus.start_walk(self.controller)
+        else:
+            bus.visit_next_stop(self.controller)
+
+        if ((not bus.done) and (len(bus.walk) == 0)):
+            bus.done = True
+        if (bus.done):
+            self.num_buses_remaining -= 1
+        else:
+            self.schedule(bus.get_next_arrival_time(), ARRIVE, bus_index)
+
+    def set_time(self, time):
+        '''
+        move the controller's clock and water level forward to the given time
+        '''
+        if (time > self.controller.current_time):
+            self.controller.current_time = time
+            self.controller.current_water_level = self.controller.get_water_level_for_time(time)
@@ -0,0 +1,148 @@
+import numpy as np
+
+from shortest_paths import INF
+
+
+class FleetEngine():
+    '''
+    alternative to NetworkController.update updating each Bus object every tick. the state the
+    tick loop needs for every bus is kept in numpy arrays indexed as network.buses: departed and
+    done flags, the cursor into the bus's walk, the time it left its last stop, the time the
+    connection it is on takes and the coordinates of the stops at either end of that connection.
+
+    each tick a single vectorised pass finds the buses that depart or reach a stop, and only
+    those buses are handed back to Python to visit their stops (boarding and alighting works on
+    the Bus and Stop objects as before). the position of every bus between stops is then
+    interpolated in one go into lats and lons.
+
+    buses are visited in list order, each passing all the stops it reaches that tick before the
+    next bus moves, so the passenger outcomes are the same as the tick engine's. a bus's walk is
+    not popped as it goes, the cursor says how far along it the bus is.
+    '''
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.network = controller.network
+        buses = self.network.buses
+        num_buses = len(buses)
+
+        self.departure_times = np.array([bus.departure_time for bus in buses], dtype=float)
+        self.departed = np.zeros(num_buses, dtype=bool)
+        self.done = np.array([bus.done for bus in buses], dtype=bool)
+        #index of the connection each bus is on in its walk
+        self.cursors = np.zeros(num_buses, dtype=np.int64)
+        self.times_at_last_stop = np.zeros(num_buses)
+        #seconds the connection each bus is on takes, INF until it departs
+        self.connection_times = np.full(num_buses, float(INF))
+        #coordinates of the stops at the start and end of the connection each bus is on
+        self.start_lats = np.zeros(num_buses)
+        self.start_lons = np.zeros(num_buses)
+        self.end_lats = np.zeros(num_buses)
+        self.end_lons = np.zeros(num_buses)
+        self.lats = np.zeros(num_buses)
+        self.lons = np.zeros(num_buses)
+
+        #for each bus's walk, the stop at the end of each connection and the seconds it takes
+        self.walk_stops = [None] * num_buses
+        self.walk_times = [None] * num_buses
+
+    def is_complete(self):
+        return bool(self.done.all())
+
+    def run(self):
+        '''
+        update every tick until all buses are done
+        '''
+        while (not self.is_complete()):
+            self.update()
+
+    def update(self):
+        '''
+        move the controller on a tick and advance the fleet to the new time
+        '''
+        controller = self.controller
+        controller.current_time += controller.seconds_per_tick
+        controller.current_water_level = controller.get_water_level_for_time(controller.current_time)
+        self.advance(controller.current_time)
+
+    def advance(self, time):
+        '''
+        depart buses due to leave by the given time, visit the stops buses reach by then and
+        interpolate the position of the rest
+        '''
+        departing = (~self.departed) & (~self.done) & (self.departure_times <= time)
+        arriving = self.departed & (~self.done) & ((time - self.times_at_last_stop) >= self.connection_times)
+        for bus_index in np.nonzero(departing | arriving)[0].tolist():
+            if (departing[bus_index]):
+                self.start_walk(bus_index)
+            if (not self.done[bus_index]):
+                self.visit_stops(bus_index, time)
+
+        en_route = self.departed & (~self.done)
+        fractions = (time - self.times_at_last_stop[en_route]) / self.connection_times[en_route]
+        self.lats[en_route] = self.start_lats[en_route] + (self.end_lats[en_route] - self.start_lats[en_route]) * fractions
+        self.lons[en_route] = self.start_lons[en_route] + (self.end_lons[en_route] - self.start_lons[en_route]) * fractions
+
+    def start_walk(self, bus_index):
+        '''
+        get the bus's walk and visit its first stop
+        '''
+        bus = self.network.buses[bus_index]
+        bus.start_walk(self.controller)
+        self.departed[bus_index] = True
+        if (bus.done):
+            self.done[bus_index] = True
+            return
+
+        walk_stops = []
+        stop = bus.route.origin_stop
+        for connection in bus.walk:
+            if (connection.stop_1 == stop):
+                stop = connection.stop_2
+            else:
+                stop = connection.stop_1
+            walk_stops.append(stop)
+        self.walk_stops[bus_index] = walk_stops
+        self.walk_times[bus_index] = [connection.time for connection in bus.walk]
+        self.cursors[bus_index] = 0
+        if (len(walk_stops) > 0):
+            self.set_connection(bus_index, bus.route.origin_stop, bus.departure_time)
+
+    def visit_stops(self, bus_index, time):
+        '''
+        visit every stop the bus reaches by the given time, the bus is done once it reaches
+        the end of its walk
+        '''
+        bus = self.network.buses[bus_index]
+        walk_stops = self.walk_stops[bus_index]
+        walk_times = self.walk_times[bus_index]
+        cursor = int(self.cursors[bus_index])
+        time_at_last_stop = bus.time_at_last_stop
+        while ((cursor < len(walk_stops)) and ((time - time_at_last_stop) >= walk_times[cursor])):
+            time_at_last_stop = time_at_last_stop + walk_times[cursor]
+            bus.visit_stop(self.controller, walk_stops[cursor], time_at_last_stop)
+            cursor += 1
+        self.cursors[bus_index] = cursor
+
+        if (cursor == len(walk_stops)):
+            self.done[bus_index] = True
+            bus.done = True
+            self.lats[bus_index] = bus.lat
+            self.lons[bus_index] = bus.lon
+            return
+        self.set_connection(bus_index, bus.current_stop, time_at_last_stop)
+
+    def set_connection(self, bus_index, last_stop, time_at_last_stop):
+        '''
+        put the bus on the next connection in its walk, having left last_stop at the given time
+        '''
+        cursor = self.cursors[bus_index]
+        next_stop = self.walk_stops[bus_index][cursor]
+        self.times_at_last_stop[bus_index] = time_at_last_stop
+        self.connection_times[bus_index] = self.walk_times[bus_index][cursor]
+        self.start_lats[bus_index] = last_stop.lat
+        self.start_lons[bus_index] = last_stop.lon
+        self.end_lats[bus_index] = next_stop.lat
+        self.end_lons[bus_index] = next_stop.lon
+        self.lats[bus_index] = last_stop.lat
+        self.lons[bus_index] = last_stop.lon
@@ -0,0 +1,277 @@
+import bisect
+import json
+import os
+from abc import ABC, abstractmethod
+
+from shortest_paths import INF
+
+
+def merge_intervals(intervals):
+    '''
+    return the union of a list of [start, end) intervals as a sorted list of disjoint intervals
+    '''
+    merged = []
+    for start, end in sorted(intervals):
+        if ((len(merged) > 0) and (start <= merged[-1][1])):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def interpolate(times, levels, time):
+    '''
+    return the level at the given time, linear between the given times. the level before the
+    first time is the first level and after the last is the last
+    '''
+    i = bisect.bisect_right(times, time)
+    if (i == 0):
+        return levels[0]
+    if (i == len(times)):
+        return levels[-1]
+    fraction = (time - times[i-1]) / (times[i] - times[i-1])
+    return levels[i-1] + (levels[i] - levels[i-1]) * fraction
+
+
+def find_flooded_intervals(knot_times, knot_levels, elevation, get_water_level):
+    '''
+    return a list of [start, end) whole second intervals in which the water, piecewise linear
+    between the knots and given at any time by get_water_level, is at or above the given
+    elevation. end is INF if the water never falls below it again
+    '''
+    intervals = []
+    flooded = knot_levels[0] >= elevation
+    flood_start = 0
+    for i in get_crossing_segments(knot_levels, elevation):
+        #the water crosses the elevation somewhere in (knot_times[i], knot_times[i+1]]
+        low = knot_times[i] + 1
+        high = knot_times[i+1]
+        while (low < high):
+            mid = (low + high) // 2
+            if ((get_water_level(mid) >= elevation) != flooded):
+                high = mid
+            else:
+                low = mid + 1
+        if (flooded):
+            intervals.append([flood_start, low])
+        else:
+            flood_start = low
+        flooded = not flooded
+    if (flooded):
+        intervals.append([flood_start, INF])
+    return intervals
+
+
+def get_crossing_segments(knot_levels, elevation):
+    '''
+    return the indices i of the segments between knots i and i+1 over which the water goes
+    from below the elevation to at or above it, or back again
+    '''
+    #numpy is only worth importing for long series
+    if (len(knot_levels) < 64):
+        segments = []
+        for i in range(len(knot_levels) - 1):
+            if ((knot_levels[i] >= elevation) != (knot_levels[i+1] >= elevation)):
+                segments.append(i)
+        return segments
+
+    import numpy as np
+    flooded = np.asarray(knot_levels) >= elevation
+    return np.nonzero(flooded[1:] != flooded[:-1])[0].tolist()
+
+
+class FloodModel(ABC):
+    '''
+    water level over time. a model is piecewise linear between its knots (whole seconds,
+    starting at 0) and constant after the last one.
+
+    subclasses provide get_water_level for a single time. everything else, including levels at
+    many times at once and the inverse (when a given elevation is under water), is worked out
+    from the knots.
+    '''
+
+    def __init__(self, knot_times):
+        self.knot_times = sorted(set([0] + [int(time) for time in knot_times if (time > 0)]))
+        self.knot_levels = [self.get_water_level(time) for time in self.knot_times]
+        #cache of get_flooded_intervals by elevation, as many stops share an elevation
+        self.flooded_intervals = dict()
+
+    @abstractmethod
+    def get_water_level(self, time):
+        '''
+        return the water level at the given time
+        '''
+
+    def get_water_levels(self, times):
+        '''
+        return a numpy array of the water level at each of the given times, in one call rather
+        than one get_water_level each
+        '''
+        import numpy as np
+        return np.interp(np.asarray(times, dtype=float), self.knot_times, self.knot_levels)
+
+    def get_flood_time(self, elevation):
+        '''
+        return the first whole second the water reaches the given elevation, or INF if it never does
+        '''
+        intervals = self.get_flooded_intervals(elevation)
+        if (len(intervals) == 0):
+            return INF
+        return intervals[0][0]
+
+    def get_flooded_intervals(self, elevation):
+        '''
+        return a list of [start, end) whole second intervals in which the water is at or above
+        the given elevation. end is INF if the water never falls below it again
+        '''
+        if (not (elevation in self.flooded_intervals)):
+            self.flooded_intervals[elevation] = find_flooded_intervals(self.knot_times, self.knot_levels,
+                elevation, self.get_water_level)
+        return self.flooded_intervals[elevation]
+
+    def get_local_flooded_intervals(self, latitudes, longitudes, elevations):
+        '''
+        return the flooded intervals of places at each of the given positions and elevations.
+        the water level is the same everywhere, so only the elevation matters
+        '''
+        return [self.get_flooded_intervals(elevation) for elevation in elevations]
+
+
+class LinearFlood(FloodModel):
+    '''
+    water rising at a constant rate from start_water_level at time 0 to end_water_level at
+    end_time, then staying there
+    '''
+
+    def __init__(self, start_water_level=0.0, end_water_level=20.0, end_time=4*60*60):
+        self.start_water_level = start_water_level
+        self.end_water_level = end_water_level
+        self.end_time = end_time
+        super().__init__([end_time])
+
+    def get_water_level(self, time):
+        water_level_diff = ((self.end_water_level - self.start_water_level) / (self.end_time)) * time
+        if (self.end_water_level < self.start_water_level):
+            return max(water_level_diff + self.start_water_level, self.end_water_level)
+        return min(water_level_diff + self.start_water_level, self.end_water_level)
+
+
+class HydrographFlood(FloodModel):
+    '''
+    water level interpolated linearly between readings, such as a gauge's rise and recession.
+    the level before the first reading is the first reading's and after the last is the last's
+    '''
+
+    def __init__(self, readings):
+        '''
+        readings is a list of [time in whole seconds, water level]
+        '''
+        readings = sorted([int(time), level] for time, level in readings)
+        self.reading_times = [time for time, level in readings]
+        self.reading_levels = [level for time, level in readings]
+        super().__init__(self.reading_times)
+
+    def get_water_level(self, time):
+        return interpolate(self.reading_times, self.reading_levels, time)
+
+
+class RasterFlood(FloodModel):
+    '''
+    water surface levels that vary across the city, from a grid of levels in metres (nan where
+    dry) for each reading time. the grids are a numpy array of shape (readings, rows, cols)
+    memory mapped from file, so only the cells that places fall in are ever read. row 0 is the
+    northern edge and column 0 the western edge. each place's level is linear between readings.
+
+    get_water_level and get_water_levels are the level at a single gauge cell, the grid's centre
+    unless given, which is what is shown as the overall water level. get_local_water_levels
+    gives the level at any places
+    '''
+
+    def __init__(self, grids_filename, reading_times, west, north, cell_width, cell_height, gauge=None):
+        import numpy as np
+        self.grids = np.load(grids_filename, mmap_mode='r')
+        if ((self.grids.ndim != 3) or (self.grids.shape[0] != len(reading_times))):
+            raise ValueError(f'expected {len(reading_times)} grids in {grids_filename}, found shape {self.grids.shape}')
+        self.reading_times = [int(time) for time in reading_times]
+        if (self.reading_times != sorted(set(self.reading_times))):
+            raise ValueError('reading times must be increasing')
+        self.west = west
+        self.north = north
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+
+        if (gauge is None):
+            gauge = (north - cell_height * self.grids.shape[1] / 2, west + cell_width * self.grids.shape[2] / 2)
+        self.gauge_levels = self.get_local_levels([gauge[0]], [gauge[1]])[:, 0].tolist()
+        super().__init__(self.reading_times)
+
+    def get_water_level(self, time):
+        return interpolate(self.reading_times, self.gauge_levels, time)
+
+    def get_local_levels(self, latitudes, longitudes):
+        '''
+        return a numpy array of shape (readings, places) of the water level at each place.
+        places that are dry or off the grid are given a level of -INF
+        '''
+        import numpy as np
+        rows = np.floor((self.north - np.asarray(latitudes, dtype=float)) / self.cell_height).astype(int)
+        cols = np.floor((np.asarray(longitudes, dtype=float) - self.west) / self.cell_width).astype(int)
+        on_grid = (rows >= 0) & (rows < self.grids.shape[1]) & (cols >= 0) & (cols < self.grids.shape[2])
+        rows = np.clip(rows, 0, self.grids.shape[1] - 1)
+        cols = np.clip(cols, 0, self.grids.shape[2] - 1)
+
+        #one gather per reading, which only touches the pages holding those cells
+        levels = np.empty((len(self.reading_times), len(rows)))
+        for i in range(len(self.reading_times)):
+            levels[i] = self.grids[i][rows, cols]
+        levels[:, ~on_grid] = -INF
+        return np.nan_to_num(levels, nan=-INF)
+
+    def get_local_water_levels(self, times, latitudes, longitudes):
+        '''
+        return a numpy array of shape (times, places) of the water level at each of the given
+        times at each place, from one gather of the places' cells. each place's level is linear
+        between readings, and -INF while it is dry or off the grid
+        '''
+        import numpy as np
+        times = np.asarray(times, dtype=float)
+        reading_times = np.asarray(self.reading_times, dtype=float)
+        local_levels = self.get_local_levels(latitudes, longitudes)
+
+        #the readings either side of each time, and how far it is from the first to the second
+        after = np.minimum(np.maximum(np.searchsorted(reading_times, times, side='right'), 1), len(reading_times) - 1)
+        before = np.maximum(after - 1, 0)
+        span = np.maximum(reading_times[after] - reading_times[before], 1)
+        fraction = np.clip((times - reading_times[before]) / span, 0, 1)[:, None]
+
+        dry_before = local_levels[before] <= -INF
+        dry_after = local_levels[after] <= -INF
+        levels = (np.where(dry_before, 0, local_levels[before]) * (1 - fraction) +
+            np.where(dry_after, 0, local_levels[after]) * fraction)
+        dry = (dry_before & (fraction < 1)) | (dry_after & (fraction > 0))
+        return np.where(dry, -INF, levels)
+
+    def get_local_flooded_intervals(self, latitudes, longitudes, elevations):
+        '''
+        return the flooded intervals of places at each of the given positions and elevations
+        '''
+        local_levels = self.get_local_levels(latitudes, longitudes)
+        intervals = []
+        for i, elevation in enumerate(elevations):
+            levels = local_levels[:, i].tolist()
+            intervals.append(find_flooded_intervals(self.reading_times, levels, elevation,
+                lambda time: interpolate(self.reading_times, levels, time)))
+        return intervals
+
+
+def load_raster_flood(filename):
+    '''
+    read a RasterFlood from a json file with keys grids (a .npy file, relative to the json
+    file), times, west, north, cell_width, cell_height and optionally gauge ([lat, lon])
+    '''
+    in_fd = open(filename, 'r')
+    data = json.load(in_fd)
+    in_fd.close()
+    grids_filename = os.path.join(os.path.dirname(filename), data['grids'])
+    return RasterFlood(grids_filename, data['times'], data['west'], data['north'],
+        data['cell_width'], data['cell_height'], data.get('gauge'))
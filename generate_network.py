@@ -0,0 +1,324 @@
+import argparse
+import heapq
+import math
+import os
+import random
+
+#every route runs between these two stops, which Network always creates with these ids and
+#positions, so generated networks are laid out around them
+CHANCELLORS_PLACE = (1799, -27.497974, 153.011139)
+INDOOROOPILLY_INTERCHANGE = (2205, -27.500941, 152.971946)
+
+#generated stop ids start here, clear of the ids read_trips_file treats specially
+FIRST_STOP_ID = 100000
+FIRST_ROUTE_NUM = 600
+METRES_PER_DEGREE = 111320
+#connections are driven at this speed (m/s) before random delays
+SPEED = 30 / 3.6
+#hubs are connected to this many of their nearest stops
+HUB_CONNECTIONS = 3
+
+
+def get_distance(lat_1, lon_1, lat_2, lon_2):
+    '''
+    return the distance in metres between two nearby points
+    '''
+    x = (lon_2 - lon_1) * math.cos(math.radians((lat_1 + lat_2) / 2))
+    y = lat_2 - lat_1
+    return math.sqrt(x*x + y*y) * METRES_PER_DEGREE
+
+
+def get_elevation_sampler(rng, distribution, min_elevation, max_elevation):
+    '''
+    return a function giving random whole metre elevations between min_elevation and
+    max_elevation, either uniform or normal around the middle (clipped at the ends)
+    '''
+    if (distribution == 'uniform'):
+        return lambda: round(rng.uniform(min_elevation, max_elevation))
+    if (distribution == 'normal'):
+        mean = (min_elevation + max_elevation) / 2
+        sd = (max_elevation - min_elevation) / 6
+        return lambda: round(min(max(rng.gauss(mean, sd), min_elevation), max_elevation))
+    raise ValueError(f'unknown elevation distribution: {distribution}')
+
+
+def generate_stops(rng, num_stops):
+    '''
+    return [id, lat, lon] for num_stops stops on a jittered grid covering the area around and
+    between the two hubs. more stops make the grid denser rather than bigger
+    '''
+    west = INDOOROOPILLY_INTERCHANGE[2]
+    east = CHANCELLORS_PLACE[2]
+    margin = (east - west) * 0.2
+    west -= margin
+    east += margin
+    middle_lat = (CHANCELLORS_PLACE[1] + INDOOROOPILLY_INTERCHANGE[1]) / 2
+    #half as tall as it is wide
+    height = (east - west) / 2
+    north = middle_lat + height / 2
+
+    num_cols = max(1, round(math.sqrt(num_stops * 2)))
+    num_rows = math.ceil(num_stops / num_cols)
+    cell_width = (east - west) / num_cols
+    cell_height = height / num_rows
+
+    stops = []
+    for i in range(num_stops):
+        row = i // num_cols
+        col = i % num_cols
+        lat = north - (row + 0.5 + rng.uniform(-0.3, 0.3)) * cell_height
+        lon = west + (col + 0.5 + rng.uniform(-0.3, 0.3)) * cell_width
+        stops.append([FIRST_STOP_ID + i, round(lat, 6), round(lon, 6)])
+    return stops, num_cols
+
+
+def generate_connections(rng, stops, num_cols, diagonal_fraction=0.2, max_delay=0.5):
+    '''
+    return [stop_1_id, stop_2_id, seconds] connecting each stop to its grid neighbours, with a
+    fraction of cells also crossed diagonally, and each hub to its nearest stops. connections
+    take the time to drive their length plus a random delay of up to max_delay of that
+    '''
+    positions = {stop_id: (lat, lon) for stop_id, lat, lon in stops}
+    positions[CHANCELLORS_PLACE[0]] = CHANCELLORS_PLACE[1:]
+    positions[INDOOROOPILLY_INTERCHANGE[0]] = INDOOROOPILLY_INTERCHANGE[1:]
+
+    stop_pairs = []
+    for i in range(len(stops)):
+        col = i % num_cols
+        if ((col + 1 < num_cols) and (i + 1 < len(stops))):
+            stop_pairs.append((i, i + 1))
+        if (i + num_cols < len(stops)):
+            stop_pairs.append((i, i + num_cols))
+        if ((col + 1 < num_cols) and (i + num_cols + 1 < len(stops)) and (rng.random() < diagonal_fraction)):
+            stop_pairs.append((i, i + num_cols + 1))
+    stop_pairs = [(stops[i][0], stops[j][0]) for i, j in stop_pairs]
+
+    for hub_id, hub_lat, hub_lon in (CHANCELLORS_PLACE, INDOOROOPILLY_INTERCHANGE):
+        nearest = sorted(stops, key=lambda stop: (get_distance(hub_lat, hub_lon, stop[1], stop[2]), stop[0]))
+        for stop in nearest[:HUB_CONNECTIONS]:
+            stop_pairs.append((hub_id, stop[0]))
+
+    connections = []
+    for stop_1_id, stop_2_id in stop_pairs:
+        distance = get_distance(*positions[stop_1_id], *positions[stop_2_id])
+        seconds = max(1, round(distance / SPEED * (1 + rng.uniform(0, max_delay))))
+        connections.append([stop_1_id, stop_2_id, seconds])
+    return connections
+
+
+def get_quickest_path(neighbours, weights, start_stop_id, end_stop_id):
+    '''
+    return the stop ids on the quickest path between two stops with the given connection
+    weights, not including the start stop
+    '''
+    times = {start_stop_id: 0}
+    parents = dict()
+    node_list = [(0, start_stop_id)]
+    while (len(node_list) > 0):
+        time, stop_id = heapq.heappop(node_list)
+        if (stop_id == end_stop_id):
+            break
+        if (time > times[stop_id]):
+            continue
+        for next_stop_id in neighbours[stop_id]:
+            next_time = time + weights[frozenset((stop_id, next_stop_id))]
+            if (next_time < times.get(next_stop_id, math.inf)):
+                times[next_stop_id] = next_time
+                parents[next_stop_id] = stop_id
+                heapq.heappush(node_list, (next_time, next_stop_id))
+
+    path = []
+    stop_id = end_stop_id
+    while (stop_id != start_stop_id):
+        path.append(stop_id)
+        stop_id = parents[stop_id]
+    path.reverse()
+    return path
+
+
+def generate_routes(rng, stops, connections, num_routes, stops_per_route, max_detour=2.0):
+    '''
+    return a list of (route_num, required stop ids) for routes from chancellors place to
+    indooroopilly. like the real routes, each follows roads through the network via a random
+    stop between the hubs: the quickest path there and on to indooroopilly when every
+    connection is slowed by a random factor of up to max_detour. the required stops are spread
+    evenly along it, in order
+    '''
+    neighbours = dict()
+    for stop_1_id, stop_2_id, seconds in connections:
+        neighbours.setdefault(stop_1_id, []).append(stop_2_id)
+        neighbours.setdefault(stop_2_id, []).append(stop_1_id)
+    between = [stop_id for stop_id, lat, lon in stops if (INDOOROOPILLY_INTERCHANGE[2] < lon < CHANCELLORS_PLACE[2])]
+    if (len(between) == 0):
+        between = [stop_id for stop_id, lat, lon in stops]
+
+    routes = []
+    for i in range(num_routes):
+        weights = dict()
+        for stop_1_id, stop_2_id, seconds in connections:
+            weights[frozenset((stop_1_id, stop_2_id))] = seconds * rng.uniform(1, max_detour)
+        waypoint_id = rng.choice(between)
+        path = get_quickest_path(neighbours, weights, CHANCELLORS_PLACE[0], waypoint_id)
+        #avoid coming back the way the route went
+        for j in range(len(path)):
+            previous_stop_id = path[j-1] if (j > 0) else CHANCELLORS_PLACE[0]
+            weights[frozenset((previous_stop_id, path[j]))] *= 10
+        path += get_quickest_path(neighbours, weights, waypoint_id, INDOOROOPILLY_INTERCHANGE[0])
+        path = [stop_id for stop_id in dict.fromkeys(path) if (stop_id != INDOOROOPILLY_INTERCHANGE[0])]
+
+        num_required = min(stops_per_route, len(path))
+        required_stops = [path[(j * len(path)) // num_required] for j in range(num_required)]
+        routes.append((FIRST_ROUTE_NUM + i, required_stops))
+    return routes
+
+
+def generate_departures(rng, routes, departures_per_route, headway):
+    '''
+    return (seconds, route_num) for every departure, in order. each route leaves every headway
+    seconds, starting at a random time within the first headway
+    '''
+    departures = []
+    for route_num, required_stops in routes:
+        first_departure = rng.randrange(headway)
+        for i in range(departures_per_route):
+            departures.append((first_departure + i * headway, route_num))
+    departures.sort()
+    return departures
+
+
+def generate_trips(rng, routes, trips_per_route):
+    '''
+    return [route_num, origin id, destination id, quantity] for up to trips_per_route distinct
+    trips along each route. quantities are monthly trip counts as in data/trips.csv
+    '''
+    trips = []
+    for route_num, required_stops in routes:
+        route_stops = [CHANCELLORS_PLACE[0]] + required_stops + [INDOOROOPILLY_INTERCHANGE[0]]
+        stop_pairs = [(i, j) for i in range(len(route_stops) - 1) for j in range(i + 1, len(route_stops))]
+        for i, j in sorted(rng.sample(stop_pairs, min(trips_per_route, len(stop_pairs)))):
+            trips.append([route_num, route_stops[i], route_stops[j], rng.randint(1, 60)])
+    return trips
+
+
+def get_clock_time(seconds):
+    '''
+    return the time of day a number of seconds after 3:00 PM, as in the data files
+    '''
+    minutes = (15*60 + seconds // 60) % (24*60)
+    hours = minutes // 60
+    return f'{(hours - 1) % 12 + 1}:{minutes % 60:02d} {"AM" if (hours < 12) else "PM"}'
+
+
+def write_lines(filename, lines):
+    out_fd = open(filename, 'w')
+    out_fd.writelines(lines)
+    out_fd.close()
+
+
+def generate_network(output_dir, num_stops=500, num_routes=8, stops_per_route=12, departures_per_route=10,
+        headway=15*60, trips_per_route=40, elevation_distribution='normal', min_elevation=5, max_elevation=45, seed=0):
+    '''
+    write a synthetic network to output_dir/data in the format of the files in data/, so it can
+    be simulated by running main.py (or any of the other scripts) from output_dir. every stop
+    and connection has an elevation, so nothing is looked up. the same arguments always write
+    the same files
+    '''
+    rng = random.Random(seed)
+    stops, num_cols = generate_stops(rng, num_stops)
+    connections = generate_connections(rng, stops, num_cols)
+    routes = generate_routes(rng, stops, connections, num_routes, stops_per_route)
+    departures = generate_departures(rng, routes, departures_per_route, headway)
+    trips = generate_trips(rng, routes, trips_per_route)
+    sample_elevation = get_elevation_sampler(rng, elevation_distribution, min_elevation, max_elevation)
+
+    #hubs are kept at the highest elevation so the flood never cuts off both ends of every route
+    stop_elevations = {CHANCELLORS_PLACE[0]: max_elevation, INDOOROOPILLY_INTERCHANGE[0]: max_elevation}
+    for stop_id, lat, lon in stops:
+        stop_elevations[stop_id] = sample_elevation()
+    #roads run between their stops, so are at about the same height
+    connection_elevations = dict()
+    for stop_1_id, stop_2_id, seconds in connections:
+        elevation = round((stop_elevations[stop_1_id] + stop_elevations[stop_2_id]) / 2 + rng.uniform(-2, 2))
+        connection_elevations[(stop_1_id, stop_2_id)] = min(max(elevation, min_elevation), max_elevation)
+    write_network(output_dir, stops, connections, routes, departures, trips, stop_elevations, connection_elevations)
+
+
+def write_network(output_dir, stops, connections, routes, departures, trips, stop_elevations, connection_elevations):
+    '''
+    write a network to output_dir/data in the format of the files in data/. stops, connections,
+    routes, departures and trips are as returned by the generate_ functions, stop_elevations
+    maps stop ids (including the hubs) to elevations and connection_elevations maps
+    (stop_1_id, stop_2_id) of each connection to its elevation
+    '''
+    data_dir = os.path.join(output_dir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    for filename in os.listdir(data_dir):
+        #route files from an earlier run with more routes would be read as routes
+        if (filename.startswith('route_') and filename.endswith('.csv')):
+            os.remove(os.path.join(data_dir, filename))
+
+    positions = {stop_id: (lat, lon) for stop_id, lat, lon in stops}
+    positions[CHANCELLORS_PLACE[0]] = CHANCELLORS_PLACE[1:]
+    positions[INDOOROOPILLY_INTERCHANGE[0]] = INDOOROOPILLY_INTERCHANGE[1:]
+    names = {stop_id: f'Generated Stop {stop_id}' for stop_id, lat, lon in stops}
+    names[CHANCELLORS_PLACE[0]] = 'UQ Chancellors Place'
+    names[INDOOROOPILLY_INTERCHANGE[0]] = 'Indooroopilly Shopping Center'
+
+    write_lines(os.path.join(data_dir, 'stops.csv'), [f'{stop_id},{names[stop_id]},{lat},{lon}\n' for stop_id, lat, lon in stops])
+
+    #one line per stop listing its neighbours, under a header line
+    neighbours = dict()
+    for stop_1_id, stop_2_id, seconds in connections:
+        neighbours.setdefault(stop_1_id, []).append(f'{stop_2_id}:{seconds}')
+    write_lines(os.path.join(data_dir, 'connections.csv'), ['stop,connections\n'] +
+        [f'{stop_id},{",".join(stop_neighbours)}\n' for stop_id, stop_neighbours in neighbours.items()])
+
+    #the first line of a route file is its origin and the last its destination
+    for route_num, required_stops in routes:
+        route_stops = [CHANCELLORS_PLACE[0]] + required_stops + [INDOOROOPILLY_INTERCHANGE[0]]
+        lines = []
+        seconds = 0
+        for i, stop_id in enumerate(route_stops):
+            #minutes from the previous stop, written as decimal minutes then as m:ss
+            minutes = 0
+            if (i > 0):
+                minutes = round(get_distance(*positions[route_stops[i-1]], *positions[stop_id]) / SPEED / 60, 1)
+            seconds += round(minutes * 60)
+            lines.append(f'{stop_id},{names[stop_id]},{get_clock_time(seconds)},{minutes},{round(minutes * 60) // 60}:{round(minutes * 60) % 60:02d}\n')
+        write_lines(os.path.join(data_dir, f'route_{route_num}.csv'), lines)
+
+    lines = ['time_since_last, departure_time, route_num\n']
+    previous_departure = 0
+    for seconds, route_num in departures:
+        time_since_last = seconds - previous_departure
+        previous_departure = seconds
+        lines.append(f'{time_since_last // 60}:{time_since_last % 60:02d},{get_clock_time(seconds)},{route_num}\n')
+    write_lines(os.path.join(data_dir, 'departure_times.csv'), lines)
+
+    write_lines(os.path.join(data_dir, 'trips.csv'), ['route,ticket_type,origin_stop,destination_stop,quantity\n'] +
+        [f'{route_num},go card,{origin_stop_id},{dest_stop_id},{quantity}\n' for route_num, origin_stop_id, dest_stop_id, quantity in trips])
+
+    write_lines(os.path.join(data_dir, 'stop_elevations.csv'),
+        [f'{stop_id},{elevation}\n' for stop_id, elevation in stop_elevations.items()])
+    write_lines(os.path.join(data_dir, 'connection_elevations.csv'),
+        [f'{stop_1_id},{stop_2_id},{elevation}\n' for (stop_1_id, stop_2_id), elevation in connection_elevations.items()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='write a synthetic network in the format of data/ for testing at scale')
+    parser.add_argument('--output_dir', help='directory to write data/ into, run the simulation from here', default='generated')
+    parser.add_argument('--num_stops', help='number of stops, not counting the two hubs', type=int, default=500)
+    parser.add_argument('--num_routes', help='number of routes', type=int, default=8)
+    parser.add_argument('--stops_per_route', help='number of required stops on each route', type=int, default=12)
+    parser.add_argument('--departures_per_route', help='number of departures of each route', type=int, default=10)
+    parser.add_argument('--headway', help='seconds between departures of a route', type=int, default=15*60)
+    parser.add_argument('--trips_per_route', help='number of distinct (origin, destination) trips on each route', type=int, default=40)
+    parser.add_argument('--elevation_distribution', help='distribution of stop elevations', choices=['normal', 'uniform'], default='normal')
+    parser.add_argument('--min_elevation', help='lowest stop elevation in metres', type=float, default=5)
+    parser.add_argument('--max_elevation', help='highest stop elevation in metres', type=float, default=45)
+    parser.add_argument('--seed', help='random seed, the same seed and arguments give the same files', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_network(args.output_dir, args.num_stops, args.num_routes, args.stops_per_route, args.departures_per_route,
+        args.headway, args.trips_per_route, args.elevation_distribution, args.min_elevation, args.max_elevation, args.seed)
+    print(f'wrote {args.num_stops} stops and {args.num_routes} routes to {os.path.join(args.output_dir, "data")}')
@@ -0,0 +1,163 @@
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+#functions and allocation sites kept per phase when profiling or tracing memory
+TOP_N = 20
+
+
+class Instrumentation():
+    '''
+    counters, timers and per tick series for a run, given to NetworkController when it is
+    built. the controller and its search only record anything when they have one, so runs
+    without it pay for little more than a None check.
+
+    counters are totals over the run, such as nodes expanded or walk searches pruned by the
+    time budget. timers hold the count, total and longest of a timed operation. each walk
+    search and each tick is also recorded, so a stall can be traced to the searches behind it.
+
+    phases (start up, the simulation) can also be profiled with cProfile and have their
+    memory traced with tracemalloc, which slow the run down a lot so are off unless asked for
+    '''
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.counters = dict()
+        #name -> [count, total seconds, longest seconds]
+        self.timers = dict()
+        self.phases = dict()
+        self.searches = []
+        self.ticks = []
+        #counters at the last tick, so each tick records what changed during it
+        self.last_tick_counters = dict()
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds):
+        if (not (name in self.timers)):
+            self.timers[name] = [0, 0.0, 0.0]
+        timer = self.timers[name]
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+    def record_search(self, search):
+        '''
+        record a walk search, a dict of its route, start time, result and counters
+        '''
+        self.searches.append(search)
+        self.add_time('optimal_walk_search', search['seconds'])
+        for name in ('nodes_expanded', 'nodes_generated', 'pruned_time_budget', 'pruned_edge_reuse',
+                'pruned_flooded', 'pruned_dominated', 'nodes_set_aside', 'stale_nodes'):
+            self.count(name, search[name])
+        self.counters['max_frontier'] = max(self.counters.get('max_frontier', 0), search['max_frontier'])
+
+    def record_tick(self, time, water_level, seconds, bus_seconds):
+        '''
+        record a tick of the simulation at the given simulated time that took the given wall
+        clock seconds, bus_seconds being the time taken by each bus's update
+        '''
+        self.add_time('tick', seconds)
+        for bus_update_seconds in bus_seconds:
+            self.add_time('bus_update', bus_update_seconds)
+        tick = {
+            'time': time,
+            'water_level': water_level,
+            'seconds': seconds,
+            'max_bus_update_seconds': max(bus_seconds, default=0.0),
+        }
+        #what the counters changed by during the tick
+        for name in ('searches', 'nodes_expanded', 'walk_reuses', 'walk_cache_hits', 'reroute_schedule_hits'):
+            value = self.counters.get(name, 0)
+            tick[name] = value - self.last_tick_counters.get(name, 0)
+            self.last_tick_counters[name] = value
+        if (self.trace_memory and tracemalloc.is_tracing()):
+            tick['memory_bytes'] = tracemalloc.get_traced_memory()[0]
+        self.ticks.append(tick)
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        time the code run inside the with block as the named phase, profiling it and tracing
+        its memory if asked for
+        '''
+        profiler = None
+        if (self.profile):
+            profiler = cProfile.Profile()
+        if (self.trace_memory):
+            #left on after the phase, so later ticks can report memory
+            if (not tracemalloc.is_tracing()):
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        start = perf_counter()
+        if (profiler is not None):
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if (profiler is not None):
+                profiler.disable()
+            phase = {'seconds': perf_counter() - start}
+            if (profiler is not None):
+                phase['profile'] = get_top_functions(profiler)
+            if (self.trace_memory):
+                memory, peak_memory = tracemalloc.get_traced_memory()
+                phase['memory_bytes'] = memory - start_memory
+                phase['peak_memory_bytes'] = peak_memory - start_memory
+                phase['top_allocations'] = get_top_allocations(tracemalloc.take_snapshot())
+            self.phases[name] = phase
+
+    def get_report(self, controller=None):
+        '''
+        return the run's counters, timers, phases, searches and ticks as a dict that can be
+        written as json. the controller's walk cache hits and misses are added if it is given
+        '''
+        counters = dict(self.counters)
+        if (controller is not None):
+            counters['walk_cache_hits'] = controller.cached_optimal_walks.hits
+            counters['walk_cache_misses'] = controller.cached_optimal_walks.misses
+        timers = dict()
+        for name, (count, seconds, max_seconds) in self.timers.items():
+            timers[name] = {'count': count, 'seconds': seconds, 'max_seconds': max_seconds,
+                'mean_seconds': seconds / count}
+        return {
+            'counters': counters,
+            'timers': timers,
+            'phases': self.phases,
+            'searches': self.searches,
+            'ticks': self.ticks,
+        }
+
+
+def get_top_functions(profiler):
+    '''
+    return the TOP_N functions the profiler spent the most cumulative time in
+    '''
+    stats = pstats.Stats(profiler)
+    functions = []
+    for (filename, line, function_name), (primitive_calls, calls, total_seconds, cumulative_seconds, callers) in stats.stats.items():
+        functions.append({
+            'function': f'{filename}:{line}({function_name})',
+            'calls': calls,
+            'total_seconds': total_seconds,
+            'cumulative_seconds': cumulative_seconds,
+        })
+    functions.sort(key=lambda function: function['cumulative_seconds'], reverse=True)
+    return functions[:TOP_N]
+
+
+def get_top_allocations(snapshot):
+    '''
+    return the TOP_N lines holding the most memory in a tracemalloc snapshot
+    '''
+    allocations = []
+    for statistic in snapshot.statistics('lineno')[:TOP_N]:
+        frame = statistic.traceback[0]
+        allocations.append({'line': f'{frame.filename}:{frame.lineno}', 'bytes': statistic.size, 'blocks': statistic.count})
+    return allocations
@@ -1,8 +1,18 @@
 import argparse
+import csv
+import json
+import sys
 from transport_graph import Network
-from simulation_gui import SimulationGUI
 from controller import NetworkController
-from time import sleep
+from event_engine import EventEngine
+from flood_model import HydrographFlood, load_raster_flood
+from reroute_schedule import load_reroute_schedule
+from utils import read_hydrograph_file, set_elevation_provider
+from elevation_provider import load_dem
+from snapshot import build_snapshot, load_snapshot
+from instrumentation import Instrumentation
+from walk_cache import WalkCache
+from time import sleep, perf_counter
 
 def show_walks_for_routes(controller):
     for route in controller.prev_optimal_walks.keys():
@@ -31,18 +41,205 @@ def show_sorted_elevations(network):
 
     
 
+def run_headless(controller, event_driven=False, fleet=False):
+    '''
+    run the simulation to completion without the gui or any pauses, returning the seconds it took
+    '''
+    start = perf_counter()
+    if (event_driven):
+        EventEngine(controller).run()
+        controller.cache_optimum_walks()
+    elif (fleet):
+        from fleet_engine import FleetEngine
+        FleetEngine(controller).run()
+        controller.cache_optimum_walks()
+    else:
+        while (not controller.is_complete(print_stats=False)):
+            controller.update()
+    return perf_counter() - start
+
+def get_results(controller, timings):
+    '''
+    return a dict of passenger stats, each route's final walk as a list of stop id pairs
+    and the seconds spent in each phase
+    '''
+    results = controller.get_stats()
+    walks = dict()
+    for route, walk in controller.prev_optimal_walks.items():
+        if (walk is None):
+            walks[route.route_num] = None
+        else:
+            walks[route.route_num] = [[connection.stop_1.id, connection.stop_2.id] for connection in walk]
+    results['walks'] = walks
+    results['timings'] = timings
+    return results
+
+def write_results(results, filename=None):
+    '''
+    write results as json, or as a single csv row if the filename ends in .csv.
+    in the csv, walks become one column per route of the form stop_id-stop_id;stop_id-stop_id...
+    and timings one column per phase. with no filename the json is printed
+    '''
+    if (filename is None):
+        print(json.dumps(results, indent=4))
+        return
+    if (not filename.endswith('.csv')):
+        out_fd = open(filename, 'w')
+        json.dump(results, out_fd, indent=4)
+        out_fd.close()
+        return
+
+    row = dict()
+    for key, value in results.items():
+        if (key == 'walks'):
+            for route_num, walk in value.items():
+                if (walk is None):
+                    row[f'walk_{route_num}'] = ''
+                else:
+                    row[f'walk_{route_num}'] = ';'.join(f'{stop_1_id}-{stop_2_id}' for stop_1_id, stop_2_id in walk)
+        elif (key == 'timings'):
+            for phase, seconds in value.items():
+                row[f'{phase}_seconds'] = seconds
+        else:
+            row[key] = value
+    out_fd = open(filename, 'w', newline='')
+    writer = csv.DictWriter(out_fd, fieldnames=list(row.keys()))
+    writer.writeheader()
+    writer.writerow(row)
+    out_fd.close()
+
+def write_report(report, filename=None, print_fd=None):
+    '''
+    write the instrumentation report as json, printing it to print_fd (stdout if not given) if
+    no filename is given
+    '''
+    if (filename is None):
+        print(json.dumps(report, indent=4), file=(print_fd or sys.stdout))
+        return
+    out_fd = open(filename, 'w')
+    json.dump(report, out_fd, indent=4)
+    out_fd.close()
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--disaster_resistant', help='disaster resistant?', action='store_true')
+    parser.add_argument('--reroute_schedule', help='precomputed reroute schedule file (see reroute_schedule.py)', default=None)
+    parser.add_argument('--event_driven', help='process timestamped events rather than updating every bus each tick', action='store_true')
+    parser.add_argument('--fleet', help='keep bus state in numpy arrays and advance every bus in one pass each tick (see fleet_engine.py)', action='store_true')
+    parser.add_argument('--headless', help='run without the gui or pauses and write machine readable results', action='store_true')
+    parser.add_argument('--output', help='headless results file, csv if it ends in .csv otherwise json (printed if not given)', default=None)
+    parser.add_argument('--seconds_per_tick', help='simulated seconds per tick', type=int, default=5)
+    parser.add_argument('--hydrograph', help='csv of seconds, water level readings to flood with rather than a steady rise', default=None)
+    parser.add_argument('--dem', help='elevation model (.tif, or json describing a .npy) to look up elevations offline (see elevation_provider.py)', default=None)
+    parser.add_argument('--aggregate_demand', help='keep passengers as counts rather than one object each, for large demand', action='store_true')
+    parser.add_argument('--snapshot', help='start from this snapshot (see snapshot.py), building it if it is missing or out of date', default=None)
+    parser.add_argument('--flood_raster', help='json describing memory mapped grids of local water levels (see flood_model.RasterFlood)', default=None)
+    parser.add_argument('--walk_cache', help='json file of searched walks to reuse, updated with new searches at the end of the run', default=None)
+    parser.add_argument('--walk_cache_size', help='most flood epochs and routes to keep walks for in the walk cache', type=int, default=128)
+    parser.add_argument('--heuristic', help='walk search heuristic, the time to the furthest unvisited required stop then indooroopilly, or the time to indooroopilly alone', choices=['furthest_stop', 'interchange'], default='furthest_stop')
+    parser.add_argument('--max_state_nodes', help='search from at most this many walks to each stop and set of required stops at once, for large networks (the rest are only searched if no walk is found without them)', type=int, default=None)
+    parser.add_argument('--instrument', help='count search nodes, prunes and cache hits and time each search, tick and bus update (see instrumentation.py)', action='store_true')
+    parser.add_argument('--profile', help='profile each phase with cProfile, implies --instrument', action='store_true')
+    parser.add_argument('--trace_memory', help='trace memory of each phase and tick with tracemalloc, implies --instrument', action='store_true')
+    parser.add_argument('--report', help='json file to write the instrumentation report to (printed if not given, to stderr when headless)', default=None)
     args = parser.parse_args()
-    network = Network(disaster_resistant=args.disaster_resistant)
-    gui = SimulationGUI(network)
-    controller = NetworkController(network, disaster_resistant=args.disaster_resistant, seconds_per_tick=5)
+
+    instrumentation = None
+    if (args.instrument or args.profile or args.trace_memory):
+        instrumentation = Instrumentation(profile=args.profile, trace_memory=args.trace_memory)
+
+    if (args.dem is not None):
+        set_elevation_provider(load_dem(args.dem))
+
+    flood_model = None
+    if (args.hydrograph is not None):
+        flood_model = HydrographFlood(read_hydrograph_file(args.hydrograph))
+    elif (args.flood_raster is not None):
+        flood_model = load_raster_flood(args.flood_raster)
+
+    timings = dict()
+    snapshot = None
+    if (args.snapshot is not None):
+        start = perf_counter()
+        snapshot = load_snapshot(args.snapshot, args.disaster_resistant)
+        if ((snapshot is None) and (flood_model is None)):
+            print(f'Building snapshot: {args.snapshot}', file=sys.stderr)
+            snapshot = build_snapshot(args.snapshot, args.disaster_resistant)
+        timings['snapshot'] = perf_counter() - start
+
+    if (snapshot is None):
+        start = perf_counter()
+        network = Network(disaster_resistant=args.disaster_resistant, aggregate_demand=args.aggregate_demand)
+        timings['network'] = perf_counter() - start
+    else:
+        network = snapshot[0]
+        if (network.aggregate_demand != args.aggregate_demand):
+            network.aggregate_demand = args.aggregate_demand
+            network.reset_simulation()
+    if (not args.headless):
+        #imported here so headless runs don't need tkinter
+        from simulation_gui import SimulationGUI
+        gui = SimulationGUI(network)
+    reroute_schedule = None
+    if (args.reroute_schedule is not None):
+        reroute_schedule = load_reroute_schedule(network, args.reroute_schedule)
+
+    if ((snapshot is not None) and (flood_model is None)):
+        #the snapshot's controller was built for the default flood
+        controller = snapshot[1]
+        controller.seconds_per_tick = args.seconds_per_tick
+        controller.max_state_nodes = args.max_state_nodes
+        controller.heuristic = args.heuristic
+        controller.instrumentation = instrumentation
+        if (args.walk_cache is not None):
+            controller.cached_optimal_walks = WalkCache(network, args.walk_cache_size, args.walk_cache)
+        controller.set_reroute_schedule(reroute_schedule)
+    else:
+        shortest_paths = None
+        if (snapshot is not None):
+            shortest_paths = snapshot[1].shortest_paths
+        start = perf_counter()
+        controller = NetworkController(network, disaster_resistant=args.disaster_resistant, seconds_per_tick=args.seconds_per_tick,
+            reroute_schedule=reroute_schedule, flood_model=flood_model, shortest_paths=shortest_paths,
+            walk_cache_size=args.walk_cache_size, walk_cache_filename=args.walk_cache, instrumentation=instrumentation,
+            max_state_nodes=args.max_state_nodes, heuristic=args.heuristic)
+        timings['controller'] = perf_counter() - start
+        timings.update(controller.timings)
+
+    if (args.headless):
+        with controller.get_phase('simulation'):
+            timings['simulation'] = run_headless(controller, args.event_driven, args.fleet)
+        write_results(get_results(controller, timings), args.output)
+        if (instrumentation is not None):
+            #stdout only has the results, so they can be read as json
+            write_report(instrumentation.get_report(controller), args.report, sys.stderr)
+        sys.exit(0)
 
     input('Press enter to start...')
-    while (not controller.is_complete()):
-        controller.update()
-        gui.update(controller.current_water_level, controller.current_time)
-        sleep(0.05)
+    if (args.event_driven):
+        #buses are drawn at the last stop they visited
+        engine = EventEngine(controller)
+        while (not engine.is_complete()):
+            engine.run_until(controller.current_time + controller.seconds_per_tick)
+            gui.update(controller.current_water_level, controller.current_time)
+            sleep(0.05)
+        controller.print_stats()
+        controller.cache_optimum_walks()
+    elif (args.fleet):
+        from fleet_engine import FleetEngine
+        engine = FleetEngine(controller)
+        while (not engine.is_complete()):
+            engine.update()
+            gui.update(controller.current_water_level, controller.current_time, engine)
+            sleep(0.05)
+        controller.print_stats()
+        controller.cache_optimum_walks()
+    else:
+        while (not controller.is_complete()):
+            controller.update()
+            gui.update(controller.current_water_level, controller.current_time)
+            sleep(0.05)
+    if (instrumentation is not None):
+        write_report(instrumentation.get_report(controller), args.report)
     
-    input('Press enter to exit')
\ No newline at end of file
+    input('Press enter to exit')
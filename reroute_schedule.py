@@ -0,0 +1,220 @@
+import argparse
+import bisect
+import json
+import os
+from multiprocessing import Pool
+
+from shortest_paths import INF
+
+REROUTE_SCHEDULE_VERSION = 2
+
+#controller shared with worker processes, set by init_worker
+worker_controller = None
+
+
+class RerouteSchedule():
+    '''
+    precomputed walks for every route over every flood epoch, so the controller can look up a
+    reroute rather than searching for it while the simulation is running.
+
+    walks[route_num] is a list of [start time, latest departure time, walk] sorted by start time.
+    the walk was searched at the start time and is optimal for any departure up to its latest
+    departure time. walk is a list of connections or None if the route can't run.
+    '''
+
+    def __init__(self, flood_fingerprint, disaster_resistant, walks, max_state_nodes=None):
+        self.flood_fingerprint = flood_fingerprint
+        self.disaster_resistant = disaster_resistant
+        self.walks = walks
+        #the controller's limit on the walk search when the schedule was built
+        self.max_state_nodes = max_state_nodes
+
+    def get_walk(self, route, time):
+        '''
+        return (True, walk) for the route departing at the given time, or (False, None) if the
+        schedule doesn't cover it
+        '''
+        for start_time, latest_departure, walk in self.walks.get(route.route_num, []):
+            if (start_time > time):
+                break
+            if (time <= latest_departure):
+                return True, walk
+        return False, None
+
+    def matches(self, controller):
+        '''
+        return True if the schedule was built for the controller's network, flood, mode and
+        search limit
+        '''
+        return ((self.flood_fingerprint == controller.flood_fingerprint) and
+            (self.disaster_resistant == controller.distaster_resistant) and
+            (self.max_state_nodes == controller.max_state_nodes))
+
+    def save(self, filename):
+        '''
+        write the schedule to file, with walks stored as pairs of stop ids
+        '''
+        saved_walks = dict()
+        for route_num, entries in self.walks.items():
+            saved_entries = []
+            for start_time, latest_departure, walk in entries:
+                if (walk is not None):
+                    walk = [[connection.stop_1.id, connection.stop_2.id] for connection in walk]
+                saved_entries.append([start_time, latest_departure, walk])
+            saved_walks[str(route_num)] = saved_entries
+
+        temp_filename = f'{filename}.tmp'
+        out_fd = open(temp_filename, 'w')
+        json.dump({
+            'version': REROUTE_SCHEDULE_VERSION,
+            'flood_fingerprint': self.flood_fingerprint,
+            'disaster_resistant': self.disaster_resistant,
+            'max_state_nodes': self.max_state_nodes,
+            'walks': saved_walks,
+        }, out_fd)
+        out_fd.close()
+        os.replace(temp_filename, filename)
+
+
+def load_reroute_schedule(network, filename):
+    '''
+    read a schedule from file and match its walks to the network's connections.
+    returns None if the file is from a different version or has connections the network lacks
+    '''
+    in_fd = open(filename, 'r')
+    data = json.load(in_fd)
+    in_fd.close()
+    if (data.get('version') != REROUTE_SCHEDULE_VERSION):
+        print(f'Ignoring reroute schedule from a different version: {filename}')
+        return None
+
+    walks = dict()
+    for route_num, saved_entries in data['walks'].items():
+        entries = []
+        for start_time, latest_departure, saved_walk in saved_entries:
+            walk = None
+            if (saved_walk is not None):
+                walk = []
+                for stop_1_id, stop_2_id in saved_walk:
+                    connection = network.get_connection(network.stops_by_id.get(stop_1_id),
+                        network.stops_by_id.get(stop_2_id))
+                    if (connection is None):
+                        print(f'Ignoring reroute schedule for a different network: {filename}')
+                        return None
+                    walk.append(connection)
+            entries.append([start_time, latest_departure, walk])
+        walks[int(route_num)] = entries
+    return RerouteSchedule(data['flood_fingerprint'], data['disaster_resistant'], walks, data['max_state_nodes'])
+
+
+def get_epochs(controller):
+    '''
+    return a list of (start time, end time) for the epochs between steps closing or reopening.
+    the last epoch runs until INF, after which the water no longer changes
+    '''
+    start_times = [0] + [closure_time for closure_time in controller.closure_epochs if (closure_time > 0)]
+    end_times = start_times[1:] + [INF]
+    return list(zip(start_times, end_times))
+
+
+def init_worker(controller):
+    global worker_controller
+    worker_controller = controller
+
+
+def search_epoch(route_num, start_time, end_time):
+    '''
+    find walks covering every departure in [start_time, end_time) for the given route.
+    a walk found at some time is reused until the same latest departure as the controller would
+    reuse it (see NetworkController.get_searched_walk_latest_departure), so when that falls
+    inside the epoch the search is repeated from the first departure it no longer covers. a
+    search may only hold for the departure it was made for, such as shortly before the water
+    recedes, so then only the route's timetabled departures are searched until the recession,
+    and the controller searches for any others.
+
+    walks are returned as pairs of stop ids, as connections can't be shared between processes
+    '''
+    controller = worker_controller
+    route = controller.network.get_route(route_num)
+    departure_times = sorted(set(bus.departure_time for bus in controller.network.buses if (bus.route == route)))
+    entries = []
+    time = start_time
+    while (time < end_time):
+        walk = controller.optimal_walk_search(route, time, trail=True)
+        #reused for the same departures as the controller would, but always covering the one it was searched for
+        latest_departure = max(time, controller.get_searched_walk_latest_departure(route, walk, time))
+        if (walk is not None):
+            walk = [[connection.stop_1.id, connection.stop_2.id] for connection in walk]
+        entries.append([time, latest_departure, walk])
+        if (entries[-1][1] >= INF):
+            break
+        time = entries[-1][1] + 1
+        if (entries[-1][1] == entries[-1][0]):
+            #skip to the next timetabled departure, or the recession if that comes first
+            i = bisect.bisect_left(departure_times, time)
+            next_departure = departure_times[i] if (i < len(departure_times)) else INF
+            time = max(time, min(next_departure, controller.get_next_recession_time(time - 1)))
+    return route_num, entries
+
+
+def build_reroute_schedule(controller, processes=None):
+    '''
+    search every (route, epoch) pair in a process pool and return the resulting schedule
+    '''
+    jobs = []
+    for route in controller.network.routes:
+        for start_time, end_time in get_epochs(controller):
+            jobs.append((route.route_num, start_time, end_time))
+
+    with Pool(processes, initializer=init_worker, initargs=(controller,)) as pool:
+        results = pool.starmap(search_epoch, jobs)
+
+    network = controller.network
+    walks = dict()
+    for route_num, entries in results:
+        for start_time, latest_departure, saved_walk in entries:
+            walk = None
+            if (saved_walk is not None):
+                walk = [network.get_connection(network.stops_by_id[stop_1_id], network.stops_by_id[stop_2_id])
+                    for stop_1_id, stop_2_id in saved_walk]
+            walks.setdefault(route_num, []).append([start_time, latest_departure, walk])
+
+    #epochs overlap where a walk outlasts its epoch, so drop entries an earlier walk already covers
+    for route_num, entries in walks.items():
+        entries.sort(key=lambda entry: entry[0])
+        kept_entries = []
+        for entry in entries:
+            if ((len(kept_entries) > 0) and (entry[1] <= kept_entries[-1][1])):
+                continue
+            kept_entries.append(entry)
+        walks[route_num] = kept_entries
+    return RerouteSchedule(controller.flood_fingerprint, controller.distaster_resistant, walks, controller.max_state_nodes)
+
+
+if __name__ == '__main__':
+    from transport_graph import Network
+    from controller import NetworkController
+    from flood_model import HydrographFlood, load_raster_flood
+    from utils import read_hydrograph_file
+
+    parser = argparse.ArgumentParser(description='precompute every route\'s walk for every flood epoch')
+    parser.add_argument('--disaster_resistant', help='disaster resistant?', action='store_true')
+    parser.add_argument('--output', help='schedule file to write', default='data/reroute_schedule.json')
+    parser.add_argument('--processes', help='number of worker processes', type=int, default=None)
+    parser.add_argument('--hydrograph', help='csv of seconds, water level readings to flood with', default=None)
+    parser.add_argument('--flood_raster', help='json describing memory mapped grids of local water levels (see flood_model.RasterFlood)', default=None)
+    parser.add_argument('--max_state_nodes', help='search from at most this many walks to each stop and set of required stops at once, for large networks (give main.py the same)', type=int, default=None)
+    args = parser.parse_args()
+
+    flood_model = None
+    if (args.hydrograph is not None):
+        flood_model = HydrographFlood(read_hydrograph_file(args.hydrograph))
+    elif (args.flood_raster is not None):
+        flood_model = load_raster_flood(args.flood_raster)
+    network = Network(disaster_resistant=args.disaster_resistant)
+    controller = NetworkController(network, disaster_resistant=args.disaster_resistant, flood_model=flood_model,
+        max_state_nodes=args.max_state_nodes)
+    schedule = build_reroute_schedule(controller, args.processes)
+    schedule.save(args.output)
+    num_walks = sum(len(entries) for entries in schedule.walks.values())
+    print(f'{num_walks} walks over {len(get_epochs(controller))} epochs written to {args.output}')
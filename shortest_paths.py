@@ -0,0 +1,116 @@
+import heapq
+
+#time given to stops that can't be reached from the source stop
+INF = 10e8
+
+
+class ShortestPaths(dict):
+    '''
+    minimum travel time between stops, indexed as shortest_paths[stop_a][stop_b].
+
+    stops are numbered by their position in the stop list so searches run over
+    integer indices rather than stop objects. a row is filled in with djikstras
+    the first time its source stop is looked up, or every row at once with
+    fill_all_pairs.
+    '''
+
+    def __init__(self, stops, connections):
+        super().__init__()
+        self.stops = list(stops)
+        self.stop_index = dict()
+        for i, stop in enumerate(self.stops):
+            self.stop_index[stop] = i
+
+        #adjacency[i] is a list of (neighbour index, connection time)
+        self.adjacency = [[] for stop in self.stops]
+        for connection in connections:
+            index_1 = self.stop_index.get(connection.stop_1)
+            index_2 = self.stop_index.get(connection.stop_2)
+            if ((index_1 is None) or (index_2 is None)):
+                continue
+            self.adjacency[index_1].append((index_2, connection.time))
+            self.adjacency[index_2].append((index_1, connection.time))
+
+    def __missing__(self, source_stop):
+        return self.add_source(source_stop)
+
+    def add_source(self, source_stop):
+        '''
+        run djikstras from the given stop and store its row
+        '''
+        row = self.row_from_times(self.djikstra(self.stop_index[source_stop]))
+        self[source_stop] = row
+        return row
+
+    def djikstra(self, source):
+        '''
+        return a list of the minimum time from the source index to every stop index
+        '''
+        times = [INF] * len(self.stops)
+        times[source] = 0
+        #heap entries take the form (time, stop index)
+        open_nodes = [(0, source)]
+
+        while (len(open_nodes) > 0):
+            time, stop = heapq.heappop(open_nodes)
+            if (time > times[stop]):
+                #stale entry, the stop was already reached sooner
+                continue
+            for next_stop, connection_time in self.adjacency[stop]:
+                next_time = time + connection_time
+                if (next_time < times[next_stop]):
+                    times[next_stop] = next_time
+                    heapq.heappush(open_nodes, (next_time, next_stop))
+        return times
+
+    def fill_all_pairs(self):
+        '''
+        fill every row at once using a vectorised floyd-warshall
+        '''
+        import numpy as np
+
+        num_stops = len(self.stops)
+        times = np.full((num_stops, num_stops), np.inf)
+        np.fill_diagonal(times, 0)
+        for stop, edges in enumerate(self.adjacency):
+            for next_stop, connection_time in edges:
+                times[stop, next_stop] = min(times[stop, next_stop], connection_time)
+
+        for via in range(num_stops):
+            np.minimum(times, times[:, via, None] + times[None, via, :], out=times)
+
+        for i, stop in enumerate(self.stops):
+            self[stop] = self.row_from_times(times[i].tolist())
+
+    def row_from_times(self, times):
+        '''
+        convert a list of times by stop index into a dict keyed by stop
+        '''
+        row = dict()
+        for stop, time in zip(self.stops, times):
+            if (time < INF):
+                row[stop] = int(time)
+            else:
+                row[stop] = INF
+        return row
+
+
+def find_shortest_paths(network, all_pairs=False):
+    '''
+    return the shortest paths between the network's stops.
+
+    a single heap based pass is run from each required stop of each route, as
+    these are the only sources the search and passengers look up. any other
+    source is filled in the first time it is used. if all_pairs is True every
+    pair is found at once with a vectorised floyd-warshall instead
+    '''
+    shortest_paths = ShortestPaths(network.stops, network.connections)
+    if (all_pairs):
+        shortest_paths.fill_all_pairs()
+        return shortest_paths
+
+    for route in network.routes:
+        for stop in route.required_stops:
+            if (not (stop in shortest_paths)):
+                shortest_paths.add_source(stop)
+    return shortest_paths
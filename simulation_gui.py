@@ -141,13 +141,13 @@ class SimulationGUI:
         '''
         return math.floor(self.height - self.buffer - ((lat - self.lat_offset)*self.lat_lon_scalar))
     
-    def update(self, current_water_level, current_time):
+    def update(self, current_water_level, current_time, fleet=None):
         '''
         update the view to reflect the new graph
         '''
         self.update_stops(current_water_level)
         self.update_connections(current_water_level)
-        self.update_buses()
+        self.update_buses(fleet)
         self.update_text(current_time, current_water_level)
         self.canvas.update()
 
@@ -188,11 +188,15 @@ class SimulationGUI:
                 line = self.connection_dict[connection]
                 self.canvas.itemconfig(line, fill=CONNECTION_DOWN_COLOR, dash=(5,5))
 
-    def update_buses(self):
+    def update_buses(self, fleet=None):
         '''
-        update buses for new tick
+        update buses for new tick. if a FleetEngine is given, positions are read from its
+        arrays rather than from each bus
         '''
-        for bus in self.network.buses:
+        if (fleet is not None):
+            xs = [self.lon_to_x(lon) for lon in fleet.lons.tolist()]
+            ys = [self.lat_to_y(lat) for lat in fleet.lats.tolist()]
+        for i, bus in enumerate(self.network.buses):
             if (bus.done):
                 if (bus in self.bus_dict.keys()):
                     rect = self.bus_dict[bus]
@@ -200,17 +204,18 @@ class SimulationGUI:
                     self.bus_dict.pop(bus, None)
             elif (bus.departed):
                 #bus in progress
-                if (bus in self.bus_dict.keys()):
-                    #update bus
+                if (fleet is not None):
+                    next_x, next_y = xs[i], ys[i]
+                else:
                     next_x = self.lon_to_x(bus.lon)
                     next_y = self.lat_to_y(bus.lat)
+                if (bus in self.bus_dict.keys()):
+                    #update bus
                     rect = self.bus_dict[bus]
                     self.canvas.coords(rect, next_x - BUS_WIDTH, next_y - BUS_WIDTH,
                         next_x + BUS_WIDTH, next_y + BUS_WIDTH)
                 else:
                     #create new bus
-                    next_x = self.lon_to_x(bus.lon)
-                    next_y = self.lat_to_y(bus.lat)
                     rect = self.canvas.create_oval(next_x - BUS_WIDTH,
                             next_y - BUS_WIDTH, next_x + BUS_WIDTH, next_y + BUS_WIDTH, fill=BUS_COLOR) 
                     self.bus_dict[bus] = rect
@@ -0,0 +1,149 @@
+import argparse
+import glob
+import hashlib
+import importlib.util
+import io
+import os
+import pickle
+import sys
+from time import perf_counter
+
+SNAPSHOT_VERSION = 2
+
+#data files the built network and controller depend on
+INPUT_FILES = ['data/stops.csv', 'data/connections.csv', 'data/departure_times.csv', 'data/trips.csv',
+    'data/stop_elevations.csv', 'data/connection_elevations.csv']
+INPUT_PATTERNS = ['data/route_*.csv']
+#modules that build the network and controller. any other module defining an object in the
+#snapshot is found as it is pickled (see ModuleRecordingPickler)
+BUILD_MODULES = ['transport_graph', 'controller', 'utils']
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ModuleRecordingPickler(pickle.Pickler):
+    '''
+    pickler recording the modules defining each class it saves, or the class of each object
+    '''
+
+    def __init__(self, file, protocol=None):
+        super().__init__(file, protocol)
+        self.modules = set()
+
+    def reducer_override(self, obj):
+        if (isinstance(obj, type)):
+            self.modules.add(obj.__module__)
+        else:
+            self.modules.add(type(obj).__module__)
+        return NotImplemented
+
+
+def get_source_file(module):
+    '''
+    return the source file of the named module if it is one of this project's, otherwise None
+    '''
+    try:
+        spec = importlib.util.find_spec(module)
+    except (ImportError, ValueError):
+        return None
+    if ((spec is None) or (spec.origin is None) or (not spec.origin.endswith('.py'))):
+        return None
+    if (os.path.dirname(os.path.abspath(spec.origin)) != SOURCE_DIR):
+        return None
+    return spec.origin
+
+
+def get_input_hashes(modules):
+    '''
+    return a dict mapping each input file, and the source file of each of the given modules,
+    to a hash of its contents
+    '''
+    filenames = dict()
+    for filename in INPUT_FILES:
+        filenames[filename] = filename
+    for pattern in INPUT_PATTERNS:
+        for filename in sorted(glob.glob(pattern)):
+            filenames[filename] = filename
+    for module in sorted(modules):
+        filenames[f'{module}.py'] = get_source_file(module)
+    input_hashes = dict()
+    for name, filename in filenames.items():
+        if (filename is None):
+            #a module that has since been removed
+            input_hashes[name] = None
+            continue
+        in_fd = open(filename, 'rb')
+        input_hashes[name] = hashlib.sha1(in_fd.read()).hexdigest()
+        in_fd.close()
+    return input_hashes
+
+
+def build_snapshot(filename, disaster_resistant=False):
+    '''
+    build the network and a controller for the default flood, then save both to file.
+    the controller holds the shortest paths, closure times and initial walks, so loading it
+    skips all of start up. the source files of the modules defining their objects are hashed
+    along with the data files, so a snapshot isn't loaded once the code has changed
+    '''
+    from transport_graph import Network
+    from controller import NetworkController
+
+    network = Network(disaster_resistant=disaster_resistant)
+    controller = NetworkController(network, disaster_resistant=disaster_resistant)
+    #pickled on their own first, so the source of every module they need is hashed with them
+    payload = io.BytesIO()
+    pickler = ModuleRecordingPickler(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dump((network, controller))
+    modules = sorted(module for module in pickler.modules.union(BUILD_MODULES) if (get_source_file(module) is not None))
+    #hashed after building, as building may have added elevations to the elevation files
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'disaster_resistant': disaster_resistant,
+        'modules': modules,
+        'input_hashes': get_input_hashes(modules),
+        'payload': payload.getvalue(),
+    }
+    temp_filename = f'{filename}.tmp'
+    out_fd = open(temp_filename, 'wb')
+    pickle.dump(data, out_fd, protocol=pickle.HIGHEST_PROTOCOL)
+    out_fd.close()
+    os.replace(temp_filename, filename)
+    return network, controller
+
+
+def load_snapshot(filename, disaster_resistant=False):
+    '''
+    return the (network, controller) saved in a snapshot, or None if there is no snapshot or
+    it is from a different version, mode, set of input files or code. these are checked before
+    the network and controller are unpickled, so classes that have since changed aren't loaded
+    '''
+    if (not os.path.exists(filename)):
+        return None
+    in_fd = open(filename, 'rb')
+    try:
+        data = pickle.load(in_fd)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        print(f'Ignoring unreadable snapshot: {filename}', file=sys.stderr)
+        return None
+    finally:
+        in_fd.close()
+    if (data.get('version') != SNAPSHOT_VERSION):
+        print(f'Ignoring snapshot from a different version: {filename}', file=sys.stderr)
+        return None
+    if (data['disaster_resistant'] != disaster_resistant):
+        print(f'Ignoring snapshot built for a different mode: {filename}', file=sys.stderr)
+        return None
+    if (data['input_hashes'] != get_input_hashes(data['modules'])):
+        print(f'Ignoring snapshot built from different input files or code: {filename}', file=sys.stderr)
+        return None
+    return pickle.loads(data['payload'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='build-snapshot: save the built network and controller so main.py starts with a single load')
+    parser.add_argument('--disaster_resistant', help='disaster resistant?', action='store_true')
+    parser.add_argument('--output', help='snapshot file to write', default='data/snapshot.pickle')
+    args = parser.parse_args()
+
+    start = perf_counter()
+    build_snapshot(args.output, args.disaster_resistant)
+    print(f'snapshot built in {perf_counter() - start:.2f}s and written to {args.output}')
@@ -0,0 +1,144 @@
+import argparse
+import csv
+import random
+import sys
+from multiprocessing import Pool
+from time import perf_counter
+
+from transport_graph import Network
+from controller import NetworkController
+from shortest_paths import find_shortest_paths
+from event_engine import EventEngine
+
+SCENARIO_FIELDS = ['name', 'start_water_level', 'end_water_level', 'end_time', 'demand_multiplier']
+RESULT_FIELDS = SCENARIO_FIELDS + ['total', 'delivered', 'stranded', 'non_preferred', 'average_detour_minutes', 'seconds']
+
+#network and shortest paths shared with worker processes, set by init_worker.
+#they are built once in the parent and inherited by forked workers
+worker_network = None
+worker_shortest_paths = None
+worker_options = None
+
+
+def read_scenarios_file(scenarios_filename):
+    '''
+    read scenarios from a csv with a header of SCENARIO_FIELDS. missing columns take the
+    default value for the controller
+    '''
+    in_fd = open(scenarios_filename, 'r', newline='')
+    scenarios = []
+    for i, row in enumerate(csv.DictReader(in_fd)):
+        scenario = dict()
+        scenario['name'] = row.get('name') or f'scenario_{i}'
+        scenario['start_water_level'] = float(row.get('start_water_level') or 0.0)
+        scenario['end_water_level'] = float(row.get('end_water_level') or 20.0)
+        scenario['end_time'] = int(row.get('end_time') or 4*60*60)
+        scenario['demand_multiplier'] = float(row.get('demand_multiplier') or 1.0)
+        scenarios.append(scenario)
+    in_fd.close()
+    return scenarios
+
+
+def sample_scenarios(num_scenarios, seed=None, max_water_level=30.0, min_end_time=60*60, max_end_time=8*60*60,
+        min_demand_multiplier=0.5, max_demand_multiplier=3.0):
+    '''
+    return randomly sampled flood scenarios. the water only rises in each scenario, so the end
+    level is never below the start level
+    '''
+    rng = random.Random(seed)
+    scenarios = []
+    for i in range(num_scenarios):
+        start_water_level = rng.uniform(0, max_water_level)
+        scenario = dict()
+        scenario['name'] = f'scenario_{i}'
+        scenario['start_water_level'] = start_water_level
+        scenario['end_water_level'] = rng.uniform(start_water_level, max_water_level)
+        scenario['end_time'] = rng.randint(min_end_time, max_end_time)
+        scenario['demand_multiplier'] = rng.uniform(min_demand_multiplier, max_demand_multiplier)
+        scenarios.append(scenario)
+    return scenarios
+
+
+def init_worker(network, shortest_paths, options):
+    global worker_network, worker_shortest_paths, worker_options
+    worker_network = network
+    worker_shortest_paths = shortest_paths
+    worker_options = options
+
+
+def run_scenario(scenario):
+    '''
+    simulate a single scenario on the shared network and return its result row
+    '''
+    start = perf_counter()
+    network = worker_network
+    network.reset_simulation(scenario['demand_multiplier'])
+    controller = NetworkController(network, disaster_resistant=worker_options['disaster_resistant'],
+        seconds_per_tick=worker_options['seconds_per_tick'], start_water_level=scenario['start_water_level'],
+        end_water_level=scenario['end_water_level'], end_time=scenario['end_time'],
+        shortest_paths=worker_shortest_paths, walk_cache_size=worker_options['walk_cache_size'],
+        walk_cache_filename=worker_options['walk_cache'], max_state_nodes=worker_options['max_state_nodes'])
+    EventEngine(controller).run()
+    controller.cache_optimum_walks()
+
+    result = dict(scenario)
+    result.update(controller.get_stats())
+    result['seconds'] = perf_counter() - start
+    return result
+
+
+def run_sweep(scenarios, output_fd, disaster_resistant=False, seconds_per_tick=5, processes=None, aggregate_demand=False,
+        walk_cache=None, walk_cache_size=128, max_state_nodes=None):
+    '''
+    build the network and shortest paths once, simulate every scenario in a process pool and
+    write one csv row per scenario to output_fd as each finishes. returns the list of results.
+    if aggregate_demand is True passengers are kept as counts (see aggregated_demand.py).
+    if walk_cache is given each scenario reuses the walks saved there and adds its own.
+    max_state_nodes limits the walk search as in NetworkController
+    '''
+    network = Network(disaster_resistant=disaster_resistant, aggregate_demand=aggregate_demand)
+    shortest_paths = find_shortest_paths(network)
+    options = {'disaster_resistant': disaster_resistant, 'seconds_per_tick': seconds_per_tick,
+        'walk_cache': walk_cache, 'walk_cache_size': walk_cache_size, 'max_state_nodes': max_state_nodes}
+
+    writer = csv.DictWriter(output_fd, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    results = []
+    with Pool(processes, initializer=init_worker, initargs=(network, shortest_paths, options)) as pool:
+        for result in pool.imap_unordered(run_scenario, scenarios):
+            writer.writerow(result)
+            output_fd.flush()
+            results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='simulate many flood scenarios in parallel on a shared network')
+    parser.add_argument('--disaster_resistant', help='disaster resistant?', action='store_true')
+    parser.add_argument('--scenarios', help='csv of scenarios with columns ' + ', '.join(SCENARIO_FIELDS), default=None)
+    parser.add_argument('--num_scenarios', help='number of random scenarios if no scenarios file is given', type=int, default=100)
+    parser.add_argument('--seed', help='random seed for sampled scenarios', type=int, default=None)
+    parser.add_argument('--output', help='results csv (printed if not given)', default=None)
+    parser.add_argument('--processes', help='number of worker processes', type=int, default=None)
+    parser.add_argument('--seconds_per_tick', help='simulated seconds per tick', type=int, default=5)
+    parser.add_argument('--aggregate_demand', help='keep passengers as counts rather than one object each, for large demand', action='store_true')
+    parser.add_argument('--walk_cache', help='json file of searched walks shared by the scenarios and later sweeps', default=None)
+    parser.add_argument('--walk_cache_size', help='most flood epochs and routes to keep walks for in the walk cache', type=int, default=1024)
+    parser.add_argument('--max_state_nodes', help='search from at most this many walks to each stop and set of required stops at once, for large networks', type=int, default=None)
+    args = parser.parse_args()
+
+    if (args.scenarios is not None):
+        scenarios = read_scenarios_file(args.scenarios)
+    else:
+        scenarios = sample_scenarios(args.num_scenarios, args.seed)
+
+    start = perf_counter()
+    if (args.output is None):
+        results = run_sweep(scenarios, sys.stdout, args.disaster_resistant, args.seconds_per_tick, args.processes,
+            args.aggregate_demand, args.walk_cache, args.walk_cache_size, args.max_state_nodes)
+    else:
+        out_fd = open(args.output, 'w', newline='')
+        results = run_sweep(scenarios, out_fd, args.disaster_resistant, args.seconds_per_tick, args.processes,
+            args.aggregate_demand, args.walk_cache, args.walk_cache_size, args.max_state_nodes)
+        out_fd.close()
+    print(f'{len(results)} scenarios in {perf_counter() - start:.2f}s', file=sys.stderr)
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+#the modules under test are at the top of the repository, and reference_controller.py is here
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, TESTS_DIR)
+
+import utils
+from generate_network import generate_network
+
+
+@pytest.fixture
+def use_network(monkeypatch):
+    '''
+    return a function that makes the network whose data/ is in the given directory the one
+    Network reads. data files are found relative to the working directory and elevations are
+    only loaded once per process, so both are reset for each test, along with the elevation
+    provider
+    '''
+    def use(directory):
+        monkeypatch.chdir(directory)
+        monkeypatch.setattr(utils, 'stop_elevations', dict())
+        monkeypatch.setattr(utils, 'connection_elevations', dict())
+        monkeypatch.setattr(utils, 'new_stop_elevations', [])
+        monkeypatch.setattr(utils, 'new_connection_elevations', [])
+        monkeypatch.setattr(utils, 'loaded', False)
+        monkeypatch.setattr(utils, 'elevation_provider', None)
+        return directory
+    return use
+
+
+@pytest.fixture
+def small_network(tmp_path, use_network):
+    '''
+    a generated network small enough for the original walk search to finish on
+    '''
+    generate_network(str(tmp_path), seed=0, num_stops=40, num_routes=2, stops_per_route=4)
+    return use_network(tmp_path)
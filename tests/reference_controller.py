@@ -0,0 +1,198 @@
+from controller import NetworkController
+from shortest_paths import INF
+
+
+class ReferenceShortestPaths(dict):
+    '''
+    shortest paths found with the original list based djikstras, re-sorting every open node
+    after each one is visited. a row is worked out the first time its source stop is looked up
+    rather than for every stop at once, so it can be used on large networks
+    '''
+
+    def __init__(self, network):
+        super().__init__()
+        self.network = network
+
+    def __missing__(self, main_stop):
+        STOP = 0
+        TIME = 1
+        #nodes take the form [stop, time]
+        open_nodes = [[main_stop, 0]]
+        visited_stops = set()
+        main_stop_min_dist = dict()
+
+        #initlialize open nodes
+        for stop in self.network.stops:
+            if (stop != main_stop):
+                open_nodes.append([stop, INF])
+        open_nodes.sort(key=lambda x: x[TIME])
+
+        #main search loop
+        while(len(open_nodes) > 0):
+            current_node = open_nodes.pop(0)
+
+            for connection in self.network.get_connections_for_stop(current_node[STOP]):
+                if (current_node[STOP] == connection.stop_1):
+                    next_stop = connection.stop_2
+                else:
+                    next_stop = connection.stop_1
+
+                if (next_stop in visited_stops):
+                    continue
+
+                next_time = current_node[TIME] + connection.time
+                for node in open_nodes:
+                    if node[STOP] == next_stop:
+                        node[TIME] = min(next_time, node[TIME])
+                        break
+            main_stop_min_dist[current_node[STOP]] = current_node[TIME]
+            visited_stops.add(current_node[STOP])
+            open_nodes.sort(key=lambda x: x[TIME])
+        self[main_stop] = main_stop_min_dist
+        return main_stop_min_dist
+
+
+class ReferenceController(NetworkController):
+    '''
+    NetworkController with the original shortest paths and walk search, for the benchmark to
+    check the optimised ones against. the search keeps a list of open nodes, each with a copy
+    of its walk and required stops, sorted after every expansion, uses the time to
+    indooroopilly as its heuristic and doesn't merge nodes in the same state. a route's walk
+    is replayed to check it's still valid at each departure and the flood is checked from
+    the water level at each step, rather than from precomputed closure times.
+
+    only floods where the water level is the same everywhere are supported
+    '''
+
+    def __init__(self, network, disaster_resistant=False, seconds_per_tick=120, **kwargs):
+        super().__init__(network, disaster_resistant=disaster_resistant, seconds_per_tick=seconds_per_tick,
+            shortest_paths=ReferenceShortestPaths(network), **kwargs)
+
+    def init_walks(self):
+        for route in self.network.routes:
+            self.prev_optimal_walks[route] = self.optimal_walk_search(route, 0, True)
+
+    def get_optimal_walk(self, route, time):
+        prev_optimal_walk = self.prev_optimal_walks[route]
+        if (prev_optimal_walk is None):
+            return prev_optimal_walk
+        elif(self.is_walk_valid(prev_optimal_walk, time, route.route_num)):
+            return prev_optimal_walk
+        elif (self.distaster_resistant):
+            #if changing routes, search for new route and return it (None if no route exists)
+            new_optimal_walk = self.optimal_walk_search(route, time, trail=True)
+            self.prev_optimal_walks[route] = new_optimal_walk
+            return new_optimal_walk
+        else:
+            #if not changing routes, then there is no other walk than the default
+            self.prev_optimal_walks[route] = None
+            return None
+
+    def optimal_walk_search(self, route, time, trail=False):
+        CURRENT_STOP=0
+        TIME=1
+        WALK=2
+        REQUIRED_SET=3
+        HEURISTIC=4
+        self.nodes_expanded = 0
+        #nodes take the form [current_stop, current_time, walk, required stops visited, heuristic]
+        root_node_set = set()
+        root_node_set.add(self.network.chancellors_place)
+        root_node = [self.network.chancellors_place, time, [], root_node_set,
+            time + self.shortest_paths[self.network.indooroopilly_interchange][self.network.chancellors_place]]
+        best_incomplete_node = root_node
+        node_list = [root_node]
+
+        while(len(node_list) > 0):
+            node = node_list.pop(0)
+            self.nodes_expanded += 1
+
+            #check if walk is complete
+            if (self.is_reference_walk_complete(node[CURRENT_STOP], node[REQUIRED_SET], route)):
+                return node[WALK]
+
+            #check if walk is better than last best_incomplete_walk
+            if ((node[CURRENT_STOP] == self.network.indooroopilly_interchange) and
+                (len(node[REQUIRED_SET]) > len(best_incomplete_node[REQUIRED_SET]))):
+                best_incomplete_node = node
+
+            #make new node for each connection
+            prev_stop = node[CURRENT_STOP]
+
+            for connection in self.network.get_connections_for_stop(prev_stop):
+
+                #if looking for trail, abandon this
+                if (trail and (connection in node[WALK])):
+                    continue
+
+                #get stop
+                if (prev_stop == connection.stop_1):
+                    next_stop = connection.stop_2
+                else:
+                    next_stop = connection.stop_1
+
+                #check the step is valid, get next time and check if time is over max
+                valid, next_time = self.is_step_valid(prev_stop, next_stop, connection, node[TIME])
+                if ((not valid) or ((next_time-time) > self.max_time_per_walk[route.route_num])):
+                    continue
+
+                #get new walk
+                next_walk = node[WALK].copy()
+                next_walk.append(connection)
+                #prune those with double crossed edges
+                if (next_walk.count(connection) > 2):
+                    continue
+
+                next_heuristic = next_time + self.shortest_paths[self.network.indooroopilly_interchange][next_stop]
+
+                #get new required_set
+                new_required_set = node[REQUIRED_SET].copy()
+                if ((not (next_stop in node[REQUIRED_SET])) and (next_stop in route.required_stops)):
+                    new_required_set.add(next_stop)
+
+                #prune new set if too long
+                next_node = [next_stop, next_time, next_walk, new_required_set, next_heuristic]
+                if ((next_node[HEURISTIC] - time) > self.max_time_per_walk[route.route_num]):
+                    continue
+
+                #append new node to open list
+                node_list.append(next_node)
+            node_list.sort(key=lambda x: x[HEURISTIC])
+        if (self.distaster_resistant):
+            return best_incomplete_node[WALK]
+        else:
+            return None
+
+    def is_reference_walk_complete(self, current_stop, required_set, route):
+        '''
+        return True if the walk contains all stops in the routes required_stops
+        '''
+        if (current_stop != self.network.indooroopilly_interchange):
+            return False
+        for stop in route.required_stops:
+            if (stop in required_set):
+                continue
+            return False
+        return True
+
+    def is_walk_valid(self, walk, time, route_num):
+        start_time = time
+        next_stop = self.network.chancellors_place
+        for connection in walk:
+            prev_stop = next_stop
+            if (connection.stop_1 == prev_stop):
+                next_stop = connection.stop_2
+            else:
+                next_stop = connection.stop_1
+            valid, time = self.is_step_valid(prev_stop, next_stop, connection, time)
+            if ((not valid) or ((time - start_time) > self.max_time_per_walk[route_num])):
+                return False
+        return True
+
+    def is_step_valid(self, start_stop, end_stop, connection, time):
+        end_time = time + connection.time
+        end_water_level = self.get_water_level_for_time(end_time)
+        if ((connection.elevation <= end_water_level) or
+            (end_stop.elevation <= end_water_level)):
+            return False, -1
+        return True, end_time
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from transport_graph import Network
+from controller import NetworkController
+from flood_model import HydrographFlood
+from instrumentation import Instrumentation
+from generate_network import write_network, CHANCELLORS_PLACE, INDOOROOPILLY_INTERCHANGE
+from benchmark import write_search_limit_network, run_engine, get_walk_ids, REFERENCE
+from reference_controller import ReferenceController
+from utils import read_hydrograph_file
+
+HUB_1 = CHANCELLORS_PLACE[0]
+HUB_2 = INDOOROOPILLY_INTERCHANGE[0]
+
+
+@pytest.mark.parametrize('disaster_resistant', [False, True])
+def test_same_walks_and_stats_as_original_search(small_network, disaster_resistant):
+    network = Network(disaster_resistant=disaster_resistant)
+    assert run_engine(network, disaster_resistant, 5) == run_engine(network, disaster_resistant, 5, REFERENCE)
+
+
+def test_flooded_origin_still_has_walk(tmp_path, use_network):
+    #chancellors place is under water from the start, but walks only have to step to dry stops
+    stops = [[100000, -27.4985, 153.0005]]
+    connections = [[HUB_1, 100000, 60], [100000, HUB_2, 60]]
+    write_network(str(tmp_path), stops, connections, [(600, [100000])], [(0, 600)], [], {HUB_1: 1, HUB_2: 100, 100000: 100},
+        {(stop_1_id, stop_2_id): 100 for stop_1_id, stop_2_id, seconds in connections})
+    use_network(tmp_path)
+    flood_model = HydrographFlood([[0, 5], [100, 5]])
+    network = Network()
+    route = network.get_route(600)
+
+    walk = NetworkController(network, flood_model=flood_model).optimal_walk_search(route, 0, True)
+    assert get_walk_ids(walk) == [[HUB_1, 100000], [100000, HUB_2]]
+    assert walk == ReferenceController(network, flood_model=flood_model).optimal_walk_search(route, 0, True)
+
+
+def test_max_state_nodes_goes_back_to_set_aside_nodes(tmp_path, use_network):
+    write_search_limit_network(str(tmp_path))
+    use_network(tmp_path)
+    network = Network()
+    route = network.get_route(600)
+    flood_model = HydrographFlood(read_hydrograph_file(os.path.join('data', 'hydrograph.csv')))
+
+    walk = NetworkController(network, flood_model=flood_model).optimal_walk_search(route, 0, True)
+    assert walk is not None
+    instrumentation = Instrumentation()
+    controller = NetworkController(network, flood_model=flood_model, max_state_nodes=1, instrumentation=instrumentation)
+    assert controller.optimal_walk_search(route, 0, True) == walk
+    assert instrumentation.searches[-1]['nodes_set_aside'] > 0
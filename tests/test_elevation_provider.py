@@ -0,0 +1,83 @@
+import json
+import os
+
+import numpy as np
+
+import utils
+from transport_graph import Network
+from elevation_provider import DemElevationProvider, load_dem
+
+#a tile of 0.01 degree cells around the generated networks, where each cell centre's elevation
+#rises 1m a row south and 2m a column east, so elevations between centres are on the same plane
+WEST = 152.9
+NORTH = -27.4
+CELL_SIZE = 0.01
+
+
+def get_plane_elevation(lat, lon):
+    return ((NORTH - lat) / CELL_SIZE - 0.5) + 2 * ((lon - WEST) / CELL_SIZE - 0.5)
+
+
+def get_tile():
+    rows, cols = np.mgrid[0:30, 0:30]
+    return (rows + 2 * cols).astype(float)
+
+
+class CountingProvider(DemElevationProvider):
+    '''
+    DemElevationProvider that counts the points looked up in each call
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def get_elevations(self, latitudes, longitudes):
+        self.batches.append(len(latitudes))
+        return super().get_elevations(latitudes, longitudes)
+
+
+def test_dem_interpolates_between_cells():
+    dem = np.array([[0, 10], [20, 30]], dtype=float)
+    provider = DemElevationProvider(dem, 0, 2, 1, 1)
+    #cell centres, between all four and within half a cell of the edge
+    assert provider.get_elevation(1.5, 0.5) == 0
+    assert provider.get_elevation(0.5, 1.5) == 30
+    assert provider.get_elevation(1, 1) == 15
+    assert provider.get_elevation(1.5, 1) == 5
+    assert provider.get_elevation(1.9, 0.1) == 0
+    #off the tile or next to an unknown cell
+    assert provider.get_elevation(3, 0.5) is None
+    assert DemElevationProvider(np.array([[0, -9999], [20, 30]], dtype=float), 0, 2, 1, 1, nodata=-9999).get_elevation(1, 1) is None
+
+
+def test_load_dem(tmp_path):
+    np.save(tmp_path / 'tile.npy', get_tile())
+    with open(tmp_path / 'tile.json', 'w') as out_fd:
+        json.dump({'dem': 'tile.npy', 'west': WEST, 'north': NORTH, 'cell_width': CELL_SIZE, 'cell_height': CELL_SIZE}, out_fd)
+    provider = load_dem(str(tmp_path / 'tile.json'))
+    elevations = provider.get_elevations([-27.5, -27.55], [153.0, 152.95])
+    assert np.allclose(elevations, [get_plane_elevation(-27.5, 153.0), get_plane_elevation(-27.55, 152.95)])
+
+
+def test_network_elevations_from_dem(small_network):
+    #no elevations saved, so every one comes from the tile
+    for filename in ('stop_elevations.csv', 'connection_elevations.csv'):
+        open(os.path.join('data', filename), 'w').close()
+    provider = CountingProvider(get_tile(), WEST, NORTH, CELL_SIZE, CELL_SIZE)
+    utils.set_elevation_provider(provider)
+
+    network = Network()
+    for stop in network.stops:
+        assert np.isclose(stop.elevation, get_plane_elevation(stop.lat, stop.lon))
+    #the two hubs are made before the stops file is read, then the other stops and the
+    #connections are each looked up in one batch
+    assert provider.batches == [1, 1, len(network.stops) - 2, len(network.connections)]
+
+    #and they are saved, so a second network looks none up
+    utils.stop_elevations.clear()
+    utils.connection_elevations.clear()
+    utils.loaded = False
+    provider.batches = []
+    Network()
+    assert provider.batches == []
@@ -0,0 +1,27 @@
+import pytest
+
+from transport_graph import Network
+from flood_model import HydrographFlood
+from benchmark import run_engine, ENGINES
+
+FLOODS = {
+    'linear': None,
+    #rises over most of the generated elevations then recedes, so closed roads reopen
+    'receding': [[0, 0], [60*60, 30], [2*60*60, 0]],
+}
+
+
+@pytest.mark.parametrize('disaster_resistant', [False, True])
+@pytest.mark.parametrize('flood', list(FLOODS))
+@pytest.mark.parametrize('engine', ENGINES)
+def test_same_walks_and_stats_as_tick_engine(small_network, disaster_resistant, flood, engine):
+    network = Network(disaster_resistant=disaster_resistant)
+
+    def run(engine):
+        flood_model = None
+        if (FLOODS[flood] is not None):
+            flood_model = HydrographFlood(FLOODS[flood])
+        return run_engine(network, disaster_resistant, 5, engine, flood_model)
+    results = run('tick')
+    assert results['total'] > 0
+    assert run(engine) == results
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from flood_model import merge_intervals, find_flooded_intervals, FloodModel, LinearFlood, HydrographFlood, RasterFlood
+from shortest_paths import INF
+
+#a rise to 10m at 100 seconds, a recession to 2m at 300 and a second rise to 6m at 400
+HYDROGRAPH = [[0, 0], [100, 10], [300, 2], [400, 6]]
+
+
+def is_flooded(intervals, time):
+    return any(start <= time < end for start, end in intervals)
+
+
+def test_merge_intervals():
+    assert merge_intervals([]) == []
+    assert merge_intervals([[5, 8], [0, 2], [1, 3], [3, 4]]) == [[0, 4], [5, 8]]
+    assert merge_intervals([[0, INF], [10, 20]]) == [[0, INF]]
+
+
+@pytest.mark.parametrize('elevation', [-1, 0, 1, 2, 4.5, 6, 7, 10, 11])
+def test_flooded_intervals_match_water_level(elevation):
+    flood_model = HydrographFlood(HYDROGRAPH)
+    intervals = flood_model.get_flooded_intervals(elevation)
+    #every second, and long after the last reading
+    for time in list(range(0, 500)) + [10**6]:
+        assert is_flooded(intervals, time) == (flood_model.get_water_level(time) >= elevation)
+
+
+def test_flooded_intervals_of_receding_flood():
+    flood_model = HydrographFlood(HYDROGRAPH)
+    #the water is at 5m at 50 seconds and again at 225, and rises back to 5m at 375
+    assert flood_model.get_flooded_intervals(5) == [[50, 226], [375, INF]]
+    assert flood_model.get_flood_time(5) == 50
+    assert flood_model.get_flood_time(11) == INF
+    assert find_flooded_intervals([0, 100], [0, 10], 5, lambda time: time / 10) == [[50, INF]]
+
+
+def test_flood_time_of_linear_flood():
+    flood_model = LinearFlood(0, 20, 4*60*60)
+    for elevation in [0, 0.5, 7, 19.99, 20]:
+        time = flood_model.get_flood_time(elevation)
+        assert flood_model.get_water_level(time) >= elevation
+        assert (time == 0) or (flood_model.get_water_level(time - 1) < elevation)
+    assert flood_model.get_flood_time(21) == INF
+
+
+@pytest.mark.parametrize('flood_model', [LinearFlood(), LinearFlood(5, 1, 100), HydrographFlood(HYDROGRAPH),
+    HydrographFlood([[100, 1], [200, 3]])])
+def test_water_levels_match_water_level(flood_model):
+    times = list(range(0, 20000, 7))
+    assert np.allclose(flood_model.get_water_levels(times), [flood_model.get_water_level(time) for time in times])
+
+
+def test_flood_model_is_abstract():
+    with pytest.raises(TypeError):
+        FloodModel([0])
+
+
+def test_raster_water_levels(tmp_path):
+    #a 2x2 grid over three readings. the top left cell rises then falls, the bottom right is dry
+    #until the second reading and the top right rises steadily
+    grids = np.full((3, 2, 2), np.nan)
+    grids[:, 0, 0] = [1, 3, 2]
+    grids[1:, 1, 1] = [5, 6]
+    grids[:, 0, 1] = [1, 2, 3]
+    np.save(tmp_path / 'grids.npy', grids)
+    flood_model = RasterFlood(str(tmp_path / 'grids.npy'), [0, 100, 200], 0, 2, 1, 1, gauge=(1.5, 0.5))
+
+    times = [0, 50, 100, 150, 200, 300]
+    assert np.allclose(flood_model.get_water_levels(times), [1, 2, 3, 2.5, 2, 2])
+    #the top left, bottom right, top right and a place off the grid
+    levels = flood_model.get_local_water_levels(times, [1.5, 0.5, 1.5, 5], [0.5, 1.5, 1.5, 0.5])
+    assert np.allclose(levels[:, 0], [1, 2, 3, 2.5, 2, 2])
+    assert np.allclose(levels[:, 1], [-INF, -INF, 5, 5.5, 6, 6])
+    assert np.allclose(levels[:, 2], [1, 1.5, 2, 2.5, 3, 3])
+    assert np.all(levels[:, 3] == -INF)
+
+    intervals = flood_model.get_local_flooded_intervals([1.5, 0.5], [0.5, 1.5], [2.5, 5.5])
+    assert intervals == [[[75, 151]], [[150, INF]]]
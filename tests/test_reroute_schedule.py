@@ -0,0 +1,34 @@
+from transport_graph import Network
+from controller import NetworkController
+from reroute_schedule import build_reroute_schedule, load_reroute_schedule
+from benchmark import get_walk_ids
+
+
+def get_saved_walks(schedule):
+    '''
+    return the schedule's walks with each walk as stop id pairs, to compare schedules of different networks
+    '''
+    return {route_num: [[start_time, latest_departure, get_walk_ids(walk)] for start_time, latest_departure, walk in entries]
+        for route_num, entries in schedule.walks.items()}
+
+
+def test_reroute_schedule_round_trip(small_network, tmp_path):
+    filename = str(tmp_path / 'reroute_schedule.json')
+    network = Network(disaster_resistant=True)
+    controller = NetworkController(network, disaster_resistant=True)
+    schedule = build_reroute_schedule(controller, processes=2)
+    schedule.save(filename)
+
+    #read back into a freshly built network, matching walks to its connections
+    loaded = load_reroute_schedule(Network(disaster_resistant=True), filename)
+    assert get_saved_walks(loaded) == get_saved_walks(schedule)
+    assert loaded.matches(controller)
+    assert not loaded.matches(NetworkController(network, disaster_resistant=True, max_state_nodes=8))
+
+    #every timetabled departure is covered, with the walk the controller finds as it runs
+    live_controller = NetworkController(network, disaster_resistant=True)
+    for departure_time, route_num in sorted((bus.departure_time, bus.route.route_num) for bus in network.buses):
+        route = network.get_route(route_num)
+        found, walk = loaded.get_walk(route, departure_time)
+        assert found
+        assert get_walk_ids(walk) == get_walk_ids(live_controller.get_optimal_walk(route, departure_time))
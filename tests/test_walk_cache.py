@@ -0,0 +1,48 @@
+import json
+
+from transport_graph import Network
+from controller import NetworkController
+from walk_cache import WalkCache
+from benchmark import get_walk_ids
+
+
+def get_saved_walks(walk_cache):
+    '''
+    return the cache's walks with each walk as stop id pairs, to compare caches of different networks
+    '''
+    saved_walks = dict()
+    for key, entries in walk_cache.walks.items():
+        saved_walks[key] = [[search_time, get_walk_ids(walk), latest_departure] for search_time, walk, latest_departure in entries]
+    return saved_walks
+
+
+def test_walk_cache_round_trip(small_network, tmp_path):
+    filename = str(tmp_path / 'walk_cache.json')
+    network = Network(disaster_resistant=True)
+    controller = NetworkController(network, disaster_resistant=True, walk_cache_filename=filename)
+    for route in network.routes:
+        for time in (0, 30*60, 60*60):
+            controller.cached_walk_search(route, time, trail=True)
+    controller.cache_optimum_walks()
+    assert len(controller.cached_optimal_walks.walks) > 0
+
+    #read back into a freshly built network, matching walks to its connections
+    loaded = WalkCache(Network(disaster_resistant=True), filename=filename)
+    assert get_saved_walks(loaded) == get_saved_walks(controller.cached_optimal_walks)
+    for key, entries in controller.cached_optimal_walks.walks.items():
+        for search_time, walk, latest_departure in entries:
+            assert loaded.get(key, latest_departure)[0]
+
+    #saving again merges with the file rather than replacing it
+    other = WalkCache(network, filename=None)
+    other.put(('other',), 0, None, 10)
+    other.save(filename)
+    merged = WalkCache(network, filename=filename)
+    assert ('other',) in merged.walks
+    assert get_saved_walks(merged).items() >= get_saved_walks(loaded).items()
+
+
+def test_walk_cache_ignores_other_versions(small_network, tmp_path):
+    filename = tmp_path / 'walk_cache.json'
+    filename.write_text(json.dumps({'version': -1, 'walks': [[['key'], [[0, None, 10]]]]}))
+    assert len(WalkCache(Network(), filename=str(filename)).walks) == 0
@@ -1,4 +1,8 @@
-from utils import get_elevation, read_route_file, read_connections_file, read_stop_file, cache_elevations, read_departure_times, read_trips_file
+import math
+import sys
+from collections import deque
+
+from utils import get_elevation, prefetch_elevations, read_route_file, read_connections_file, read_stop_file, cache_elevations, read_departure_times, read_trips_file, read_route_nums
 
 CHANCELLORS_PLACE_IDS = [1798, 1799, 1801]
 INDOOROOPILLY_IDS = [2004, 2205]
@@ -15,11 +19,20 @@ class Stop():
         self.lon = lon
         self.elevation = get_elevation(lat, lon, True, self.id, None)
         self.people = []
-        self.passengers = []
+        #route -> deque of the passengers waiting for it, in the order they arrived
+        self.passengers = dict()
     
     def __str__(self):
         return str(f'{self.id}')
 
+    def add_passenger(self, passenger):
+        '''
+        add a passenger to the back of the queue for their route
+        '''
+        if (not (passenger.route in self.passengers)):
+            self.passengers[passenger.route] = deque()
+        self.passengers[passenger.route].append(passenger)
+
 
 class Connection():
     '''
@@ -55,6 +68,8 @@ class Route():
         self.required_stops = set()
         self.required_stops.add(self.origin_stop)
         self.parent_network = network
+        #seconds the timetable gives for the whole route
+        self.scheduled_time = 0
     
     def add_required_stop(self, stop):
         self.required_stops.add(stop)
@@ -83,41 +98,36 @@ class Passenger():
         to the next best one
         '''
         self.bus = bus
-        self.bus.passengers.append(self)
 
         if (not(self.dest_stop in self.bus.stops_visited_on_walk)):
             #find non-prefferred stop
-            best_stop = None
-            best_time = 5e10
-            for stop in self.bus.stops_visited_on_walk:
-                next_time = controller.shortest_paths[self.dest_stop][stop]
-                if (next_time < best_time):
-                    best_stop = stop
-                    best_time = next_time
-            self.non_preffered_dest_stop = best_stop
-    
-    def visit_stop(self, stop):
+            self.non_preffered_dest_stop = self.bus.get_fallback_stop(controller, self.dest_stop)
+        self.bus.add_passenger(self)
+
+    def get_alight_stop(self):
         '''
-        if the stop is your destination, get off
-        if the stop is your next best destination, get off
+        return the stop to get off at, your destination unless the bus doesn't visit it
+        in which case your next best destination
         '''
-        if (stop.id == self.dest_stop.id):
-            self.arrived = True
-            self.bus.passengers.remove(self)
-        elif ((not(self.non_preffered_dest_stop is None)) and (stop == self.non_preffered_dest_stop)):
-            self.arrived = True
-            self.bus.passengers.remove(self)
+        if (self.non_preffered_dest_stop is None):
+            return self.dest_stop
+        return self.non_preffered_dest_stop
 
 class Bus():
     
     def __init__(self, route, departure_time, disaster_resistant=False):
         self.route = route
         self.departure_time = departure_time
-        self.passengers = []
+        #id of the stop passengers get off at -> passengers on board getting off there
+        self.passengers = dict()
+        self.num_passengers = 0
         self.capacity = 62
 
         self.walk = None
         self.stops_visited_on_walk = None
+        #stop passengers get off at for each stop the walk doesn't visit, the bus's own copy of
+        #NetworkController.get_fallback_stops with any other stops added as passengers need them
+        self.fallback_stops = None
         self.time_at_last_stop = 0
         self.lat = 0
         self.lon = 0
@@ -142,6 +152,17 @@ class Bus():
         '''
         depart the start stop
         '''
+        self.start_walk(controller)
+        if (self.done):
+            return
+
+        #recursively call update until we reach stop condition
+        self.update(controller, current_time)
+
+    def start_walk(self, controller):
+        '''
+        get the walk for this departure and visit the first stop, the bus is done if there is no walk
+        '''
         self.departed = True
 
         self.walk = controller.get_optimal_walk(self.route, self.departure_time)
@@ -162,12 +183,10 @@ class Bus():
             else:
                 next_stop = connection.stop_1
             self.stops_visited_on_walk.add(next_stop)
+        self.fallback_stops = controller.get_fallback_stops(self.route, self.walk, self.stops_visited_on_walk)
         
         #visit first stop
         self.visit_stop(controller, self.route.origin_stop, self.departure_time)
-
-        #recursively call update until we reach stop condition
-        self.update(controller, current_time)
         
     def update_journey(self, controller, current_time):
         '''
@@ -179,14 +198,10 @@ class Bus():
         
         #get next connection and next stop
         next_connection = self.walk[0]
-        if (next_connection.stop_1 == self.current_stop):
-            next_stop = next_connection.stop_2
-        else:
-            next_stop = next_connection.stop_1
+        next_stop = self.get_next_stop()
         
         if ((current_time - self.time_at_last_stop) >= next_connection.time):
-            self.visit_stop(controller, next_stop, self.time_at_last_stop + next_connection.time)
-            self.walk.pop(0)
+            self.visit_next_stop(controller)
             self.update(controller, current_time)
         else:
             #interpolate lat and lon
@@ -194,6 +209,29 @@ class Bus():
             self.lat = self.current_stop.lat + (next_stop.lat - self.current_stop.lat)*(fraction_complete)
             self.lon = self.current_stop.lon + (next_stop.lon - self.current_stop.lon)*(fraction_complete)
 
+    def get_next_stop(self):
+        '''
+        return the stop at the end of the next connection in the walk
+        '''
+        next_connection = self.walk[0]
+        if (next_connection.stop_1 == self.current_stop):
+            return next_connection.stop_2
+        return next_connection.stop_1
+
+    def get_next_arrival_time(self):
+        '''
+        return the time the bus reaches the next stop in its walk
+        '''
+        return self.time_at_last_stop + self.walk[0].time
+
+    def visit_next_stop(self, controller):
+        '''
+        travel along the next connection in the walk and visit the stop at its end
+        '''
+        next_stop = self.get_next_stop()
+        self.visit_stop(controller, next_stop, self.get_next_arrival_time())
+        self.walk.pop(0)
+
     def visit_stop(self, controller, stop, time):
         '''
         visit the given stop at the given time
@@ -203,16 +241,42 @@ class Bus():
         self.time_at_last_stop = time
         self.current_stop = stop
 
+        if (controller.network.demand is not None):
+            controller.network.demand.visit_stop(controller, self, stop)
+            return
+
         #have all passengers on bus that need to get off, get off
-        for passenger in self.passengers.copy():
-            passenger.visit_stop(stop)
+        alighting_passengers = self.passengers.pop(stop.id, None)
+        if (alighting_passengers is not None):
+            for passenger in alighting_passengers:
+                passenger.arrived = True
+            self.num_passengers -= len(alighting_passengers)
+
+        #passengers for this route get on in the order they arrived until the bus is full
+        queue = stop.passengers.get(self.route)
+        if (queue is None):
+            return
+        while ((len(queue) > 0) and (self.num_passengers < self.capacity)):
+            queue.popleft().depart(controller, self)
 
-        for passenger in stop.passengers.copy():
-            if (len(self.passengers) >= self.capacity):
-                break
-            if (passenger.route == self.route):
-                stop.passengers.remove(passenger)
-                passenger.depart(controller, self)
+    def get_fallback_stop(self, controller, dest_stop):
+        '''
+        return the stop passengers for dest_stop, which the walk doesn't visit, get off at
+        '''
+        if (not (dest_stop in self.fallback_stops)):
+            #not one of the route's required stops, so not in the walk's table yet
+            self.fallback_stops[dest_stop] = controller.get_nearest_stop(dest_stop, self.stops_visited_on_walk)
+        return self.fallback_stops[dest_stop]
+
+    def add_passenger(self, passenger):
+        '''
+        add a passenger on board, indexed by the stop they get off at
+        '''
+        alight_stop_id = passenger.get_alight_stop().id
+        if (not (alight_stop_id in self.passengers)):
+            self.passengers[alight_stop_id] = []
+        self.passengers[alight_stop_id].append(passenger)
+        self.num_passengers += 1
 
 
 
@@ -221,65 +285,101 @@ class Network():
     class representing the graph containing the state of the transport network.
     '''
 
-    def __init__(self, disaster_resistant=False):
+    def __init__(self, disaster_resistant=False, demand_multiplier=1.0, aggregate_demand=False):
         self.disaster_resistant = disaster_resistant
+        #keep passengers as counts rather than Passenger objects (see aggregated_demand.py)
+        self.aggregate_demand = aggregate_demand
+        self.demand = None
         self.chancellors_place = Stop(1799, 'Chancellors Place', -27.497974, 153.011139)
         self.indooroopilly_interchange = Stop(2205, 'Indooroopilly Shopping Center', -27.500941, 152.971946)
         self.connections = []
         self.routes = []
-        self.stops = [self.indooroopilly_interchange, self.chancellors_place]
+        self.stops = []
         self.buses = []
         self.passengers = []
 
         #caching for efficiency
         self.stop_connections = dict()
+        #lookup indexes, kept up to date by add_stop, add_connection and add_route
+        self.stops_by_id = dict()
+        self.routes_by_num = dict()
+        #maps frozenset({stop_1, stop_2}) to the connection between them
+        self.connections_by_stops = dict()
+        #departures and trip counts read from file, kept so the simulation can be reset
+        self.departures = None
+        self.passenger_numbers = None
+
+        self.add_stop(self.indooroopilly_interchange)
+        self.add_stop(self.chancellors_place)
 
         #add stops, connections and routes
         self.init_stops()
         self.init_connections()
-        self.add_route(414)
-        self.add_route(427)
-        self.add_route(428)
-        self.add_route(432)
+        for route_num in read_route_nums():
+            self.add_route(route_num)
         self.init_buses()
-        self.init_passengers()
+        self.init_passengers(demand_multiplier)
 
         cache_elevations()
     
-    def init_passengers(self):
+    def reset_simulation(self, demand_multiplier=1.0):
+        '''
+        remove all buses and passengers and create them again, so the same network can be
+        simulated more than once
+        '''
+        self.buses = []
+        self.passengers = []
+        self.demand = None
+        for stop in self.stops:
+            stop.passengers = dict()
+        self.init_buses()
+        self.init_passengers(demand_multiplier)
+
+    def init_passengers(self, demand_multiplier=1.0):
         '''
         initialize passengers
         get all relevant passengers and add them to their respective stop queues
         shuffle all stop queues
-        '''
-        stop_id_sets = dict()
-        for route in self.routes:
-            next_stop_set = set()
-            for stop in route.required_stops:
-                next_stop_set.add(stop.id)
-            stop_id_sets[route.route_num] = next_stop_set
 
-        passenger_numbers = read_trips_file(stop_id_sets, self.chancellors_place.id, self.indooroopilly_interchange.id)
+        the number of passengers for each trip is multiplied by demand_multiplier (rounded up)
+        if aggregating demand, only the counts are kept
+        '''
+        if (self.passenger_numbers is None):
+            stop_id_sets = dict()
+            for route in self.routes:
+                next_stop_set = set()
+                for stop in route.required_stops:
+                    next_stop_set.add(stop.id)
+                stop_id_sets[route.route_num] = next_stop_set
+            self.passenger_numbers = read_trips_file(stop_id_sets, self.chancellors_place.id, self.indooroopilly_interchange.id)
+
+        passenger_numbers = self.passenger_numbers
+        if (self.aggregate_demand):
+            #imported here so numpy is only needed when aggregating
+            from aggregated_demand import AggregatedDemand
+            self.demand = AggregatedDemand(self, passenger_numbers, demand_multiplier)
+            return
         for route_num in passenger_numbers.keys():
             route = self.get_route(route_num)
             for origin_stop_id in passenger_numbers[route_num].keys():
                 origin_stop = self.get_stop(origin_stop_id)
                 for dest_stop_id in passenger_numbers[route_num][origin_stop_id].keys():
                     destination_stop = self.get_stop(dest_stop_id)
-                    no_passengers = passenger_numbers[route_num][origin_stop_id][dest_stop_id]
+                    no_passengers = math.ceil(passenger_numbers[route_num][origin_stop_id][dest_stop_id] * demand_multiplier)
 
                     for i in range(no_passengers):
                         #add the passengers to the origin_stop
                         next_passenger = Passenger(route, destination_stop, origin_stop)
-                        origin_stop.passengers.append(next_passenger)
+                        origin_stop.add_passenger(next_passenger)
                         self.passengers.append(next_passenger)
     
     def init_buses(self):
         '''
         initialize buses and give them their appropriate departure times and routes
         '''
-        departures = read_departure_times()
-        for departure in departures:
+        if (self.departures is None):
+            self.departures = read_departure_times()
+        for departure in self.departures:
             route = self.get_route(departure[0])
             self.buses.append(Bus(route, departure[1]))
         
@@ -289,16 +389,20 @@ class Network():
         add stops to graph
         '''
         stops_data = read_stop_file()
+        if (not self.disaster_resistant):
+            stops_data = [stop_data for stop_data in stops_data if (stop_data['id'] >= 0)]
+        #look up any elevations that aren't cached in one go
+        prefetch_elevations([[stop_data['lat'], stop_data['lon'], stop_data['id'], None] for stop_data in stops_data], True)
         for stop_data in stops_data:
-            if ((not self.disaster_resistant) and stop_data['id'] < 0):
-                continue
-            self.stops.append(Stop(stop_data['id'], stop_data['name'], stop_data['lat'], stop_data['lon']))
+            self.add_stop(Stop(stop_data['id'], stop_data['name'], stop_data['lat'], stop_data['lon']))
     
     def init_connections(self):
         '''
         add connections to graph
         '''
         connections_data = read_connections_file()
+        new_connections = []
+        new_stop_pairs = set()
         for connection_data in connections_data:
             stop_1 = self.get_stop(connection_data[0])
             if (stop_1 is None):
@@ -307,11 +411,17 @@ class Network():
                 stop_2 = self.get_stop(connection_data[i][0])
                 if (stop_2 is None):
                     continue
-                if (self.is_connected(stop_1, stop_2)):
+                if (self.is_connected(stop_1, stop_2) or (frozenset((stop_1, stop_2)) in new_stop_pairs)):
                     #don't load connections twice
                     continue
-                time = connection_data[i][1]
-                self.connections.append(Connection(stop_1, stop_2, time))
+                new_stop_pairs.add(frozenset((stop_1, stop_2)))
+                new_connections.append((stop_1, stop_2, connection_data[i][1]))
+
+        #look up any elevations that aren't cached in one go
+        prefetch_elevations([[(stop_1.lat + stop_2.lat)/2, (stop_1.lon + stop_2.lon)/2, stop_1.id, stop_2.id]
+            for stop_1, stop_2, time in new_connections], False)
+        for stop_1, stop_2, time in new_connections:
+            self.add_connection(Connection(stop_1, stop_2, time))
 
     
     def add_route(self, route_num:int):
@@ -321,6 +431,7 @@ class Network():
         #get route data from file
         route_data = read_route_file(route_num)
         route = Route(route_num, self.chancellors_place, self)
+        route.scheduled_time = sum(stop_dict['time'] for stop_dict in route_data)
 
         #add stops to route
         for i in range(len(route_data)-1):
@@ -330,61 +441,65 @@ class Network():
 
         route.add_required_stop(self.indooroopilly_interchange)
         self.routes.append(route)
+        if (not (route_num in self.routes_by_num)):
+            self.routes_by_num[route_num] = route
+
+    def add_stop(self, stop):
+        '''
+        add a stop to the graph and index it by id
+        '''
+        self.stops.append(stop)
+        self.stop_connections[stop] = []
+        if (not (stop.id in self.stops_by_id)):
+            self.stops_by_id[stop.id] = stop
+
+    def add_connection(self, connection):
+        '''
+        add a connection to the graph and index it by its (unordered) pair of stops
+        '''
+        self.connections.append(connection)
+        stop_pair = frozenset((connection.stop_1, connection.stop_2))
+        if (not (stop_pair in self.connections_by_stops)):
+            self.connections_by_stops[stop_pair] = connection
+        self.stop_connections.setdefault(connection.stop_1, []).append(connection)
+        self.stop_connections.setdefault(connection.stop_2, []).append(connection)
 
     
     def get_stop(self, id):
         '''
         return stop with given ID or None if no such stop exists
         '''
-        for stop in self.stops:
-            if stop.id == id:
-                return stop
-        print(f'No stop with id: {id}')
-        return None
+        stop = self.stops_by_id.get(id)
+        if (stop is None):
+            print(f'No stop with id: {id}', file=sys.stderr)
+        return stop
     
     def get_route(self, route_num):
         '''
         return route with the given route nubmer of NOne if no such route exists
         '''
-        for route in self.routes:
-            if (route.route_num == route_num):
-                return route
-        print(f'No route with number: {route_num}')
-        return None
+        route = self.routes_by_num.get(route_num)
+        if (route is None):
+            print(f'No route with number: {route_num}', file=sys.stderr)
+        return route
     
     def is_connected(self, stop_1, stop_2):
         '''
         check if two stops are connected
         '''
-        for connection in self.connections:
-            if (connection.stop_1 == stop_1 and connection.stop_2 == stop_2):
-                return 
-            elif (connection.stop_2 == stop_1 and connection.stop_1 == stop_2):
-                return True
-        return False
+        return frozenset((stop_1, stop_2)) in self.connections_by_stops
     
     def get_connection(self, stop_1, stop_2):
         '''
         return connection for two stops or None
         '''
-        for connection in self.connections:
-            if ((connection.stop_1 == stop_1 and connection.stop_2 == stop_2) or
-                (connection.stop_2 == stop_1 and connection.stop_1 == stop_2)):
-                return connection
-        return None
+        return self.connections_by_stops.get(frozenset((stop_1, stop_2)))
     
     def get_connections_for_stop(self, stop):
         '''
         return all connections for a given stop
         '''
-        if (not (stop in self.stop_connections.keys())):
-            relevant_connections = []
-            for connection in self.connections:
-                if (connection.stop_1 == stop or connection.stop_2 == stop):
-                    relevant_connections.append(connection)
-            self.stop_connections[stop] = relevant_connections
-            return relevant_connections
-        return self.stop_connections[stop]
+        return self.stop_connections.get(stop, [])
 
     
     def __str__(self):
@@ -1,43 +1,150 @@
-import requests
-import pandas as pd
 import math
-from json.decoder import JSONDecodeError
-
-#lists containing elevation data
-stop_elevations = []
-connection_elevations = []
-#flag to determine if lists are loaded
+import os
+import time
+
+#elevation data, stop_elevations maps stop ids and connection_elevations
+#frozenset({stop_1_id, stop_2_id}) to an elevation
+stop_elevations = dict()
+connection_elevations = dict()
+#elevations looked up since the files were loaded, as [stop_id, elevation] and
+#[stop_1_id, stop_2_id, elevation], that cache_elevations still has to save
+new_stop_elevations = []
+new_connection_elevations = []
+#flag to determine if elevations are loaded
 loaded = False
+#source of elevations not loaded from file (see elevation_provider.py), the open-elevation
+#server unless set_elevation_provider is called
+elevation_provider = None
+
+
+def set_elevation_provider(provider):
+    '''
+    look up elevations that aren't loaded from file with the given provider
+    '''
+    global elevation_provider
+    elevation_provider = provider
+
+
+def get_elevation_provider():
+    '''
+    return the provider elevations that aren't loaded from file are looked up with
+    '''
+    global elevation_provider
+    if (elevation_provider is None):
+        from elevation_provider import RemoteElevationProvider
+        elevation_provider = RemoteElevationProvider()
+    return elevation_provider
 
 
 def cache_elevations(stop_filename='data/stop_elevations.csv', connection_filename='data/connection_elevations.csv'):
     '''
-    save elevation data in lists to file to speed up subsequent runs
+    save elevations looked up since the files were loaded to speed up subsequent runs.
+    nothing is written if there are none
     '''
-    out_fd = open(stop_filename, 'w')
-    for stop_elevation in stop_elevations:
-        stop_id = stop_elevation[0]
-        elevation = stop_elevation[1]
-        out_fd.write(f'{stop_id},{elevation}\n')
-    out_fd.close()
+    global new_stop_elevations, new_connection_elevations
+    if (len(new_stop_elevations) > 0):
+        append_lines(stop_filename, [f'{stop_id},{elevation}\n' for stop_id, elevation in new_stop_elevations])
+        new_stop_elevations = []
+    if (len(new_connection_elevations) > 0):
+        append_lines(connection_filename, [f'{stop_1_id},{stop_2_id},{elevation}\n'
+            for stop_1_id, stop_2_id, elevation in new_connection_elevations])
+        new_connection_elevations = []
 
-    out_fd = open(connection_filename, 'w')
-    for connection in connection_elevations:
-        stop_1_id = connection[0]
-        stop_2_id = connection[1]
-        elevation = connection[2]
-        out_fd.write(f'{stop_1_id},{stop_2_id},{elevation}\n')
-    out_fd.close()
+
+def append_lines(filename, new_lines):
+    '''
+    add lines to the end of a file. the file is copied to a temporary file, which then replaces
+    it, so processes saving at the same time can never leave a partly written file behind, and
+    this is done holding a lock file so one process can't replace the file with a copy missing
+    the lines another has just added. lines already in the file (saved by another process since
+    it was read) are skipped
+    '''
+    lock_filename = f'{filename}.lock'
+    acquire_lock(lock_filename)
+    try:
+        lines = []
+        if (os.path.exists(filename)):
+            in_fd = open(filename, 'r')
+            lines = in_fd.readlines()
+            in_fd.close()
+        if ((len(lines) > 0) and (not lines[-1].endswith('\n'))):
+            lines[-1] += '\n'
+        existing_lines = set(lines)
+
+        temp_filename = f'{filename}.{os.getpid()}.tmp'
+        out_fd = open(temp_filename, 'w')
+        out_fd.writelines(lines)
+        out_fd.writelines([line for line in new_lines if (not (line in existing_lines))])
+        out_fd.close()
+        os.replace(temp_filename, filename)
+    finally:
+        os.remove(lock_filename)
+
+
+def acquire_lock(lock_filename, stale_seconds=60):
+    '''
+    wait until the lock file can be created. a lock older than stale_seconds was left by a
+    process that died while holding it, so is removed
+    '''
+    while (True):
+        try:
+            os.close(os.open(lock_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return
+        except FileExistsError:
+            try:
+                if ((time.time() - os.path.getmtime(lock_filename)) > stale_seconds):
+                    os.remove(lock_filename)
+                    continue
+            except FileNotFoundError:
+                #released since we tried to create it
+                continue
+            time.sleep(0.01)
 
 
 def get_elevation(lat:float, lon:float, stop, stop_1_id, stop_2_id, stop_filename='data/stop_elevations.csv', connection_filename='data/connection_elevations.csv'):
     '''
     load elevation data for given latitude and longitude.
-    this data is cached in a set of lists that are saved when the program exits.
+    this data is cached in dicts loaded from file, and new elevations are saved by cache_elevations.
 
     stop: indicated whether this elevation is for a stop (True) or connection (False)
     '''
-    #load lists from file
+    load_elevations(stop_filename, connection_filename)
+    cached_elevation = get_cached_elevation(stop, stop_1_id, stop_2_id)
+    if (cached_elevation is not None):
+        return cached_elevation
+
+    #elevation not loaded, look it up and add it
+    elevation = get_elevation_provider().get_elevation(lat, lon)
+    if (elevation is None):
+        raise ValueError(f'no elevation for {lat},{lon}')
+    add_elevation(elevation, stop, stop_1_id, stop_2_id)
+    return elevation
+
+
+def prefetch_elevations(points, stop, stop_filename='data/stop_elevations.csv', connection_filename='data/connection_elevations.csv'):
+    '''
+    look up the elevations of all the given points that aren't loaded in one batch from the
+    elevation provider, so get_elevation finds them loaded.
+
+    points: list of [lat, lon, stop_1_id, stop_2_id]
+    stop: indicated whether these elevations are for stops (True) or connections (False)
+    '''
+    load_elevations(stop_filename, connection_filename)
+    missing_points = [point for point in points if (get_cached_elevation(stop, point[2], point[3]) is None)]
+    if (len(missing_points) == 0):
+        return
+    elevations = get_elevation_provider().get_elevations([point[0] for point in missing_points],
+        [point[1] for point in missing_points])
+    for point, elevation in zip(missing_points, elevations):
+        #points the provider has no elevation for are reported by get_elevation
+        if (elevation == elevation):
+            add_elevation(float(elevation), stop, point[2], point[3])
+
+
+def load_elevations(stop_filename='data/stop_elevations.csv', connection_filename='data/connection_elevations.csv'):
+    '''
+    load the elevations from file, if they haven't been already
+    '''
     global loaded
     if (not loaded):
         #load elevations from saved file
@@ -50,8 +157,8 @@ def get_elevation(lat:float, lon:float, stop, stop_1_id, stop_2_id, stop_filenam
             if (len(words) < 2):
                 continue
             next_stop_id = int(words[0])
-            elevation = int(words[1])
-            stop_elevations.append([next_stop_id, elevation])
+            if (not (next_stop_id in stop_elevations)):
+                stop_elevations[next_stop_id] = parse_elevation(words[1])
 
         in_fd = open(connection_filename, 'r')
         lines = in_fd.readlines()
@@ -60,38 +167,42 @@ def get_elevation(lat:float, lon:float, stop, stop_1_id, stop_2_id, stop_filenam
             words = line.split(',')
             if (len(words) < 3):
                 continue
-            next_stop_1_id = int(words[0])
-            next_stop_2_id = int(words[1])
-            elevation = int(words[2])
-            connection_elevations.append([next_stop_1_id, next_stop_2_id, elevation])
-    
-    #see if elevation is in list, if so return it
+            key = frozenset((int(words[0]), int(words[1])))
+            if (not (key in connection_elevations)):
+                connection_elevations[key] = parse_elevation(words[2])
+
+
+def parse_elevation(word):
+    '''
+    elevations from the server are whole metres, those from an elevation model may not be
+    '''
+    elevation = float(word)
+    if (elevation.is_integer()):
+        return int(elevation)
+    return elevation
+
+
+def get_cached_elevation(stop, stop_1_id, stop_2_id):
+    '''
+    return the loaded elevation for the given stop or connection, None if there isn't one
+    '''
     if (stop):
-        for elevation_data in stop_elevations:
-            if (elevation_data[0] == stop_1_id):
-                return elevation_data[1]
+        return stop_elevations.get(stop_1_id)
+    return connection_elevations.get(frozenset((stop_1_id, stop_2_id)))
+
+
+def add_elevation(elevation, stop, stop_1_id, stop_2_id):
+    '''
+    add a newly looked up elevation to those loaded and those still to be saved
+    '''
+    if (stop):
+        print(f'{stop_1_id}: {elevation}')
+        stop_elevations[stop_1_id] = elevation
+        new_stop_elevations.append([stop_1_id, elevation])
     else:
-        for elevation_data in connection_elevations:
-            if ((elevation_data[0] == stop_1_id and elevation_data[1] == stop_2_id) or 
-                (elevation_data[0] == stop_2_id and elevation_data[1] == stop_1_id)):
-                return elevation_data[2]
-    
-    #elevation not in list, ping server and add to list
-    try:
-        query = ('https://api.open-elevation.com/api/v1/lookup'
-                f'?locations={lat},{lon}')
-        r = requests.get(query).json()
-        elevation = pd.io.json.json_normalize(r, 'results')['elevation'].values[0]
-        if (stop):
-            print(f'{stop_1_id}: {elevation}')
-            stop_elevations.append([stop_1_id, elevation])
-        else:
-            print(f'{stop_1_id},{stop_2_id}: {elevation}')
-            connection_elevations.append([stop_1_id, stop_2_id, elevation])
-    except JSONDecodeError:
-        print('timeout, retrying')
-        return get_elevation(lat, lon, stop, stop_1_id, stop_2_id)
-    return elevation
+        print(f'{stop_1_id},{stop_2_id}: {elevation}')
+        connection_elevations[frozenset((stop_1_id, stop_2_id))] = elevation
+        new_connection_elevations.append([stop_1_id, stop_2_id, elevation])
 
 
 def read_stop_file(stop_filename='data/stops.csv'):
@@ -246,6 +357,35 @@ def read_trips_file(stop_id_sets, chancellors_place_id, indooroopilly_interchang
 
         
 
+def read_hydrograph_file(hydrograph_filename):
+    '''
+    read water level readings from a file with a header line and rows of
+    seconds since the start of the simulation, water level in metres
+    '''
+    in_fd = open(hydrograph_filename, 'r')
+    lines = in_fd.readlines()
+    in_fd.close()
+    lines.pop(0)
+
+    readings = []
+    for line in lines:
+        words = line.split(',')
+        if (len(words) < 2):
+            continue
+        readings.append([int(float(words[0])), float(words[1])])
+    return readings
+
+
+def read_route_nums(data_dir='data'):
+    '''
+    return the numbers of the routes with a route file, in increasing order
+    '''
+    route_nums = []
+    for filename in os.listdir(data_dir):
+        if (filename.startswith('route_') and filename.endswith('.csv')):
+            route_nums.append(int(filename[len('route_'):-len('.csv')]))
+    return sorted(route_nums)
+
 def read_route_file(route_no):
     '''
     read important data from route files
@@ -0,0 +1,154 @@
+import json
+import os
+from collections import OrderedDict
+
+from utils import acquire_lock
+
+WALK_CACHE_VERSION = 2
+
+
+class WalkCache():
+    '''
+    bounded least recently used cache of searched walks.
+
+    keys take the form (flood fingerprint, route number, trail, disaster resistant, max state nodes,
+    open edges) where open edges is a compact fingerprint of the connections open at the departure time.
+    each key holds a list of entries [search time, walk, latest departure time]. as the water
+    only rises, the walks that are valid at a later time are a subset of those valid earlier, so
+    a walk found at the search time is still optimal for any departure up to its latest departure.
+    at most max_entries entries are kept per key, the oldest being dropped first.
+
+    walks are stored as lists of connections (or None). on disk they are saved as pairs of stop ids
+    so they can be matched back to a freshly built network. saving merges with what is already
+    in the file, so processes sharing a file keep each other's walks.
+    '''
+
+    def __init__(self, network, max_size=128, filename=None, max_entries=16):
+        self.network = network
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.filename = filename
+        self.walks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if ((filename is not None) and os.path.exists(filename)):
+            self.load()
+
+    def get(self, key, time):
+        '''
+        return (True, walk) if a cached walk can be used for a departure at the given time,
+        (False, None) otherwise
+        '''
+        entries = self.walks.get(key)
+        if (entries is not None):
+            for search_time, walk, latest_departure in entries:
+                if (search_time <= time <= latest_departure):
+                    self.walks.move_to_end(key)
+                    self.hits += 1
+                    return True, walk
+        self.misses += 1
+        return False, None
+
+    def put(self, key, time, walk, latest_departure):
+        '''
+        add a walk searched at the given time to the cache
+        '''
+        if (key in self.walks):
+            entries = self.walks[key]
+            #a walk already cached for the same departures adds nothing
+            if ([time, latest_departure] in [[entry[0], entry[2]] for entry in entries]):
+                self.walks.move_to_end(key)
+                return
+            entries.append([time, walk, latest_departure])
+            if (len(entries) > self.max_entries):
+                del entries[0]
+            self.walks.move_to_end(key)
+        else:
+            self.walks[key] = [[time, walk, latest_departure]]
+        while (len(self.walks) > self.max_size):
+            self.walks.popitem(last=False)
+
+    def save(self, filename=None):
+        '''
+        write the cache to file, along with the walks already saved there by other runs. written
+        to a temporary file first so an interrupted save never leaves a partial cache behind, and
+        holding a lock file so processes saving at the same time don't drop each other's walks
+        '''
+        if (filename is None):
+            filename = self.filename
+        if (filename is None):
+            return
+
+        lock_filename = f'{filename}.lock'
+        acquire_lock(lock_filename)
+        try:
+            #walks saved by other runs are older than this run's, so are evicted first
+            merged_cache = WalkCache(self.network, self.max_size, None, self.max_entries)
+            if (os.path.exists(filename)):
+                merged_cache.load(filename)
+            for key, entries in self.walks.items():
+                for search_time, walk, latest_departure in entries:
+                    merged_cache.put(key, search_time, walk, latest_departure)
+            merged_cache.write(filename)
+        finally:
+            os.remove(lock_filename)
+
+    def write(self, filename):
+        '''
+        write the cache to file, replacing it
+        '''
+        saved_walks = []
+        for key, entries in self.walks.items():
+            saved_entries = []
+            for search_time, walk, latest_departure in entries:
+                if (walk is None):
+                    saved_walk = None
+                else:
+                    saved_walk = [[connection.stop_1.id, connection.stop_2.id] for connection in walk]
+                saved_entries.append([search_time, saved_walk, latest_departure])
+            saved_walks.append([list(key), saved_entries])
+
+        temp_filename = f'{filename}.{os.getpid()}.tmp'
+        out_fd = open(temp_filename, 'w')
+        json.dump({'version': WALK_CACHE_VERSION, 'walks': saved_walks}, out_fd)
+        out_fd.close()
+        os.replace(temp_filename, filename)
+
+    def load(self, filename=None):
+        '''
+        read cached walks from file, skipping any that don't match the current network
+        '''
+        if (filename is None):
+            filename = self.filename
+        in_fd = open(filename, 'r')
+        try:
+            data = json.load(in_fd)
+        except json.JSONDecodeError:
+            print(f'Ignoring unreadable walk cache: {filename}')
+            return
+        finally:
+            in_fd.close()
+        if (data.get('version') != WALK_CACHE_VERSION):
+            return
+
+        for key, saved_entries in data['walks']:
+            for search_time, saved_walk, latest_departure in saved_entries:
+                if (saved_walk is None):
+                    self.put(tuple(key), search_time, None, latest_departure)
+                    continue
+                walk = self.get_connections(saved_walk)
+                if (walk is not None):
+                    self.put(tuple(key), search_time, walk, latest_departure)
+
+    def get_connections(self, stop_id_pairs):
+        '''
+        return the connections joining each pair of stop ids, or None if any don't exist
+        '''
+        walk = []
+        for stop_1_id, stop_2_id in stop_id_pairs:
+            connection = self.network.get_connection(self.network.stops_by_id.get(stop_1_id),
+                self.network.stops_by_id.get(stop_2_id))
+            if (connection is None):
+                return None
+            walk.append(connection)
+        return walk